@@ -0,0 +1,16 @@
+from django.apps import AppConfig
+
+
+class ApiConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "api"
+
+    def ready(self):
+        from django.contrib.sessions.models import Session
+        from django.db.models.signals import post_delete
+        from .models import ConversationSummary
+        from .services.rollups import _on_summary_deleted
+        from .services.sessions import _on_session_deleted
+
+        post_delete.connect(_on_session_deleted, sender=Session, dispatch_uid="api.session_lookup_invalidate")
+        post_delete.connect(_on_summary_deleted, sender=ConversationSummary, dispatch_uid="api.rollup_summary_deleted")
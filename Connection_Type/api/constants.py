@@ -6,3 +6,16 @@ CONNECTION_TYPES = (
 )
 
 CONNECTION_TYPE_KEYS = [c[0] for c in CONNECTION_TYPES]
+
+# Column order for feature vectors (batch scoring, similarity search)
+FEATURE_KEYS = (
+    "emotional_warmth",
+    "romantic_language",
+    "spiritual_reference",
+    "task_focus",
+    "formality",
+    "emotional_intensity",
+)
+
+# Bump when feature extraction or scoring changes so clients' cached results (ETags) are invalidated
+SCORING_VERSION = "1"
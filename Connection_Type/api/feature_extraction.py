@@ -1,5 +1,7 @@
 import re
-from typing import List, Dict
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Tuple
 
 
 WARMTH_WORDS = {
@@ -38,59 +40,153 @@ INTENSITY_WORDS = {
 }
 
 
-def _tokenize(text: str) -> List[str]:
-    return re.findall(r"[a-zA-Z']+", text.lower())
+# Category -> lexicon; position is the bit used in the compiled word masks
+LEXICONS = (
+    ("warmth", WARMTH_WORDS),
+    ("romantic", ROMANTIC_WORDS),
+    ("spiritual", SPIRITUAL_WORDS),
+    ("task", TASK_WORDS),
+    ("formality", FORMALITY_MARKERS),
+    ("intensity", INTENSITY_WORDS),
+)
+
+COUNT_KEYS = (
+    "message_count",
+    "token_count",
+    "warmth_hits",
+    "romantic_token_hits",
+    "romantic_phrase_hits",
+    "spiritual_hits",
+    "task_hits",
+    "formality_hits",
+    "contraction_hits",
+    "intensity_hits",
+    "exclamations",
+    "caps_words",
+)
+
+
+def _build_matcher():
+    """Compile the lexicons once: word -> category bitmask, plus multi-word phrases."""
+    word_masks: Dict[str, int] = {}
+    phrases: List[str] = []
+    for bit, (name, words) in enumerate(LEXICONS):
+        for w in words:
+            if " " in w:
+                if name == "romantic":  # only romantic phrases are weighted today
+                    phrases.append(w)
+                continue
+            word_masks[w] = word_masks.get(w, 0) | (1 << bit)
+    return word_masks, tuple(sorted(set(phrases)))
+
+
+_WORD_MASKS, _PHRASES = _build_matcher()
+# One scan splits the text into word units (letters, digits, "_", "'") and "!".
+# Unit edges are always non-word characters, so tokens and ALL-CAPS words can be
+# classified per distinct unit without looking at the surrounding text.
+_UNIT_RE = re.compile(r"[\w']+|!")
+_TOKEN_RE = re.compile(r"[a-zA-Z']+")
+_CAPS_RE = re.compile(r"\b[A-Z]{3,}\b")
+
+
+@lru_cache(maxsize=65536)
+def _classify_unit(unit: str) -> Tuple[int, ...]:
+    """Per-unit counts: (tokens, *category hits, contractions, caps words)."""
+    counts = [0] * (len(LEXICONS) + 3)
+    for tok in _TOKEN_RE.findall(unit.lower()):
+        counts[0] += 1
+        mask = _WORD_MASKS.get(tok, 0)
+        bit = 0
+        while mask:
+            if mask & 1:
+                counts[1 + bit] += 1
+            mask >>= 1
+            bit += 1
+        if "'" in tok or tok.endswith("nt"):
+            counts[-2] += 1
+    if not unit.islower():
+        counts[-1] = len(_CAPS_RE.findall(unit))
+    return tuple(counts)
+
+
+def extract_feature_counts(messages: List[Dict[str, str]]) -> Dict[str, int]:
+    """Raw, additive counts behind the heuristic features.
+
+    The text is scanned once into word units; each distinct unit is classified
+    into every lexicon category (plus contraction and ALL-CAPS counters) through
+    a compiled lookup, and "!" units give the exclamation count.
+    """
+    texts = [m.get("text", "") for m in messages]
+    joined = "\n".join(texts)
+
+    totals = [0] * (len(LEXICONS) + 3)
+    exclamations = 0
+    for unit, n in Counter(_UNIT_RE.findall(joined)).items():
+        if unit == "!":
+            exclamations = n
+            continue
+        for i, c in enumerate(_classify_unit(unit)):
+            if c:
+                totals[i] += c * n
+
+    # Multi-word lexicon entries ("miss you") keep plain substring semantics
+    phrase_hits = 0
+    if _PHRASES:
+        lowered = joined.lower()
+        phrase_hits = sum(lowered.count(p) for p in _PHRASES)
+
+    hits = dict(zip((name for name, _ in LEXICONS), totals[1:1 + len(LEXICONS)]))
+    return {
+        "message_count": len(messages),
+        "token_count": totals[0],
+        "warmth_hits": hits["warmth"],
+        "romantic_token_hits": hits["romantic"],
+        "romantic_phrase_hits": phrase_hits,
+        "spiritual_hits": hits["spiritual"],
+        "task_hits": hits["task"],
+        "formality_hits": hits["formality"],
+        "contraction_hits": totals[-2],
+        "intensity_hits": hits["intensity"],
+        "exclamations": exclamations,
+        "caps_words": totals[-1],
+    }
 
 
-def _count_phrases(text: str, phrases: List[str]) -> int:
-    t = text.lower()
-    return sum(t.count(p) for p in phrases)
+def merge_feature_counts(a: Dict[str, int], b: Dict[str, int]) -> Dict[str, int]:
+    """Sum two count dicts; counts are additive across message batches."""
+    return {k: int(a.get(k, 0)) + int(b.get(k, 0)) for k in COUNT_KEYS}
 
 
 def _safe_div(num: float, den: float) -> float:
     return num / den if den > 0 else 0.0
 
 
-def extract_features(messages: List[Dict[str, str]]) -> Dict[str, float]:
-    # Concatenate all texts for pair-level analysis
-    texts = [m.get("text", "") for m in messages]
-    joined = "\n".join(texts)
-    tokens = _tokenize(joined)
-    token_set = set(tokens)
-    token_count = len(tokens)
+def features_from_counts(counts: Dict[str, int]) -> Dict[str, float]:
+    """Normalize raw counts (see ``extract_feature_counts``) into 0..1 features."""
+    token_count = counts.get("token_count", 0)
 
     # Feature: emotional_warmth (normalized term frequency)
-    warmth_hits = sum(1 for t in tokens if t in WARMTH_WORDS)
-    emotional_warmth = min(1.0, _safe_div(warmth_hits, max(1, token_count // 20)))
+    emotional_warmth = min(1.0, _safe_div(counts.get("warmth_hits", 0), max(1, token_count // 20)))
 
     # Feature: romantic_language (include multiword phrases)
-    romantic_token_hits = sum(1 for t in tokens if t in ROMANTIC_WORDS)
-    romantic_phrase_hits = _count_phrases(joined, ["miss you", "i miss you"])
-    romantic_raw = romantic_token_hits + romantic_phrase_hits * 2
+    romantic_raw = counts.get("romantic_token_hits", 0) + counts.get("romantic_phrase_hits", 0) * 2
     romantic_language = min(1.0, _safe_div(romantic_raw, max(1, token_count // 25)))
 
     # Feature: spiritual_reference
-    spiritual_hits = sum(1 for t in tokens if t in SPIRITUAL_WORDS)
-    spiritual_reference = min(1.0, _safe_div(spiritual_hits, max(1, token_count // 25)))
+    spiritual_reference = min(1.0, _safe_div(counts.get("spiritual_hits", 0), max(1, token_count // 25)))
 
     # Feature: task_focus (reduced sensitivity to avoid Professional bias)
-    task_hits = sum(1 for t in tokens if t in TASK_WORDS)
-    task_focus = min(1.0, _safe_div(task_hits, max(1, token_count // 40)))
+    task_focus = min(1.0, _safe_div(counts.get("task_hits", 0), max(1, token_count // 40)))
 
     # Feature: formality (markers, salutations, closings; penalize contractions)
-    formality_hits = sum(1 for t in tokens if t in FORMALITY_MARKERS)
+    formality_base = _safe_div(counts.get("formality_hits", 0), max(1, token_count // 30))
     # crude contraction count lowers formality
-    contraction_hits = sum(1 for t in tokens if "'" in t or t.endswith("nt"))
-    formality_base = _safe_div(formality_hits, max(1, token_count // 30))
-    formality_penalty = min(0.5, _safe_div(contraction_hits, max(1, token_count)))
+    formality_penalty = min(0.5, _safe_div(counts.get("contraction_hits", 0), max(1, token_count)))
     formality = max(0.0, min(1.0, formality_base - formality_penalty))
 
     # Feature: emotional_intensity (exclamations, ALL CAPS words, intensity terms)
-    exclamations = joined.count("!")
-    caps_words = sum(1 for w in re.findall(r"\b[A-Z]{2,}\b", joined) if len(w) > 2)
-    intensity_hits = sum(1 for t in tokens if t in INTENSITY_WORDS)
-    intensity_raw = exclamations + caps_words * 0.5 + intensity_hits
-    emotional_intensity = min(1.0, _safe_div(intensity_raw, max(1, len(messages))))
+    intensity_raw = counts.get("exclamations", 0) + counts.get("caps_words", 0) * 0.5 + counts.get("intensity_hits", 0)
+    emotional_intensity = min(1.0, _safe_div(intensity_raw, max(1, counts.get("message_count", 0))))
 
     return {
         "emotional_warmth": round(emotional_warmth, 4),
@@ -100,3 +196,7 @@ def extract_features(messages: List[Dict[str, str]]) -> Dict[str, float]:
         "formality": round(formality, 4),
         "emotional_intensity": round(emotional_intensity, 4),
     }
+
+
+def extract_features(messages: List[Dict[str, str]]) -> Dict[str, float]:
+    return features_from_counts(extract_feature_counts(messages))
@@ -1,4 +1,6 @@
-from typing import Dict
+from typing import Dict, List, Tuple
+import numpy as np
+from .constants import CONNECTION_TYPE_KEYS, FEATURE_KEYS
 
 
 def _val(features: Dict[str, float], key: str) -> float:
@@ -93,3 +95,86 @@ def connection_type_scores_raw(features: dict) -> dict:
     }
 
     return scores
+
+
+def _feature_matrix(features) -> np.ndarray:
+    """Coerce an N×6 array (FEATURE_KEYS column order) or a sequence of dicts."""
+    if isinstance(features, np.ndarray):
+        arr = features.astype(float, copy=False)
+    else:
+        arr = np.array(
+            [[float(f.get(k, 0.0) or 0.0) for k in FEATURE_KEYS] for f in features],
+            dtype=float,
+        )
+    arr = arr.reshape(-1, len(FEATURE_KEYS))
+    return np.clip(arr, 0.0, 1.0)
+
+
+def connection_type_scores_batch(features) -> Tuple[np.ndarray, List[str]]:
+    """Vectorized ``connection_type_scores_raw`` for many feature rows at once.
+
+    ``features`` is an N×6 array in FEATURE_KEYS column order or a sequence of
+    feature dicts. Returns (N×4 scores in CONNECTION_TYPE_KEYS column order,
+    argmax labels). Results are identical to calling the scalar function per row.
+    """
+    x = _feature_matrix(features)
+    ew, rl, sr, tf, fm, ei = (x[:, i] for i in range(len(FEATURE_KEYS)))
+
+    low_formality = 1.0 - fm
+    low_task = 1.0 - tf
+    mid_intensity = 1.0 - np.abs(ei - 0.5) * 2
+
+    romantic = (
+        0.45 * rl +
+        0.25 * ew +
+        0.10 * ei +
+        0.10 * low_formality +
+        0.10 * low_task
+    )
+
+    social = (
+        0.40 * ew +
+        0.15 * ((0.3 <= rl) & (rl <= 0.6)) +
+        0.20 * mid_intensity +
+        0.15 * low_task +
+        0.10 * low_formality
+    )
+
+    spiritual = (
+        0.60 * sr +
+        0.15 * ew +
+        0.15 * (1.0 - ei) +
+        0.10 * fm
+    )
+
+    professional = (
+        0.50 * tf +
+        0.25 * fm +
+        0.10 * (1.0 - rl) +
+        0.15 * (1.0 - ei)
+    )
+
+    # Interaction boosts/penalties as masks (same rules as the scalar version)
+    synergy = (rl > 0.6) & (ew > 0.6)
+    romantic = np.where(synergy, romantic + 0.20, romantic)
+    professional = np.where(synergy, professional - 0.10, professional)
+    social = np.where(synergy, social - 0.05, social)
+
+    romantic = np.where((ei > 0.8) & (rl > 0.5), romantic + 0.10, romantic)
+
+    social = np.where((ew > 0.6) & (0.3 <= ei) & (ei <= 0.7) & (tf < 0.4), social + 0.15, social)
+
+    calm = 1.0 - ei
+    spiritual = np.where((sr > 0.6) & (0.2 <= calm) & (calm <= 0.8), spiritual + 0.15, spiritual)
+
+    professional = np.where((tf > 0.7) & (fm > 0.6) & (rl < 0.3), professional + 0.20, professional)
+
+    by_type = {
+        "Social": social,
+        "Romantic": romantic,
+        "Spiritual": spiritual,
+        "Professional": professional,
+    }
+    scores = np.clip(np.column_stack([by_type[k] for k in CONNECTION_TYPE_KEYS]), 0.0, 1.0)
+    labels = [CONNECTION_TYPE_KEYS[i] for i in scores.argmax(axis=1)] if len(scores) else []
+    return scores, labels
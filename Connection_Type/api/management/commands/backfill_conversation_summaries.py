@@ -1,9 +1,20 @@
+import django
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
 from django.core.management.base import BaseCommand
 from django.db import transaction
-from collections import defaultdict
-from api.models import ConversationMessage, ConversationSummary
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+from collections import defaultdict, deque
+from api.models import BackfillCheckpoint, ConversationMessage, ConversationSummary
 from api.feature_extraction import extract_features
-from api.logic import connection_type_scores
+from api.constants import CONNECTION_TYPE_KEYS
+from api.logic import connection_type_scores_batch
+from api.services.rollups import apply_summary_changes
+
+CHECKPOINT_NAME = 'backfill_conversation_summaries'
+
 
 class Command(BaseCommand):
     help = "Backfill or update ConversationSummary from conversation_messages."
@@ -12,12 +23,136 @@ class Command(BaseCommand):
         parser.add_argument('--limit-messages-per-pair', type=int, default=50, help='Max recent messages per pair to analyze')
         parser.add_argument('--max-pairs', type=int, default=None, help='Limit number of pairs processed')
         parser.add_argument('--dry-run', action='store_true', help='Run without writing changes')
+        parser.add_argument('--stream', action='store_true', help='Stream messages ordered by pair with constant memory instead of loading the whole table')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per round-trip in --stream mode')
+        parser.add_argument('--workers', type=int, default=1, help='Processes used for feature extraction and scoring')
+        parser.add_argument('--batch-size', type=int, default=500, help='Pairs per scoring batch and per bulk upsert')
+        parser.add_argument('--resume', action='store_true', help='Continue after the pair recorded by the last interrupted run')
+        parser.add_argument('--force', action='store_true', help='Rescore pairs even if last_message_at and message_count are unchanged')
 
     def handle(self, *args, **options):
         limit_per_pair = options['limit_messages_per_pair']
         max_pairs = options['max_pairs']
         dry_run = options['dry_run']
+        workers = max(1, options['workers'])
+        batch_size = max(1, options['batch_size'])
+        force = options['force']
+
+        self.counters = {'processed': 0, 'created': 0, 'updated': 0, 'skipped': 0}
+
+        after = None
+        checkpoint = BackfillCheckpoint.objects.filter(name=CHECKPOINT_NAME).first()
+        if options['resume'] and checkpoint:
+            after = (checkpoint.last_user_a_id, checkpoint.last_user_b_id)
+            self.stdout.write(f"Resuming after pair {after[0]}-{after[1]}")
+        elif checkpoint and not dry_run:
+            checkpoint.delete()
+
+        if options['stream']:
+            pairs = self._stream_pairs(limit_per_pair, options['chunk_size'], after)
+        else:
+            pairs = self._load_pairs(after)
+
+        total = self._count_pairs(after)
+        if max_pairs is not None:
+            total = min(total, max_pairs)
+        self.started = time.monotonic()
+
+        exhausted = []
+
+        def batches():
+            batch = []
+            stopped = False
+            for n, ((user_a, user_b), msgs, total_messages) in enumerate(pairs):
+                if max_pairs is not None and n >= max_pairs:
+                    stopped = True
+                    break
+                msgs = list(msgs)
+                if limit_per_pair:
+                    msgs = msgs[-limit_per_pair:]
+                batch.append((user_a, user_b, msgs, total_messages))
+                if len(batch) >= batch_size:
+                    yield self._drop_unchanged(batch, force)
+                    batch = []
+            if batch:
+                yield self._drop_unchanged(batch, force)
+            if not stopped:
+                exhausted.append(True)
+
+        for last_key, skipped, results in self._score_batches(batches(), workers):
+            self._write_batch(results, dry_run)
+            self.counters['skipped'] += skipped
+            if not dry_run:
+                self._save_checkpoint(last_key)
+            self._report_progress(total)
+
+        if exhausted and not dry_run:
+            # Finished the whole table; the next run starts from the beginning
+            BackfillCheckpoint.objects.filter(name=CHECKPOINT_NAME).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            "Processed={processed}, created={created}, updated={updated}, skipped={skipped}".format(**self.counters)
+        ))
+
+    def _count_pairs(self, after=None):
+        """Number of distinct canonical pairs left to visit (for the ETA)."""
+        return self._pairs_queryset(after).values('pair_a', 'pair_b').distinct().count()
+
+    def _pairs_queryset(self, after=None):
+        a = Coalesce('sender_id', Value(0))
+        b = Coalesce('receiver_id', Value(0))
+        qs = ConversationMessage.objects.annotate(pair_a=Least(a, b), pair_b=Greatest(a, b))
+        if after is not None:
+            qs = qs.filter(Q(pair_a__gt=after[0]) | Q(pair_a=after[0], pair_b__gt=after[1]))
+        return qs
+
+    def _drop_unchanged(self, batch, force):
+        """Split off pairs whose summary already matches, with one query per batch.
 
+        Returns (last_pair_in_batch, skipped_count, jobs_to_score).
+        """
+        last_key = batch[-1][:2]
+        if force:
+            return last_key, 0, batch
+        keys = [f"{user_a}-{user_b}" for user_a, user_b, _, _ in batch]
+        existing = {
+            pair_key: (last_message_at, message_count)
+            for pair_key, last_message_at, message_count in ConversationSummary.objects.filter(
+                pair_key__in=keys
+            ).values_list('pair_key', 'last_message_at', 'message_count')
+        }
+        jobs = []
+        for key, job in zip(keys, batch):
+            _, _, msgs, total_messages = job
+            last = msgs[-1]['sent_at'] if msgs else None
+            # A truncated score stores its window length; a full recompute the real count
+            if existing.get(key) not in ((last, len(msgs)), (last, total_messages)):
+                jobs.append(job)
+        return last_key, len(batch) - len(jobs), jobs
+
+    def _save_checkpoint(self, last_key):
+        BackfillCheckpoint.objects.update_or_create(
+            name=CHECKPOINT_NAME,
+            defaults={
+                'last_user_a_id': last_key[0],
+                'last_user_b_id': last_key[1],
+                'processed': self.counters['processed'] + self.counters['skipped'],
+            },
+        )
+
+    def _report_progress(self, total):
+        done = self.counters['processed'] + self.counters['skipped']
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        rate = done / elapsed
+        remaining = max(0, total - done)
+        eta = remaining / rate if rate > 0 else 0.0
+        self.stdout.write(
+            f"Progress {done}/{total} pairs ({self.counters['skipped']} unchanged) "
+            f"{rate:.1f} pairs/s eta={eta:.0f}s"
+        )
+
+    def _load_pairs(self, after=None):
+        """Group every message in memory (original mode; RAM grows with the table)."""
         rows = list(ConversationMessage.objects.all().values('sender_id', 'receiver_id', 'message', 'sent_at'))
         conversations = defaultdict(list)
         for r in rows:
@@ -31,61 +166,153 @@ class Command(BaseCommand):
                 'text': r['message'],
                 'sent_at': r['sent_at'],
             })
+        # Canonical pair order so checkpoints mean the same thing as in --stream mode
+        for key in sorted(conversations):
+            if after is not None and key <= after:
+                continue
+            msgs = conversations[key]
+            msgs.sort(key=lambda m: m['sent_at'])
+            yield key, msgs, len(msgs)
 
-        pairs = list(conversations.items())
-        if max_pairs is not None:
-            pairs = pairs[:max_pairs]
-
-        processed = 0
-        created = 0
-        updated = 0
+    def _stream_pairs(self, limit_per_pair, chunk_size, after=None):
+        """Yield (pair, window, total message count) one pair at a time from a single ordered, chunked cursor.
 
-        for (user_a, user_b), msgs in pairs:
-            msgs.sort(key=lambda m: m['sent_at'])
-            if limit_per_pair:
-                msgs = msgs[-limit_per_pair:]
+        Rows arrive ordered by canonical pair then sent_at, so only the current
+        pair's most recent ``limit_per_pair`` messages are ever held in memory.
+        """
+        qs = (
+            self._pairs_queryset(after)
+            .order_by('pair_a', 'pair_b', 'sent_at')
+            .values_list('pair_a', 'pair_b', 'sender_id', 'message', 'sent_at')
+        )
+        current = None
+        count = 0
+        window = deque(maxlen=limit_per_pair or None)
+        for user_a, user_b, sender_id, message, sent_at in qs.iterator(chunk_size=chunk_size):
+            key = (user_a, user_b)
+            if key != current:
+                if current is not None:
+                    yield current, window, count
+                    window = deque(maxlen=limit_per_pair or None)
+                current = key
+                count = 0
+            count += 1
+            window.append({
+                'sender': f"User {sender_id}",
+                'text': message,
+                'sent_at': sent_at,
+            })
+        if current is not None:
+            yield current, window, count
 
-            msg_payload = [{"sender": m["sender"], "text": m["text"]} for m in msgs]
-            last_message_at = msgs[-1]['sent_at'] if msgs else None
-            message_count = len(msgs)
+    def _score_batches(self, batches, workers):
+        """Score job batches inline, or on a process pool with bounded in-flight work.
 
-            features = extract_features(msg_payload)
-            probs = connection_type_scores(features)
-            connection_type = max(probs, key=probs.get)
-            confidence = round(probs[connection_type] * 100.0, 2)
+        Batches come in as (last_key, skipped, jobs) and leave, in order, as
+        (last_key, skipped, results) so checkpoints only ever move forward.
+        """
+        if workers <= 1:
+            for last_key, skipped, jobs in batches:
+                yield last_key, skipped, _score_batch(jobs)
+            return
 
-            pair_key = f"{user_a}-{user_b}"
+        # Children only compute; "spawn" keeps them from inheriting open DB connections
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=django.setup) as pool:
+            pending = deque()
+            for last_key, skipped, jobs in batches:
+                pending.append((last_key, skipped, pool.submit(_score_batch, jobs)))
+                if len(pending) >= workers * 2:
+                    last_key, skipped, future = pending.popleft()
+                    yield last_key, skipped, future.result()
+            while pending:
+                last_key, skipped, future = pending.popleft()
+                yield last_key, skipped, future.result()
 
-            if dry_run:
+    def _write_batch(self, results, dry_run):
+        if not results:
+            return
+        if dry_run:
+            for r in results:
                 self.stdout.write(self.style.NOTICE(
-                    f"DRY RUN pair {pair_key}: {connection_type} ({confidence}%) count={message_count}"
+                    f"DRY RUN pair {r['pair_key']}: {r['connection_type']} ({r['confidence']}%) count={r['message_count']}"
                 ))
-            else:
-                with transaction.atomic():
-                    obj, is_created = ConversationSummary.objects.update_or_create(
-                        pair_key=pair_key,
-                        defaults={
-                            'user_a_id': user_a,
-                            'user_b_id': user_b,
-                            'last_message_at': last_message_at,
-                            'message_count': message_count,
-                            'connection_type': connection_type,
-                            'confidence': confidence,
-                            'emotional_warmth': features.get('emotional_warmth', 0.0),
-                            'romantic_language': features.get('romantic_language', 0.0),
-                            'spiritual_reference': features.get('spiritual_reference', 0.0),
-                            'task_focus': features.get('task_focus', 0.0),
-                            'formality': features.get('formality', 0.0),
-                            'emotional_intensity': features.get('emotional_intensity', 0.0),
-                        }
-                    )
-                    if is_created:
-                        created += 1
-                    else:
-                        updated += 1
-
-            processed += 1
+            self.counters['processed'] += len(results)
+            return
 
-        self.stdout.write(self.style.SUCCESS(
-            f"Processed={processed}, created={created}, updated={updated}"
-        ))
+        keys = [r['pair_key'] for r in results]
+        objs = [ConversationSummary(**r) for r in results]
+        with transaction.atomic():
+            existing = {
+                pair_key: (connection_type, confidence)
+                for pair_key, connection_type, confidence in ConversationSummary.objects.select_for_update()
+                .filter(pair_key__in=keys).values_list('pair_key', 'connection_type', 'confidence')
+            }
+            ConversationSummary.objects.bulk_create(
+                objs,
+                update_conflicts=True,
+                unique_fields=['pair_key'],
+                update_fields=UPSERT_FIELDS,
+            )
+            apply_summary_changes(
+                (r['user_a_id'], r['user_b_id'], existing.get(r['pair_key']), (r['connection_type'], r['confidence']))
+                for r in results
+            )
+        self.counters['created'] += len(results) - len(existing)
+        self.counters['updated'] += len(existing)
+        self.counters['processed'] += len(results)
+
+
+UPSERT_FIELDS = [
+    'user_a_id',
+    'user_b_id',
+    'last_message_at',
+    'message_count',
+    'connection_type',
+    'confidence',
+    'emotional_warmth',
+    'romantic_language',
+    'spiritual_reference',
+    'task_focus',
+    'formality',
+    'emotional_intensity',
+    'feature_counts',
+    'provisional',
+    'updated_at',
+]
+
+
+def _score_batch(batch):
+    """Score (user_a, user_b, messages, total_messages) jobs; pure CPU so it can run in a worker process."""
+    all_features = [
+        extract_features([{"sender": m["sender"], "text": m["text"]} for m in msgs])
+        for _, _, msgs, _ in batch
+    ]
+    scores, labels = connection_type_scores_batch(all_features)
+
+    results = []
+    for (user_a, user_b, msgs, _), features, row, connection_type in zip(batch, all_features, scores, labels):
+        confidence = round(float(row[CONNECTION_TYPE_KEYS.index(connection_type)]) * 100.0, 2)
+
+        results.append({
+            'pair_key': f"{user_a}-{user_b}",
+            'user_a_id': user_a,
+            'user_b_id': user_b,
+            'last_message_at': msgs[-1]['sent_at'] if msgs else None,
+            # The scored window length: when it is shorter than the real count the
+            # freshness check fails and the next request recomputes the full history
+            'message_count': len(msgs),
+            'connection_type': connection_type,
+            'confidence': confidence,
+            'emotional_warmth': features.get('emotional_warmth', 0.0),
+            'romantic_language': features.get('romantic_language', 0.0),
+            'spiritual_reference': features.get('spiritual_reference', 0.0),
+            'task_focus': features.get('task_focus', 0.0),
+            'formality': features.get('formality', 0.0),
+            'emotional_intensity': features.get('emotional_intensity', 0.0),
+            # Counts are not kept here, so the next recompute starts from scratch
+            'feature_counts': None,
+            # A definitive heuristic score replaces any provisional one
+            'provisional': False,
+        })
+    return results
@@ -0,0 +1,39 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from benchmarks.query_budgets import DEFAULT_CONTEXT, check_query_budgets
+
+
+class Command(BaseCommand):
+    help = "Fail when an endpoint issues more SQL queries than its budget (synthetic data, throwaway test database)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=DEFAULT_CONTEXT['seed'], help='Seed for the synthetic data generator')
+        parser.add_argument('--pairs', type=int, default=DEFAULT_CONTEXT['pairs'], help='Pairs in the dataset (and in the batch request)')
+        parser.add_argument('--messages', type=int, default=DEFAULT_CONTEXT['messages'], help='Messages per pair')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            report = check_query_budgets({
+                **DEFAULT_CONTEXT,
+                'seed': options['seed'],
+                'pairs': min(max(1, options['pairs']), 200),
+                'users': max(DEFAULT_CONTEXT['users'], options['pairs']),
+                'messages': max(1, options['messages']),
+            })
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+        else:
+            for name, entry in report.items():
+                line = f"{name}: {entry['queries']} queries, {entry['llm_calls']} LLM calls (budget {entry['budget']})"
+                self.stdout.write(self.style.SUCCESS(line) if entry['ok'] else self.style.ERROR(line))
+
+        failed = [name for name, entry in report.items() if not entry['ok']]
+        if failed:
+            if not options['json']:
+                for name in failed:
+                    self.stderr.write(report[name]['error'])
+            raise CommandError(f"Query budget exceeded: {', '.join(failed)}")
@@ -0,0 +1,47 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from api.services.inference import refine_pair_with_llm
+from api.services.jobs import claim_jobs, complete_job, fail_job
+
+
+class Command(BaseCommand):
+    help = "Run queued LLM refinements for pairs that were answered with a provisional heuristic result."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the due jobs once and exit instead of polling')
+        parser.add_argument('--batch-size', type=int, default=10, help='Jobs claimed per poll')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--max-attempts', type=int, default=5, help='Attempts before a job is marked failed')
+        parser.add_argument('--lease', type=float, default=300.0, help='Seconds a claimed job stays reserved for this worker')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        counters = {'refined': 0, 'superseded': 0, 'retried': 0, 'failed': 0}
+
+        try:
+            while True:
+                close_old_connections()
+                jobs = claim_jobs(batch_size, options['lease'])
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                for job, token in jobs:
+                    try:
+                        applied = refine_pair_with_llm(job.user_a_id, job.user_b_id)
+                    except Exception as exc:
+                        gave_up = fail_job(job, token, repr(exc), options['max_attempts'])
+                        counters['failed' if gave_up else 'retried'] += 1
+                        self.stderr.write(f"Job {job.pair_key} attempt {job.attempts} failed: {exc!r}")
+                        continue
+                    complete_job(job, token)
+                    counters['refined' if applied else 'superseded'] += 1
+        except KeyboardInterrupt:
+            self.stdout.write("Interrupted; claimed jobs are picked up again when their lease ends")
+
+        self.stdout.write(self.style.SUCCESS(
+            "Refined={refined}, superseded={superseded}, retried={retried}, failed={failed}".format(**counters)
+        ))
@@ -0,0 +1,12 @@
+import time
+from django.core.management.base import BaseCommand
+from api.services.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute every per-user connection rollup from ConversationSummary (initial fill or repair)."
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        users = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rollups for {users} user(s) in {time.perf_counter() - started:.1f}s"))
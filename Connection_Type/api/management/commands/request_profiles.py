@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.services.profiling import list_profiles, profile_dir, prune, resolve, top_entries
+
+SORT_KEYS = ('cumulative', 'tottime', 'ncalls', 'filename')
+
+
+class Command(BaseCommand):
+    help = "List stored request profiles, or print the top entries of one (name or 'latest')."
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', nargs='?', help="Profile to print; omit to list all")
+        parser.add_argument('--sort', choices=SORT_KEYS, default='cumulative', help='pstats sort key')
+        parser.add_argument('--limit', type=int, default=25, help='Functions to print')
+        parser.add_argument('--prune', type=int, metavar='KEEP', help='Delete all but the newest KEEP profiles')
+
+    def handle(self, *args, **options):
+        if options['prune'] is not None:
+            removed = prune(options['prune'])
+            self.stdout.write(self.style.SUCCESS(f"Removed {removed} profile(s)"))
+            return
+
+        if options['name']:
+            path = resolve(options['name'])
+            if path is None:
+                raise CommandError(f"No profile {options['name']!r} in {profile_dir()}")
+            self.stdout.write(path.name)
+            self.stdout.write(top_entries(path, options['sort'], max(1, options['limit'])))
+            return
+
+        entries = list_profiles()
+        if not entries:
+            self.stdout.write(f"No profiles in {profile_dir()}")
+            return
+        for entry in entries:
+            self.stdout.write(f"{entry['name']}  {entry['size'] // 1024} KiB  {entry['modified']:%Y-%m-%d %H:%M:%S}")
@@ -0,0 +1,45 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from benchmarks.suite import BENCHMARKS, run_suite
+
+
+class Command(BaseCommand):
+    help = "Run the offline benchmark suite on synthetic data (throwaway test database, stub LLM) and print JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1234, help='Seed for the synthetic data generator')
+        parser.add_argument('--pairs', type=int, default=50, help='Conversation pairs to generate')
+        parser.add_argument('--users', type=int, default=100, help='Distinct user ids the pairs are drawn from')
+        parser.add_argument('--messages', type=int, default=40, help='Messages per pair')
+        parser.add_argument('--posts', type=int, default=200, help='Posts/comments rows to generate')
+        parser.add_argument('--sessions', type=int, default=200, help='Sessions to register for lookup benchmarks')
+        parser.add_argument('--mix', default=None, help='Vocabulary weights, e.g. "romantic=3,task=1,neutral=8"')
+        parser.add_argument('--llm-latency-ms', type=float, default=50.0, help='Latency of the stub LLM per call')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per benchmark')
+        parser.add_argument('--only', nargs='*', default=None, choices=list(BENCHMARKS), help='Run only these benchmarks')
+        parser.add_argument('--output', default=None, help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        ctx_kwargs = {
+            'seed': options['seed'],
+            'pairs': options['pairs'],
+            'users': options['users'],
+            'messages': options['messages'],
+            'posts': options['posts'],
+            'sessions': max(1, options['sessions']),
+            'mix': options['mix'],
+            'llm_latency': max(0.0, options['llm_latency_ms']) / 1000.0,
+            'repeat': max(1, options['repeat']),
+        }
+        try:
+            report = run_suite(ctx_kwargs, options['only'], log=lambda msg: self.stderr.write(msg))
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        payload = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(payload + "\n")
+            self.stderr.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        else:
+            self.stdout.write(payload)
@@ -0,0 +1,128 @@
+import cProfile
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack
+from typing import List, Tuple
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.crypto import constant_time_compare
+
+
+class _QueryRecorder:
+    """``execute_wrapper`` hook: counts statements, sums their time, keeps the slowest few."""
+
+    def __init__(self, top_n: int):
+        self.top_n = top_n
+        self.count = 0
+        self.total = 0.0
+        self.slowest: List[Tuple[float, str]] = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.total += elapsed
+            if self.top_n > 0 and (len(self.slowest) < self.top_n or elapsed > self.slowest[-1][0]):
+                self.slowest.append((elapsed, sql))
+                self.slowest.sort(key=lambda item: item[0], reverse=True)
+                del self.slowest[self.top_n:]
+
+
+class QueryProfileMiddleware:
+    """Per-request DB profile: query count, total DB time and the slowest statements.
+
+    Enabled with QUERY_PROFILE_ENABLED. Requests over QUERY_PROFILE_MAX_QUERIES
+    or QUERY_PROFILE_MAX_DB_MS get one structured warning on the "api" logger
+    and X-DB-* response headers. Work done while a streaming response is being
+    consumed happens after this middleware returns and is not counted.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "QUERY_PROFILE_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.max_queries = int(getattr(settings, "QUERY_PROFILE_MAX_QUERIES", 50))
+        self.max_db_ms = float(getattr(settings, "QUERY_PROFILE_MAX_DB_MS", 500))
+        self.top_n = int(getattr(settings, "QUERY_PROFILE_TOP_N", 3))
+        self.log = logging.getLogger("api")
+
+    def __call__(self, request):
+        recorder = _QueryRecorder(self.top_n)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+
+        db_ms = recorder.total * 1000.0
+        if recorder.count > self.max_queries or db_ms > self.max_db_ms:
+            slowest = [{"ms": round(elapsed * 1000.0, 2), "sql": sql[:300]} for elapsed, sql in recorder.slowest]
+            self.log.warning(
+                "db-profile over budget method=%s path=%s status=%s queries=%s db_ms=%.1f slowest=%s",
+                request.method, request.path, getattr(response, "status_code", None),
+                recorder.count, db_ms, slowest,
+            )
+            response["X-DB-Queries"] = str(recorder.count)
+            response["X-DB-Time-Ms"] = f"{db_ms:.1f}"
+            if slowest:
+                response["X-DB-Slowest-Ms"] = str(slowest[0]["ms"])
+        return response
+
+
+class RequestProfileMiddleware:
+    """cProfile a sample of requests (PROFILE_SAMPLE_RATE) or requests sending
+    ``X-Profile: <PROFILE_HEADER_TOKEN>``, storing pstats dumps under PROFILE_DIR.
+
+    Disabled when neither trigger is configured; otherwise an untriggered request
+    costs one random draw and a header lookup. One request per process is
+    profiled at a time, others run normally. Triggered responses carry
+    X-Profile-Id with the artifact name (see ``manage.py request_profiles``).
+    """
+
+    def __init__(self, get_response):
+        self.sample_rate = float(getattr(settings, "PROFILE_SAMPLE_RATE", 0.0))
+        self.header_token = getattr(settings, "PROFILE_HEADER_TOKEN", "")
+        if self.sample_rate <= 0 and not self.header_token:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.log = logging.getLogger("api")
+        self._busy = threading.Lock()
+
+    def _triggered(self, request) -> bool:
+        if self.header_token:
+            sent = request.META.get("HTTP_X_PROFILE")
+            if sent and constant_time_compare(sent, self.header_token):
+                return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if not self._triggered(request) or not self._busy.acquire(blocking=False):
+            return self.get_response(request)
+
+        from api.services.profiling import save_profile
+
+        try:
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            try:
+                name = save_profile(profiler, request.method, request.path, elapsed_ms)
+            except OSError as exc:
+                self.log.warning("request-profile save failed path=%s error=%r", request.path, exc)
+                return response
+        finally:
+            self._busy.release()
+
+        self.log.info("request-profile saved path=%s ms=%.1f profile=%s", request.path, elapsed_ms, name)
+        response["X-Profile-Id"] = name
+        return response
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_session_mappings(apps, schema_editor):
+    """One-time scan so sessions issued before the mapping existed keep working."""
+    from django.contrib.sessions.backends.db import SessionStore
+
+    Session = apps.get_model('sessions', 'Session')
+    SessionMapping = apps.get_model('api', 'SessionMapping')
+    store = SessionStore()
+    mappings = []
+    for s in Session.objects.all().iterator():
+        data = store.decode(s.session_data)
+        sid = data.get('custom_session_id')
+        email = data.get('user_email')
+        if sid and email:
+            mappings.append(SessionMapping(custom_session_id=sid, session_id=s.session_key, user_email=email))
+    SessionMapping.objects.bulk_create(mappings, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_postscomment'),
+        ('sessions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionMapping',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('custom_session_id', models.CharField(max_length=255, unique=True)),
+                ('user_email', models.EmailField(max_length=254)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sessions.session')),
+            ],
+        ),
+        migrations.RunPython(backfill_session_mappings, migrations.RunPython.noop),
+    ]
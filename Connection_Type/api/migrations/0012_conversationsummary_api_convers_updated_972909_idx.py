@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_llmrefinementjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='conversationsummary',
+            index=models.Index(fields=['updated_at'], name='api_convers_updated_972909_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_conversationsummary_api_convers_updated_972909_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserConnectionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.IntegerField(unique=True)),
+                ('pair_count', models.IntegerField(default=0)),
+                ('social_count', models.IntegerField(default=0)),
+                ('romantic_count', models.IntegerField(default=0)),
+                ('spiritual_count', models.IntegerField(default=0)),
+                ('professional_count', models.IntegerField(default=0)),
+                ('social_confidence_sum', models.FloatField(default=0.0)),
+                ('romantic_confidence_sum', models.FloatField(default=0.0)),
+                ('spiritual_confidence_sum', models.FloatField(default=0.0)),
+                ('professional_confidence_sum', models.FloatField(default=0.0)),
+                ('dominant_type', models.CharField(blank=True, choices=[('Social', 'Social'), ('Romantic', 'Romantic'), ('Spiritual', 'Spiritual'), ('Professional', 'Professional')], max_length=50, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_userconnectionrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='conversationsummary',
+            index=models.Index(fields=['user_a_id', '-last_message_at', '-id'], name='summary_user_a_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversationsummary',
+            index=models.Index(fields=['user_b_id', '-last_message_at', '-id'], name='summary_user_b_recent_idx'),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.contrib.sessions.models import Session
 from django.db import models
 from .constants import CONNECTION_TYPES
 
@@ -34,6 +35,12 @@ class ConversationSummary(models.Model):
     formality = models.FloatField(default=0.0)
     emotional_intensity = models.FloatField(default=0.0)
 
+    # raw additive heuristic counts (see feature_extraction.extract_feature_counts);
+    # null means unknown and forces a full recompute instead of an incremental merge
+    feature_counts = models.JSONField(null=True, blank=True)
+    # heuristic result served while an LLM refinement job is queued
+    provisional = models.BooleanField(default=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -41,6 +48,11 @@ class ConversationSummary(models.Model):
         indexes = [
             models.Index(fields=["user_a_id", "user_b_id"]),
             models.Index(fields=["last_message_at"]),
+            # incremental refresh of the in-memory similarity index
+            models.Index(fields=["updated_at"]),
+            # a user's pairs newest first, one range scan per side (see services.user_connections)
+            models.Index(fields=["user_a_id", "-last_message_at", "-id"], name="summary_user_a_recent_idx"),
+            models.Index(fields=["user_b_id", "-last_message_at", "-id"], name="summary_user_b_recent_idx"),
         ]
 
     def __str__(self):
@@ -56,3 +68,106 @@ class PostsComment(models.Model):
     class Meta:
         managed = False
         db_table = 'posts_comments'
+
+
+class SessionMapping(models.Model):
+    # custom session id handed out by /set_email/ -> Django session row
+    custom_session_id = models.CharField(max_length=255, unique=True)
+    session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name="+")
+    user_email = models.EmailField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.custom_session_id} -> {self.session_id}"
+
+
+class BackfillCheckpoint(models.Model):
+    # last canonical pair fully written by a backfill run, for --resume
+    name = models.CharField(max_length=100, unique=True)
+    last_user_a_id = models.IntegerField()
+    last_user_b_id = models.IntegerField()
+    processed = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_user_a_id}-{self.last_user_b_id} ({self.processed})"
+
+
+class LLMFeatureCache(models.Model):
+    # sha256 of normalized conversation text + model + prompt version
+    key = models.CharField(max_length=64, unique=True)
+    features = models.JSONField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.key[:12]}… (expires {self.expires_at})"
+
+
+class PairLock(models.Model):
+    # cross-process single-flight lease for one pair's inference
+    pair_key = models.CharField(max_length=64, unique=True)
+    owner = models.CharField(max_length=64)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.pair_key} held by {self.owner} until {self.expires_at}"
+
+
+class LLMRefinementJob(models.Model):
+    """Queued LLM re-scoring of a pair whose summary was stored as provisional."""
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_FAILED = "failed"
+    STATUSES = (
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_FAILED, "Failed"),
+    )
+
+    # one job per pair; re-enqueueing resets it to pending
+    pair_key = models.CharField(max_length=64, unique=True)
+    user_a_id = models.IntegerField()
+    user_b_id = models.IntegerField()
+    status = models.CharField(max_length=10, choices=STATUSES, default=STATUS_PENDING)
+    attempts = models.IntegerField(default=0)
+    available_at = models.DateTimeField()
+    # set when a worker claims the job; a re-enqueue clears it so the worker won't drop the new request
+    claim_token = models.CharField(max_length=32, blank=True, default="")
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "available_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.pair_key} [{self.status}] attempts={self.attempts}"
+
+
+class UserConnectionRollup(models.Model):
+    """Per-user totals over every ConversationSummary the user is part of.
+
+    Maintained incrementally by api.services.rollups whenever a summary is written;
+    ``manage.py rebuild_user_rollups`` recomputes it from scratch. Mean confidence
+    per type is ``<type>_confidence_sum / <type>_count``.
+    """
+    user_id = models.IntegerField(unique=True)
+    pair_count = models.IntegerField(default=0)
+    social_count = models.IntegerField(default=0)
+    romantic_count = models.IntegerField(default=0)
+    spiritual_count = models.IntegerField(default=0)
+    professional_count = models.IntegerField(default=0)
+    social_confidence_sum = models.FloatField(default=0.0)
+    romantic_confidence_sum = models.FloatField(default=0.0)
+    spiritual_confidence_sum = models.FloatField(default=0.0)
+    professional_confidence_sum = models.FloatField(default=0.0)
+    # type with the most pairs (ties go to CONNECTION_TYPES order); null without pairs
+    dominant_type = models.CharField(max_length=50, choices=CONNECTION_TYPES, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"user {self.user_id}: {self.dominant_type} ({self.pair_count} pairs)"
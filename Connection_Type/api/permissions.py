@@ -0,0 +1,20 @@
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.permissions import SAFE_METHODS, BasePermission
+from .services.sessions import lookup_session
+
+
+class HasSessionId(BasePermission):
+    """Require a session_id that maps to a stored session with an email (cookie sessions are not sufficient).
+
+    Read from the query string on GET and from the body otherwise; failures are 403 with a detail message.
+    """
+
+    def has_permission(self, request, view):
+        params = request.query_params if request.method in SAFE_METHODS else request.data
+        sid = params.get("session_id")
+        if not sid:
+            raise PermissionDenied("session_id is required. Call /set_email/ first to obtain it.")
+        record = lookup_session(sid)
+        if record is None or not record.user_email:
+            raise PermissionDenied("Invalid session_id. Set email via /set_email/ first.")
+        return True
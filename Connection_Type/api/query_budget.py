@@ -0,0 +1,26 @@
+"""Query-budget assertions for CI checks (see ``manage.py check_query_budgets``)."""
+from contextlib import contextmanager
+from typing import Callable, Union
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def assert_max_queries(limit: Union[int, Callable[[], int]], label: str = "block", using: str = DEFAULT_DB_ALIAS):
+    """Fail with the captured SQL when the block issues more than ``limit`` queries.
+
+    A callable ``limit`` is evaluated after the block, for budgets that depend on
+    what the block did. Yields the CaptureQueriesContext so callers can inspect
+    the count afterwards.
+    """
+    with CaptureQueriesContext(connections[using]) as captured:
+        yield captured
+    if callable(limit):
+        limit = limit()
+    if len(captured) > limit:
+        statements = "\n".join(f"  {i}. {q['sql']}" for i, q in enumerate(captured.captured_queries, 1))
+        raise QueryBudgetExceeded(f"{label}: {len(captured)} queries, budget {limit}\n{statements}")
@@ -1,11 +1,15 @@
+import math
 from rest_framework import serializers
-from .constants import CONNECTION_TYPE_KEYS
+from .constants import CONNECTION_TYPE_KEYS, FEATURE_KEYS
+from .services.user_connections import decode_cursor
 
 class ConnectionDistributionSerializer(serializers.Serializer):
     highest_connection_type = serializers.ChoiceField(choices=CONNECTION_TYPE_KEYS)
     distribution = serializers.DictField(child=serializers.IntegerField(min_value=0, max_value=100))
     pair_key = serializers.CharField()
     message_count = serializers.IntegerField(min_value=0)
+    # true while the heuristic answer waits for its queued LLM refinement
+    provisional = serializers.BooleanField(required=False, default=False)
 
 
 class ProfileInputSerializer(serializers.Serializer):
@@ -18,3 +22,75 @@ class ProfileInputSerializer(serializers.Serializer):
     occupation = serializers.CharField(allow_blank=True, required=False)
     relationship_status = serializers.CharField(allow_blank=True, required=False)
     limit = serializers.IntegerField(min_value=1, required=False, help_text="Limit the number of recent posts/comments to analyze.")
+
+
+class PairSerializer(serializers.Serializer):
+    user_a_id = serializers.IntegerField()
+    user_b_id = serializers.IntegerField()
+
+
+class PairBatchInputSerializer(serializers.Serializer):
+    # Mandatory session_id: validated once for the whole batch
+    session_id = serializers.CharField(required=True, allow_blank=False)
+    pairs = serializers.ListField(child=PairSerializer(), min_length=1, max_length=200)
+
+
+class SimilarPairsQuerySerializer(serializers.Serializer):
+    """Query params for /similar-pairs/: exactly one of pair_key or vector."""
+    session_id = serializers.CharField(required=True, allow_blank=False)
+    pair_key = serializers.CharField(required=False)
+    # comma-separated, in FEATURE_KEYS order
+    vector = serializers.CharField(required=False)
+    k = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    metric = serializers.ChoiceField(choices=["cosine", "l2"], default="cosine")
+    # comma-separated subset of CONNECTION_TYPE_KEYS
+    connection_type = serializers.CharField(required=False)
+
+    def validate_vector(self, value):
+        try:
+            vector = [float(v) for v in value.split(",")]
+        except ValueError:
+            raise serializers.ValidationError("vector must be comma-separated numbers")
+        if len(vector) != len(FEATURE_KEYS):
+            raise serializers.ValidationError(f"vector must have {len(FEATURE_KEYS)} components: {', '.join(FEATURE_KEYS)}")
+        # float() accepts "nan" and "inf", which would poison every distance
+        if not all(math.isfinite(v) for v in vector):
+            raise serializers.ValidationError("vector components must be finite numbers")
+        return vector
+
+    def validate_connection_type(self, value):
+        types = [t.strip() for t in value.split(",") if t.strip()]
+        unknown = [t for t in types if t not in CONNECTION_TYPE_KEYS]
+        if unknown:
+            raise serializers.ValidationError(f"unknown connection_type {unknown}; expected {CONNECTION_TYPE_KEYS}")
+        return types
+
+    def validate(self, attrs):
+        if ("pair_key" in attrs) == ("vector" in attrs):
+            raise serializers.ValidationError("Provide exactly one of pair_key or vector.")
+        return attrs
+
+
+class UserConnectionsQuerySerializer(serializers.Serializer):
+    """Query params for /users/<id>/connections/ (keyset pagination via ``cursor``)."""
+    session_id = serializers.CharField(required=True, allow_blank=False)
+    limit = serializers.IntegerField(min_value=1, max_value=200, default=50)
+    # opaque value from a previous page's next_cursor
+    cursor = serializers.CharField(required=False)
+    # comma-separated subset of CONNECTION_TYPE_KEYS
+    connection_type = serializers.CharField(required=False)
+    min_confidence = serializers.FloatField(min_value=0, max_value=100, required=False)
+
+    def validate_cursor(self, value):
+        try:
+            decode_cursor(value)
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
+        return value
+
+    def validate_connection_type(self, value):
+        types = [t.strip() for t in value.split(",") if t.strip()]
+        unknown = [t for t in types if t not in CONNECTION_TYPE_KEYS]
+        if unknown:
+            raise serializers.ValidationError(f"unknown connection_type {unknown}; expected {CONNECTION_TYPE_KEYS}")
+        return types
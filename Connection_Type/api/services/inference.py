@@ -1,11 +1,21 @@
-from typing import Dict, List, Tuple
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import hashlib
 import logging
-from django.db.models import Q
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.db.models.functions import Greatest, Least
 from django.utils import timezone
+from django.utils.http import quote_etag
 from ..models import ConversationMessage, ConversationSummary
-from ..constants import CONNECTION_TYPE_KEYS
-from ..feature_extraction import extract_features as extract_features_heuristic
+from ..constants import CONNECTION_TYPE_KEYS, FEATURE_KEYS, SCORING_VERSION
+from ..feature_extraction import extract_feature_counts, features_from_counts, merge_feature_counts
 from ..logic import connection_type_scores_raw
+from . import metrics
+from .jobs import enqueue_refinements
+from .rollups import apply_summary_changes, record_summary_change
+from .single_flight import single_flight
 
 # Optional LLM feature extractor
 try:
@@ -16,18 +26,83 @@ except Exception:
     LLM_AVAILABLE = False
 
 
-def _fetch_pair_messages(user_a_id: int, user_b_id: int) -> List[Dict]:
-    """Fetch chronological messages strictly between two users from DB."""
+def _pair_q(user_a_id: int, user_b_id: int) -> Q:
+    """Messages strictly between two users, in either direction."""
     user_a = min(user_a_id, user_b_id)
     user_b = max(user_a_id, user_b_id)
-    qs = ConversationMessage.objects.filter(
+    return (
         (Q(sender_id=user_a) & Q(receiver_id=user_b)) |
         (Q(sender_id=user_b) & Q(receiver_id=user_a))
-    ).order_by("sent_at")
+    )
+
+
+def _fetch_pair_messages(user_a_id: int, user_b_id: int, since=None) -> List[Dict]:
+    """Fetch chronological messages strictly between two users from DB.
+
+    With ``since``, only messages sent strictly after that instant are returned.
+    """
+    qs = ConversationMessage.objects.filter(_pair_q(user_a_id, user_b_id))
+    if since is not None:
+        qs = qs.filter(sent_at__gt=since)
+    qs = qs.order_by("sent_at")
 
     return list(qs.values("sender_id", "receiver_id", "message", "sent_at"))
 
 
+def _probe_pair(user_a_id: int, user_b_id: int) -> Tuple[int, Optional[datetime]]:
+    """Return (message_count, last sent_at) for a pair with a single aggregate query."""
+    agg = ConversationMessage.objects.filter(_pair_q(user_a_id, user_b_id)).aggregate(
+        message_count=Count("id"), last_message_at=Max("sent_at")
+    )
+    return agg["message_count"] or 0, _aware(agg["last_message_at"])
+
+
+def _pairs_q(pairs) -> Q:
+    q = Q()
+    for user_a, user_b in pairs:
+        q |= _pair_q(user_a, user_b)
+    return q
+
+
+def _probe_pairs(pairs: List[Tuple[int, int]]) -> Dict[Tuple[int, int], Tuple[int, Optional[datetime]]]:
+    """Grouped freshness probe: (user_a, user_b) -> (message_count, last sent_at) in one query."""
+    rows = (
+        ConversationMessage.objects.filter(_pairs_q(pairs))
+        .annotate(pair_a=Least("sender_id", "receiver_id"), pair_b=Greatest("sender_id", "receiver_id"))
+        .values("pair_a", "pair_b")
+        .annotate(message_count=Count("id"), last_message_at=Max("sent_at"))
+        .order_by()
+    )
+    return {(r["pair_a"], r["pair_b"]): (r["message_count"], _aware(r["last_message_at"])) for r in rows}
+
+
+def _fetch_messages_for_pairs(since_by_pair: Dict[Tuple[int, int], Optional[datetime]]) -> Dict[Tuple[int, int], List[Dict]]:
+    """Fetch messages for many pairs in one query, grouped by canonical pair.
+
+    A non-None ``since`` limits that pair to messages sent strictly after it.
+    """
+    q = Q()
+    for (user_a, user_b), since in since_by_pair.items():
+        pair_q = _pair_q(user_a, user_b)
+        q |= (pair_q & Q(sent_at__gt=since)) if since is not None else pair_q
+    grouped: Dict[Tuple[int, int], List[Dict]] = {pair: [] for pair in since_by_pair}
+    qs = ConversationMessage.objects.filter(q).order_by("sent_at")
+    for r in qs.values("sender_id", "receiver_id", "message", "sent_at"):
+        pair = (min(r["sender_id"], r["receiver_id"]), max(r["sender_id"], r["receiver_id"]))
+        grouped[pair].append(r)
+    return grouped
+
+
+def _aware(dt):
+    if dt and timezone.is_naive(dt):
+        try:
+            dt = timezone.make_aware(dt)
+        except Exception:
+            # If awareness fails, keep as-is to avoid crashing; logging is suppressed in dev
+            pass
+    return dt
+
+
 def _format_messages(rows: List[Dict]) -> List[Dict[str, str]]:
     """Format DB rows to simple sender/text for feature extraction."""
     return [{"sender": f"User {r['sender_id']}", "text": r["message"]} for r in rows]
@@ -44,66 +119,114 @@ def _percentages_independent(scores: Dict[str, float]) -> Tuple[Dict[str, int],
     return perc, highest
 
 
-def infer_pair_connection(user_a_id: int, user_b_id: int) -> Dict:
-    """End-to-end inference for a two-user conversation.
+def pair_etag(pair_key: str, message_count: int, last_message_at, provisional) -> str:
+    """Quoted ETag for a pair result; it changes only when the inputs or the scoring version do."""
+    stamp = f"{last_message_at.timestamp():.6f}" if last_message_at else ""
+    raw = f"{SCORING_VERSION}|{pair_key}|{message_count}|{stamp}|{int(bool(provisional))}"
+    return quote_etag(hashlib.sha1(raw.encode("utf-8")).hexdigest())
 
-    - Fetch conversation from DB
-    - Heuristic-first feature extraction; call LLM only if needed
-    - Compute deterministic per-type distribution
-    - Persist/update summary
-    - Return structured output
-    """
-    rows = _fetch_pair_messages(user_a_id, user_b_id)
-    msg_payload = _format_messages(rows)
 
-    # Cache check: if ConversationSummary exists and DB hasn't changed, reuse cached features
+def current_pair_etag(user_a_id: int, user_b_id: int) -> Optional[str]:
+    """ETag of the stored result if it is still up to date, else None.
+
+    Costs the summary read and the aggregate freshness probe only; no message
+    rows are fetched and nothing is scored.
+    """
     user_a = min(user_a_id, user_b_id)
     user_b = max(user_a_id, user_b_id)
     pair_key = f"{user_a}-{user_b}"
-    new_last_message_at = rows[-1]["sent_at"] if rows else None
-    if new_last_message_at and timezone.is_naive(new_last_message_at):
-        try:
-            new_last_message_at = timezone.make_aware(new_last_message_at)
-        except Exception:
-            # If awareness fails, keep as-is to avoid crashing; logging is suppressed in dev
-            pass
-    new_message_count = len(rows)
-
     cached = ConversationSummary.objects.filter(pair_key=pair_key).values(
-        "last_message_at",
-        "message_count",
-        "emotional_warmth",
-        "romantic_language",
-        "spiritual_reference",
-        "task_focus",
-        "formality",
-        "emotional_intensity",
+        "message_count", "last_message_at", "provisional"
     ).first()
+    if not cached:
+        return None
+    message_count, last_message_at = _probe_pair(user_a, user_b)
+    if not _is_fresh(cached, message_count, last_message_at):
+        return None
+    return pair_etag(pair_key, message_count, last_message_at, cached["provisional"])
+
+
+def _cached_result(cached: Dict, pair_key: str) -> Dict:
+    """Score the features stored on an up-to-date ConversationSummary row."""
+    cached_features = {
+        "emotional_warmth": cached.get("emotional_warmth", 0.0),
+        "romantic_language": cached.get("romantic_language", 0.0),
+        "spiritual_reference": cached.get("spiritual_reference", 0.0),
+        "task_focus": cached.get("task_focus", 0.0),
+        "formality": cached.get("formality", 0.0),
+        "emotional_intensity": cached.get("emotional_intensity", 0.0),
+    }
+    scores = connection_type_scores_raw(cached_features)
+    distribution, highest = _percentages_independent(scores)
+    logging.getLogger("api").info(
+        "analyze-pair cache-hit pair_key=%s messages=%s highest=%s", pair_key, cached["message_count"], highest
+    )
+    return {
+        "highest_connection_type": highest,
+        "distribution": distribution,
+        "pair_key": pair_key,
+        "message_count": cached["message_count"],
+        "provisional": bool(cached.get("provisional")),
+        "etag": pair_etag(pair_key, cached["message_count"], cached["last_message_at"], cached.get("provisional")),
+    }
 
-    if cached and cached["last_message_at"] == new_last_message_at and cached["message_count"] == new_message_count:
-        cached_features = {
-            "emotional_warmth": cached.get("emotional_warmth", 0.0),
-            "romantic_language": cached.get("romantic_language", 0.0),
-            "spiritual_reference": cached.get("spiritual_reference", 0.0),
-            "task_focus": cached.get("task_focus", 0.0),
-            "formality": cached.get("formality", 0.0),
-            "emotional_intensity": cached.get("emotional_intensity", 0.0),
-        }
-        scores = connection_type_scores_raw(cached_features)
-        distribution, highest = _percentages_independent(scores)
-        logging.getLogger("api").info(
-            "analyze-pair cache-hit pair_key=%s messages=%s highest=%s", pair_key, new_message_count, highest
-        )
-        return {
-            "highest_connection_type": highest,
-            "distribution": distribution,
-            "pair_key": pair_key,
-            "message_count": new_message_count,
-        }
+
+_PIPELINE = "analyze_pair"
+
+_SUMMARY_FIELDS = (
+    "pair_key",
+    "last_message_at",
+    "message_count",
+    "emotional_warmth",
+    "romantic_language",
+    "spiritual_reference",
+    "task_focus",
+    "formality",
+    "emotional_intensity",
+    "feature_counts",
+    "provisional",
+)
+
+
+def _is_fresh(cached: Optional[Dict], message_count: int, last_message_at) -> bool:
+    return bool(cached) and cached["last_message_at"] == last_message_at and cached["message_count"] == message_count
+
+
+def _incremental_counts(cached: Optional[Dict], delta: List[Dict], message_count: int) -> Optional[Dict[str, int]]:
+    """Merge counts for messages newer than the summary, or None if a full recompute is needed."""
+    if not (cached and cached["feature_counts"] and cached["last_message_at"]):
+        return None
+    if not delta or cached["message_count"] + len(delta) != message_count:
+        return None
+    return merge_feature_counts(cached["feature_counts"], extract_feature_counts(_format_messages(delta)))
+
+
+def _is_all_zeros(d: Optional[Dict[str, float]]) -> bool:
+    if not d:
+        return True
+    return all(float(d.get(k, 0.0)) == 0.0 for k in FEATURE_KEYS)
+
+
+def _llm_features(rows: List[Dict]) -> Optional[Dict[str, float]]:
+    """LLM features for a conversation, or None when unavailable, failed or all zeros."""
+    if not LLM_AVAILABLE:
+        return None
+    try:
+        features = extract_features_llm(_format_messages(rows))
+    except Exception:
+        return None
+    return None if _is_all_zeros(features) else features
+
+
+def _score_pair(user_a: int, user_b: int, counts: Dict[str, int], rows: Optional[List[Dict]],
+                message_count: int, last_message_at) -> Tuple[Dict, ConversationSummary]:
+    """Heuristic gate (LLM if needed) and score; returns the result and the unsaved summary row."""
+    pair_key = f"{user_a}-{user_b}"
 
     # Heuristic-first gate
-    heuristic_features = extract_features_heuristic(msg_payload)
-    heuristic_scores = connection_type_scores_raw(heuristic_features)
+    with metrics.stage(_PIPELINE, "heuristic"):
+        heuristic_features = features_from_counts(counts)
+        heuristic_scores = connection_type_scores_raw(heuristic_features)
     # Compute margin between top two scores for confidence gating
     sorted_scores = sorted(((k, heuristic_scores.get(k, 0.0)) for k in CONNECTION_TYPE_KEYS), key=lambda x: x[1], reverse=True)
     top_label, top_val = sorted_scores[0]
@@ -111,60 +234,46 @@ def infer_pair_connection(user_a_id: int, user_b_id: int) -> Dict:
     margin = top_val - second_val
 
     USE_HEURISTIC = (top_val >= 0.7 and margin >= 0.15) or not LLM_AVAILABLE
+    # Async mode: answer with the heuristic now and let the job worker ask the LLM
+    provisional = not USE_HEURISTIC and getattr(settings, "PAIR_LLM_ASYNC", False)
 
-    if USE_HEURISTIC:
+    if USE_HEURISTIC or provisional:
         final_features = heuristic_features
     else:
+        # The LLM needs the whole conversation text, not just the new messages
+        if rows is None:
+            with metrics.stage(_PIPELINE, "fetch"):
+                rows = _fetch_pair_messages(user_a, user_b)
         # Try LLM features, fallback to heuristic on failure or zeros
-        llm_features = None
-        try:
-            llm_features = extract_features_llm(msg_payload)
-        except Exception:
-            llm_features = None
-
-        def _is_all_zeros(d: Dict[str, float]) -> bool:
-            if not d:
-                return True
-            keys = [
-                "emotional_warmth",
-                "romantic_language",
-                "spiritual_reference",
-                "task_focus",
-                "formality",
-                "emotional_intensity",
-            ]
-            return all(float(d.get(k, 0.0)) == 0.0 for k in keys)
-
-        final_features = llm_features if llm_features and not _is_all_zeros(llm_features) else heuristic_features
-    strategy = "heuristic" if USE_HEURISTIC or final_features is heuristic_features else "llm"
+        with metrics.stage(_PIPELINE, "llm"):
+            final_features = _llm_features(rows) or heuristic_features
+        if final_features is heuristic_features:
+            metrics.FALLBACKS.inc(pipeline=_PIPELINE, reason="llm_unusable")
+    if provisional:
+        strategy = "heuristic-provisional"
+    else:
+        strategy = "heuristic" if USE_HEURISTIC or final_features is heuristic_features else "llm"
+    metrics.STRATEGY.inc(pipeline=_PIPELINE, strategy=strategy)
 
     # Deterministic probability distribution
-    scores = connection_type_scores_raw(final_features)
-    distribution, highest = _percentages_independent(scores)
+    with metrics.stage(_PIPELINE, "score"):
+        scores = connection_type_scores_raw(final_features)
+        distribution, highest = _percentages_independent(scores)
 
     # Confidence as highest percentage
     confidence_pct = distribution.get(highest, 0)
 
-    # Persist/update summary
-    last_message_at = new_last_message_at
-    message_count = new_message_count
-
-    ConversationSummary.objects.update_or_create(
+    summary = ConversationSummary(
         pair_key=pair_key,
-        defaults={
-            "user_a_id": user_a,
-            "user_b_id": user_b,
-            "last_message_at": last_message_at,
-            "message_count": message_count,
-            "connection_type": highest,
-            "confidence": confidence_pct,
-            "emotional_warmth": final_features.get("emotional_warmth", 0.0),
-            "romantic_language": final_features.get("romantic_language", 0.0),
-            "spiritual_reference": final_features.get("spiritual_reference", 0.0),
-            "task_focus": final_features.get("task_focus", 0.0),
-            "formality": final_features.get("formality", 0.0),
-            "emotional_intensity": final_features.get("emotional_intensity", 0.0),
-        }
+        user_a_id=user_a,
+        user_b_id=user_b,
+        last_message_at=last_message_at,
+        message_count=message_count,
+        connection_type=highest,
+        confidence=confidence_pct,
+        feature_counts=counts,
+        provisional=provisional,
+        **{k: final_features.get(k, 0.0) for k in FEATURE_KEYS},
     )
     logging.getLogger("api").info(
         "analyze-pair ok pair_key=%s messages=%s strategy=%s highest=%s", pair_key, message_count, strategy, highest
@@ -175,4 +284,270 @@ def infer_pair_connection(user_a_id: int, user_b_id: int) -> Dict:
         "distribution": distribution,
         "pair_key": pair_key,
         "message_count": message_count,
-    }
+        "provisional": provisional,
+        "etag": pair_etag(pair_key, message_count, last_message_at, provisional),
+    }, summary
+
+
+_UPSERT_FIELDS = [
+    "user_a_id",
+    "user_b_id",
+    "last_message_at",
+    "message_count",
+    "connection_type",
+    "confidence",
+    *FEATURE_KEYS,
+    "feature_counts",
+    "provisional",
+    "updated_at",
+]
+
+
+def _persist_summaries(summaries: List[ConversationSummary]) -> None:
+    """Upsert scored summaries, update the rollups and queue refinements in one transaction.
+
+    A constant number of queries whatever the number of summaries. Safe against
+    concurrent writers of the same pairs, whether from the batch endpoint or
+    from a single-pair request that outlived its lock wait.
+    """
+    if not summaries:
+        return
+    with metrics.stage(_PIPELINE, "persist"), transaction.atomic():
+        # Insert placeholder rows (empty connection_type) for new pairs first. A
+        # concurrent first write of the same pair then blocks on the unique key
+        # until this transaction commits, and its locked read below sees this
+        # row instead of both writers counting the pair as new in the rollups.
+        ConversationSummary.objects.bulk_create(
+            [
+                ConversationSummary(pair_key=s.pair_key, user_a_id=s.user_a_id, user_b_id=s.user_b_id,
+                                    last_message_at=s.last_message_at, connection_type="", confidence=0.0)
+                for s in summaries
+            ],
+            ignore_conflicts=True,
+        )
+        previous = {
+            pair_key: (connection_type, confidence)
+            for pair_key, connection_type, confidence in ConversationSummary.objects.select_for_update()
+            .filter(pair_key__in=[s.pair_key for s in summaries])
+            .values_list("pair_key", "connection_type", "confidence")
+            # This transaction's own placeholder: the pair is new
+            if connection_type
+        }
+        ConversationSummary.objects.bulk_create(
+            summaries, update_conflicts=True, unique_fields=["pair_key"], update_fields=_UPSERT_FIELDS
+        )
+        apply_summary_changes(
+            (s.user_a_id, s.user_b_id, previous.get(s.pair_key), (s.connection_type, s.confidence))
+            for s in summaries
+        )
+        enqueue_refinements((s.user_a_id, s.user_b_id) for s in summaries if s.provisional)
+
+
+def _merge_since(cached: Optional[Dict]):
+    """The summary's last_message_at when its stored counts allow an incremental merge, else None."""
+    if cached and cached["feature_counts"] and cached["last_message_at"]:
+        return cached["last_message_at"]
+    return None
+
+
+def _stale_pair_inputs(cached: Optional[Dict], since, rows: List[Dict], message_count: int,
+                       last_message_at) -> Optional[Tuple[Dict[str, int], Optional[List[Dict]], int, Optional[datetime]]]:
+    """Scoring inputs ``(counts, rows, message_count, last_message_at)`` for a stale pair.
+
+    ``rows`` are the messages after ``since`` (incremental merge into the stored
+    counts) or, when ``since`` is None, the whole conversation. Returns None when
+    the merge does not add up and the whole conversation has to be fetched.
+    """
+    if since is not None:
+        counts = _incremental_counts(cached, rows, message_count)
+        return None if counts is None else (counts, None, message_count, last_message_at)
+    last_message_at = _aware(rows[-1]["sent_at"]) if rows else None
+    return extract_feature_counts(_format_messages(rows)), rows, len(rows), last_message_at
+
+
+@metrics.request_stages()
+def infer_pair_connection(user_a_id: int, user_b_id: int) -> Dict:
+    """End-to-end inference for a two-user conversation.
+
+    - Probe message count / latest sent_at; reuse the stored summary when unchanged
+    - Otherwise fetch only messages newer than the summary and merge their raw
+      counts into the stored ones (full fetch when counts are missing/inconsistent)
+    - Heuristic-first feature extraction; call LLM only if needed
+    - Compute deterministic per-type distribution
+    - Persist/update summary
+    - Return structured output
+
+    Recomputation is single-flight per pair: concurrent callers for the same
+    stale pair (in this process or others) wait for the first one and then
+    reuse its result instead of repeating the fetch, LLM call and upsert.
+
+    Each pipeline stage is observed once per call, with the time summed over
+    the checks repeated under the flight and the fallback full fetch.
+    """
+    user_a = min(user_a_id, user_b_id)
+    user_b = max(user_a_id, user_b_id)
+    pair_key = f"{user_a}-{user_b}"
+
+    with metrics.stage(_PIPELINE, "cache_check"):
+        cached = ConversationSummary.objects.filter(pair_key=pair_key).values(*_SUMMARY_FIELDS).first()
+        new_message_count, new_last_message_at = _probe_pair(user_a, user_b)
+    if _is_fresh(cached, new_message_count, new_last_message_at):
+        metrics.PAIR_CACHE.inc(result="hit")
+        return _cached_result(cached, pair_key)
+    metrics.PAIR_CACHE.inc(result="miss")
+
+    # Re-probe under the flight: a waiter from another process then sees the leader's summary
+    return single_flight(pair_key, lambda: _infer_pair(user_a, user_b))
+
+
+def _infer_pair(user_a: int, user_b: int) -> Dict:
+    pair_key = f"{user_a}-{user_b}"
+    with metrics.stage(_PIPELINE, "cache_check"):
+        cached = ConversationSummary.objects.filter(pair_key=pair_key).values(*_SUMMARY_FIELDS).first()
+
+        # Freshness probe: one aggregate query, no message bodies
+        new_message_count, new_last_message_at = _probe_pair(user_a, user_b)
+
+    # Cache check: if ConversationSummary exists and DB hasn't changed, reuse cached features
+    if _is_fresh(cached, new_message_count, new_last_message_at):
+        # Another worker finished this pair while we waited on the flight
+        metrics.PAIR_CACHE.inc(result="coalesced")
+        return _cached_result(cached, pair_key)
+
+    # Incremental path when the stored counts cover every message up to last_message_at
+    since = _merge_since(cached)
+    with metrics.stage(_PIPELINE, "fetch"):
+        rows = _fetch_pair_messages(user_a, user_b, since=since)
+    with metrics.stage(_PIPELINE, "heuristic"):
+        inputs = _stale_pair_inputs(cached, since, rows, new_message_count, new_last_message_at)
+    if inputs is None:
+        with metrics.stage(_PIPELINE, "fetch"):
+            rows = _fetch_pair_messages(user_a, user_b)
+        with metrics.stage(_PIPELINE, "heuristic"):
+            inputs = _stale_pair_inputs(cached, None, rows, new_message_count, new_last_message_at)
+
+    result, summary = _score_pair(user_a, user_b, *inputs)
+    _persist_summaries([summary])
+    return result
+
+
+@metrics.request_stages()
+def infer_pair_connections(pairs: List[Tuple[int, int]]) -> Dict[str, Dict]:
+    """Batch variant of ``infer_pair_connection`` keyed by pair_key.
+
+    Summaries are read with one query and freshness is probed with one grouped
+    aggregate; message rows are fetched in one grouped query and only for stale
+    pairs (plus one more for pairs whose incremental merge does not add up).
+    All stale pairs are written with one upsert, one rollup pass and one job
+    enqueue. A failure on one pair is reported as ``{"error": ...}`` for that key.
+    Stage times are summed over the pairs and observed once per call.
+    """
+    canonical = {}
+    for a, b in pairs:
+        user_a, user_b = min(a, b), max(a, b)
+        canonical[f"{user_a}-{user_b}"] = (user_a, user_b)
+    if not canonical:
+        return {}
+
+    with metrics.stage(_PIPELINE, "cache_check"):
+        summaries = {
+            r["pair_key"]: r
+            for r in ConversationSummary.objects.filter(pair_key__in=list(canonical)).values(*_SUMMARY_FIELDS)
+        }
+        probes = _probe_pairs(list(canonical.values()))
+
+    results: Dict[str, Dict] = {}
+    stale = {}
+    for pair_key, pair in canonical.items():
+        message_count, last_message_at = probes.get(pair, (0, None))
+        cached = summaries.get(pair_key)
+        if message_count == 0:
+            results[pair_key] = {"error": "No messages between these users."}
+        elif _is_fresh(cached, message_count, last_message_at):
+            metrics.PAIR_CACHE.inc(result="hit")
+            results[pair_key] = _cached_result(cached, pair_key)
+        else:
+            metrics.PAIR_CACHE.inc(result="miss")
+            # Pairs with stored counts only need the messages newer than the summary
+            stale[pair] = _merge_since(cached)
+
+    inputs = {}
+    refetch = {}
+    with metrics.stage(_PIPELINE, "fetch"):
+        rows_by_pair = _fetch_messages_for_pairs(stale) if stale else {}
+    for pair, since in stale.items():
+        pair_key = f"{pair[0]}-{pair[1]}"
+        try:
+            with metrics.stage(_PIPELINE, "heuristic"):
+                inputs[pair] = _stale_pair_inputs(summaries.get(pair_key), since, rows_by_pair[pair], *probes[pair])
+            if inputs[pair] is None:
+                refetch[pair] = None
+        except Exception:
+            logging.getLogger("api").exception("analyze-pairs failed pair_key=%s", pair_key)
+            results[pair_key] = {"error": "Analysis failed for this pair."}
+    if refetch:
+        with metrics.stage(_PIPELINE, "fetch"):
+            rows_by_pair = _fetch_messages_for_pairs(refetch)
+        with metrics.stage(_PIPELINE, "heuristic"):
+            for pair in refetch:
+                inputs[pair] = _stale_pair_inputs(None, None, rows_by_pair[pair], *probes[pair])
+
+    scored = {}
+    for (user_a, user_b), pair_inputs in inputs.items():
+        pair_key = f"{user_a}-{user_b}"
+        try:
+            scored[pair_key] = _score_pair(user_a, user_b, *pair_inputs)
+        except Exception:
+            logging.getLogger("api").exception("analyze-pairs failed pair_key=%s", pair_key)
+            results[pair_key] = {"error": "Analysis failed for this pair."}
+    try:
+        _persist_summaries([summary for _, summary in scored.values()])
+        results.update((pair_key, result) for pair_key, (result, _) in scored.items())
+    except Exception:
+        logging.getLogger("api").exception("analyze-pairs failed to save pairs=%s", len(scored))
+        results.update((pair_key, {"error": "Analysis failed for this pair."}) for pair_key in scored)
+
+    # ETags only apply to the single-pair GET endpoint
+    for result in results.values():
+        result.pop("etag", None)
+    return results
+
+
+def refine_pair_with_llm(user_a: int, user_b: int) -> bool:
+    """Re-score a pair with LLM features and clear its provisional flag (job worker path).
+
+    Raises RuntimeError when the LLM yields nothing usable so the job is retried.
+    Returns False when the stored summary no longer matches the messages that
+    were scored (a newer request recomputed it and re-enqueued if needed).
+    """
+    pair_key = f"{user_a}-{user_b}"
+    rows = _fetch_pair_messages(user_a, user_b)
+    if not rows:
+        return False
+    features = _llm_features(rows)
+    if features is None:
+        raise RuntimeError("LLM returned no usable features")
+
+    scores = connection_type_scores_raw(features)
+    distribution, highest = _percentages_independent(scores)
+    confidence = distribution.get(highest, 0)
+    with transaction.atomic():
+        matching = ConversationSummary.objects.select_for_update().filter(
+            pair_key=pair_key,
+            message_count=len(rows),
+            last_message_at=_aware(rows[-1]["sent_at"]),
+        )
+        previous = matching.values_list("connection_type", "confidence").first()
+        updated = matching.update(
+            connection_type=highest,
+            confidence=confidence,
+            provisional=False,
+            updated_at=timezone.now(),
+            **{k: features.get(k, 0.0) for k in FEATURE_KEYS},
+        )
+        if updated:
+            record_summary_change(user_a, user_b, previous, (highest, confidence))
+    logging.getLogger("api").info(
+        "analyze-pair refined pair_key=%s messages=%s highest=%s applied=%s", pair_key, len(rows), highest, bool(updated)
+    )
+    return bool(updated)
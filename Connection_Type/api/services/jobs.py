@@ -0,0 +1,100 @@
+from datetime import timedelta
+from typing import Iterable, List, Tuple
+import uuid
+from django.db.models import F, Q
+from django.utils import timezone
+from ..models import LLMRefinementJob
+
+# Everything but pair_key and created_at is reset when a pair is re-queued
+_REQUEUE_FIELDS = [
+    "user_a_id",
+    "user_b_id",
+    "status",
+    "attempts",
+    "available_at",
+    "claim_token",
+    "locked_until",
+    "last_error",
+    "updated_at",
+]
+
+
+def enqueue_refinements(pairs: Iterable[Tuple[int, int]]) -> None:
+    """Queue (or re-queue) LLM refinements for canonical pairs with a single upsert."""
+    now = timezone.now()
+    jobs = [
+        LLMRefinementJob(
+            pair_key=f"{user_a}-{user_b}",
+            user_a_id=user_a,
+            user_b_id=user_b,
+            status=LLMRefinementJob.STATUS_PENDING,
+            attempts=0,
+            available_at=now,
+            claim_token="",
+            locked_until=None,
+            last_error="",
+        )
+        for user_a, user_b in pairs
+    ]
+    if jobs:
+        LLMRefinementJob.objects.bulk_create(
+            jobs, update_conflicts=True, unique_fields=["pair_key"], update_fields=_REQUEUE_FIELDS
+        )
+
+
+def enqueue_refinement(user_a: int, user_b: int) -> None:
+    """Queue (or re-queue) an LLM refinement for a canonical pair."""
+    enqueue_refinements([(user_a, user_b)])
+
+
+def _claimable(now) -> Q:
+    # due pending jobs, plus running jobs whose worker lease ran out
+    return (
+        Q(status=LLMRefinementJob.STATUS_PENDING, available_at__lte=now) |
+        Q(status=LLMRefinementJob.STATUS_RUNNING, locked_until__lte=now)
+    )
+
+
+def claim_jobs(limit: int, lease_seconds: float) -> List[Tuple[LLMRefinementJob, str]]:
+    """Claim up to ``limit`` due jobs with conditional updates (safe with several workers).
+
+    Returns (job, claim_token) pairs; the token must be passed back on completion.
+    """
+    now = timezone.now()
+    candidates = list(
+        LLMRefinementJob.objects.filter(_claimable(now)).order_by("available_at").values_list("pk", flat=True)[:limit]
+    )
+    claimed = []
+    for pk in candidates:
+        token = uuid.uuid4().hex
+        won = LLMRefinementJob.objects.filter(_claimable(now), pk=pk).update(
+            status=LLMRefinementJob.STATUS_RUNNING,
+            claim_token=token,
+            locked_until=now + timedelta(seconds=lease_seconds),
+            attempts=F("attempts") + 1,
+            updated_at=now,
+        )
+        if won:
+            claimed.append(token)
+    jobs = {job.claim_token: job for job in LLMRefinementJob.objects.filter(claim_token__in=claimed)}
+    return [(jobs[token], token) for token in claimed if token in jobs]
+
+
+def complete_job(job: LLMRefinementJob, token: str) -> None:
+    # No-op if the pair was re-enqueued meanwhile: the newer request stays pending
+    LLMRefinementJob.objects.filter(pk=job.pk, claim_token=token).delete()
+
+
+def fail_job(job: LLMRefinementJob, token: str, error: str, max_attempts: int) -> bool:
+    """Release a failed job for a later retry with backoff; returns True when it gave up."""
+    now = timezone.now()
+    gave_up = job.attempts >= max_attempts
+    LLMRefinementJob.objects.filter(pk=job.pk, claim_token=token).update(
+        status=LLMRefinementJob.STATUS_FAILED if gave_up else LLMRefinementJob.STATUS_PENDING,
+        available_at=now + timedelta(seconds=min(3600, 30 * (2 ** max(0, job.attempts - 1)))),
+        claim_token="",
+        locked_until=None,
+        last_error=error[:2000],
+        updated_at=now,
+    )
+    return gave_up
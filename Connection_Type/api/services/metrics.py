@@ -0,0 +1,224 @@
+"""Small in-process metrics registry rendered in the Prometheus text format.
+
+Each worker process keeps its own counters and histograms; scrape every worker
+(or aggregate in Prometheus) for fleet-wide numbers.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import threading
+import time
+
+# Seconds; covers sub-millisecond DB hits up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(f"{self.name}{_labels(self.labelnames, key)} {value}" for key, value in items)
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+inf last), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            cumulative += counts[-1]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+_metrics: Dict[str, object] = {}
+_collectors: List[Callable[[], List[str]]] = []
+_registry_lock = threading.Lock()
+
+
+def counter(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+    """Get or create a process-wide counter."""
+    with _registry_lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = Counter(name, documentation, labelnames)
+        return metric
+
+
+def histogram(name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    """Get or create a process-wide histogram."""
+    with _registry_lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = Histogram(name, documentation, labelnames, buckets)
+        return metric
+
+
+def register_collector(fn: Callable[[], List[str]]) -> None:
+    """Add a callback that renders extra exposition lines at scrape time."""
+    with _registry_lock:
+        if fn not in _collectors:
+            _collectors.append(fn)
+
+
+def render() -> str:
+    with _registry_lock:
+        metrics = [_metrics[name] for name in sorted(_metrics)]
+        collectors = list(_collectors)
+    lines: List[str] = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    for collect in collectors:
+        lines.extend(collect())
+    return "\n".join(lines) + "\n"
+
+
+# Pipeline metrics shared by the api and chatbot views
+STAGE_SECONDS = histogram(
+    "connection_stage_seconds", "Time spent per pipeline stage.", ("pipeline", "stage")
+)
+PAIR_CACHE = counter(
+    "connection_pair_cache_total", "Pair inference summary cache lookups.", ("result",)
+)
+STRATEGY = counter(
+    "connection_strategy_total", "Feature source used for a scored result.", ("pipeline", "strategy")
+)
+FALLBACKS = counter(
+    "connection_fallback_total", "LLM attempts that fell back to heuristic features.", ("pipeline", "reason")
+)
+
+
+# (pipeline, stage) -> seconds for the request being handled, inside request_stages()
+_request_totals: ContextVar[Optional[Dict[Tuple[str, str], float]]] = ContextVar("request_stage_totals", default=None)
+
+
+@contextmanager
+def stage(pipeline: str, name: str):
+    """Context manager timing one stage into connection_stage_seconds.
+
+    Inside ``request_stages()`` the time is added to the request's total for
+    that stage, so a stage entered several times is still observed once.
+    """
+    totals = _request_totals.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        if totals is None:
+            STAGE_SECONDS.observe(elapsed, pipeline=pipeline, stage=name)
+        else:
+            totals[(pipeline, name)] = totals.get((pipeline, name), 0.0) + elapsed
+
+
+@contextmanager
+def request_stages():
+    """Observe each stage entered in the block once, with its summed time (nested blocks join the outer one)."""
+    if _request_totals.get() is not None:
+        yield
+        return
+    totals: Dict[Tuple[str, str], float] = {}
+    token = _request_totals.set(totals)
+    try:
+        yield
+    finally:
+        _request_totals.reset(token)
+        for (pipeline, name), seconds in totals.items():
+            STAGE_SECONDS.observe(seconds, pipeline=pipeline, stage=name)
+
+
+# HELP text for the llm_service.resilience counters, keyed by counter name
+_LLM_COUNTER_HELP = {
+    "llm_calls": "LLM calls started on the request path (each retry counts).",
+    "llm_failures": "LLM calls that raised an error.",
+    "llm_slow_calls": "LLM calls that succeeded but took longer than LLM_SLOW_CALL_SECONDS.",
+    "llm_budget_misses": "LLM calls abandoned at the deadline; the caller answered from heuristics.",
+    "llm_short_circuits": "LLM calls skipped because the circuit breaker was open.",
+    "llm_saturated": "LLM calls skipped because every in-flight slot was taken.",
+    "llm_late_results": "LLM answers that arrived after a budget miss and were kept for later requests.",
+    "llm_breaker_opened": "Times the LLM circuit breaker opened.",
+}
+
+
+def _llm_resilience_lines() -> List[str]:
+    try:
+        from llm_service import resilience
+    except Exception:
+        return []
+    snapshot = resilience.snapshot()
+    state = snapshot.pop("llm_breaker_state", None)
+    lines: List[str] = []
+    for name, value in sorted(snapshot.items()):
+        metric = f"connection_{name}_total"
+        lines.append(f"# HELP {metric} {_LLM_COUNTER_HELP.get(name, 'LLM resilience counter.')}")
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}")
+    lines.append("# HELP connection_llm_breaker_state LLM circuit breaker state (1 for the current state).")
+    lines.append("# TYPE connection_llm_breaker_state gauge")
+    for candidate in ("closed", "open", "half_open"):
+        lines.append(f'connection_llm_breaker_state{{state="{candidate}"}} {int(candidate == state)}')
+    return lines
+
+
+register_collector(_llm_resilience_lines)
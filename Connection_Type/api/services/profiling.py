@@ -0,0 +1,86 @@
+"""On-disk store for request profiles written by ``api.middleware.RequestProfileMiddleware``.
+
+Each artifact is a ``pstats`` dump named ``<utc timestamp>_<method>_<path>_<ms>ms.prof``;
+only the newest PROFILE_KEEP files are kept.
+"""
+import cProfile
+import io
+import os
+import pstats
+import re
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+from django.conf import settings
+
+PROFILE_SUFFIX = ".prof"
+_unsafe = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+def profile_dir() -> Path:
+    return Path(getattr(settings, "PROFILE_DIR", Path(settings.BASE_DIR) / "profiles"))
+
+
+def _artifact_name(method: str, path: str, elapsed_ms: float) -> str:
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S.%f")
+    slug = _unsafe.sub("-", path.strip("/")).strip("-")[:60] or "root"
+    return f"{stamp}_{method.upper()}_{slug}_{int(elapsed_ms)}ms{PROFILE_SUFFIX}"
+
+
+def save_profile(profiler: cProfile.Profile, method: str, path: str, elapsed_ms: float) -> str:
+    """Dump ``profiler`` into the profile directory, prune old artifacts and return the file name."""
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    name = _artifact_name(method, path, elapsed_ms)
+    profiler.dump_stats(str(directory / name))
+    prune(int(getattr(settings, "PROFILE_KEEP", 50)))
+    return name
+
+
+def list_profiles() -> List[Dict]:
+    """Artifacts newest first: name, size in bytes and modification time."""
+    directory = profile_dir()
+    if not directory.is_dir():
+        return []
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.endswith(PROFILE_SUFFIX):
+            stat = entry.stat()
+            entries.append({
+                "name": entry.name,
+                "size": stat.st_size,
+                "modified": datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+            })
+    # Names start with a UTC timestamp, so they sort chronologically
+    entries.sort(key=lambda e: e["name"], reverse=True)
+    return entries
+
+
+def prune(keep: int) -> int:
+    """Delete all but the newest ``keep`` artifacts; returns how many were removed."""
+    removed = 0
+    for entry in list_profiles()[max(0, keep):]:
+        try:
+            (profile_dir() / entry["name"]).unlink()
+            removed += 1
+        except FileNotFoundError:
+            # Another worker pruned it first
+            pass
+    return removed
+
+
+def resolve(name: str) -> Optional[Path]:
+    """Path of the artifact called ``name`` (or the newest for "latest"); None when missing."""
+    if name == "latest":
+        entries = list_profiles()
+        return profile_dir() / entries[0]["name"] if entries else None
+    candidate = profile_dir() / Path(name).name
+    return candidate if candidate.is_file() else None
+
+
+def top_entries(path: Path, sort: str = "cumulative", limit: int = 25) -> str:
+    """The ``pstats`` report for the top ``limit`` functions of one artifact."""
+    out = io.StringIO()
+    stats = pstats.Stats(str(path), stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
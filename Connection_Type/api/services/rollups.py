@@ -0,0 +1,188 @@
+"""Incremental maintenance of UserConnectionRollup from ConversationSummary writes.
+
+Every code path that creates a summary or changes its connection_type or
+confidence reports ``(user_a, user_b, old, new)``, where old/new are
+``(connection_type, confidence)`` or None; deletes are reported by a
+post_delete receiver. Deltas are summed per user and
+applied with F() + CASE expressions, then dominant_type is recomputed from the
+stored counts.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Tuple
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.lookups import GreaterThan, GreaterThanOrEqual
+from django.utils import timezone
+from ..constants import CONNECTION_TYPE_KEYS
+from ..models import ConversationSummary, UserConnectionRollup
+
+SummaryState = Optional[Tuple[str, float]]
+Change = Tuple[int, int, SummaryState, SummaryState]
+
+
+def _count_field(connection_type: str) -> str:
+    return f"{connection_type.lower()}_count"
+
+
+def _sum_field(connection_type: str) -> str:
+    return f"{connection_type.lower()}_confidence_sum"
+
+
+def _delta(old: SummaryState, new: SummaryState) -> Dict[str, float]:
+    delta: Dict[str, float] = defaultdict(float)
+    for state, sign in ((old, -1), (new, 1)):
+        if state is None:
+            continue
+        connection_type, confidence = state
+        delta["pair_count"] += sign
+        if connection_type in CONNECTION_TYPE_KEYS:
+            delta[_count_field(connection_type)] += sign
+            delta[_sum_field(connection_type)] += sign * float(confidence)
+    return {field: value for field, value in delta.items() if value}
+
+
+def _dominant_expression(counts: Dict[str, object]) -> Case:
+    """CASE picking the type with the highest count; earlier types win ties, no pairs gives NULL."""
+    whens = []
+    for i, connection_type in enumerate(CONNECTION_TYPE_KEYS):
+        mine = counts[connection_type]
+        conditions = [GreaterThan(mine, 0)]
+        for j, other in enumerate(CONNECTION_TYPE_KEYS):
+            if j < i:
+                conditions.append(GreaterThan(mine, counts[other]))
+            elif j > i:
+                conditions.append(GreaterThanOrEqual(mine, counts[other]))
+        whens.append(When(Q(*conditions), then=Value(connection_type)))
+    return Case(*whens, default=Value(None))
+
+
+# Users per UPDATE statement; each user adds two parameters per changed column
+_UPDATE_CHUNK = 100
+
+
+def _apply_deltas(per_user: Dict[int, Dict[str, float]]) -> None:
+    """Add each user's delta with one CASE-per-column UPDATE per chunk of users."""
+    now = timezone.now()
+    user_ids = list(per_user)
+    fields = sorted({field for delta in per_user.values() for field in delta})
+    counts = {t: F(_count_field(t)) for t in CONNECTION_TYPE_KEYS}
+    for start in range(0, len(user_ids), _UPDATE_CHUNK):
+        chunk = user_ids[start:start + _UPDATE_CHUNK]
+        updates = {}
+        for field in fields:
+            is_sum = field.endswith("_sum")
+            whens = [
+                When(user_id=user_id, then=Value(per_user[user_id][field] if is_sum else int(per_user[user_id][field])))
+                for user_id in chunk
+                if per_user[user_id].get(field)
+            ]
+            if whens:
+                updates[field] = F(field) + Case(*whens, default=Value(0.0 if is_sum else 0))
+        rows = UserConnectionRollup.objects.filter(user_id__in=chunk)
+        rows.update(updated_at=now, **updates)
+        # Right-hand sides read the pre-update row, so dominance is recomputed once the new counts are stored
+        rows.update(dominant_type=_dominant_expression(counts))
+
+
+def apply_summary_changes(changes: Iterable[Change]) -> None:
+    """Fold summary changes into the rollups of every user involved (two UPDATEs per 100 users)."""
+    per_user: Dict[int, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for user_a, user_b, old, new in changes:
+        delta = _delta(old, new)
+        if not delta:
+            continue
+        for user_id in {user_a, user_b}:
+            for field, value in delta.items():
+                per_user[user_id][field] += value
+    # Users whose changes cancelled out are left alone
+    per_user = {
+        user_id: {field: value for field, value in delta.items() if value}
+        for user_id, delta in per_user.items()
+        if any(delta.values())
+    }
+    if not per_user:
+        return
+
+    # No savepoint: callers already run inside the transaction that wrote the summary
+    with transaction.atomic(savepoint=False):
+        UserConnectionRollup.objects.bulk_create(
+            [UserConnectionRollup(user_id=user_id) for user_id in per_user], ignore_conflicts=True
+        )
+        _apply_deltas(per_user)
+
+
+def record_summary_change(user_a: int, user_b: int, old: SummaryState, new: SummaryState) -> None:
+    """Rollup update for one summary write; a no-op when type and confidence are unchanged."""
+    if old == new:
+        return
+    apply_summary_changes([(user_a, user_b, old, new)])
+
+
+def _on_summary_deleted(sender, instance, **kwargs) -> None:
+    """post_delete receiver: take a deleted summary out of both users' rollups."""
+    record_summary_change(instance.user_a_id, instance.user_b_id, (instance.connection_type, instance.confidence), None)
+
+
+def get_rollup(user_id: int) -> Dict:
+    """The user's rollup as a response dict (zeros when the user has no summaries yet)."""
+    row = UserConnectionRollup.objects.filter(user_id=user_id).first()
+    types = {}
+    for connection_type in CONNECTION_TYPE_KEYS:
+        count = getattr(row, _count_field(connection_type), 0) if row else 0
+        total = getattr(row, _sum_field(connection_type), 0.0) if row else 0.0
+        types[connection_type] = {
+            "count": count,
+            "mean_confidence": round(total / count, 2) if count else None,
+        }
+    return {
+        "user_id": user_id,
+        "pair_count": row.pair_count if row else 0,
+        "dominant_type": row.dominant_type if row else None,
+        "types": types,
+        "updated_at": row.updated_at if row else None,
+    }
+
+
+def rebuild_rollups() -> int:
+    """Recompute every rollup from ConversationSummary; returns the number of users written."""
+    totals: Dict[int, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for side in ("user_a_id", "user_b_id"):
+        rows = (
+            ConversationSummary.objects.values(side, "connection_type")
+            .annotate(n=Count("id"), confidence=Sum("confidence"))
+            .order_by()
+        )
+        for r in rows:
+            entry = totals[r[side]]
+            entry["pair_count"] += r["n"]
+            if r["connection_type"] in CONNECTION_TYPE_KEYS:
+                entry[_count_field(r["connection_type"])] += r["n"]
+                entry[_sum_field(r["connection_type"])] += r["confidence"] or 0.0
+    # A pair of a user with themself appears on both sides but is one pair
+    for r in (
+        ConversationSummary.objects.filter(user_a_id=F("user_b_id"))
+        .values("user_a_id", "connection_type")
+        .annotate(n=Count("id"), confidence=Sum("confidence"))
+        .order_by()
+    ):
+        entry = totals[r["user_a_id"]]
+        entry["pair_count"] -= r["n"]
+        if r["connection_type"] in CONNECTION_TYPE_KEYS:
+            entry[_count_field(r["connection_type"])] -= r["n"]
+            entry[_sum_field(r["connection_type"])] -= r["confidence"] or 0.0
+
+    objs = []
+    for user_id, entry in totals.items():
+        counts = {t: int(entry[_count_field(t)]) for t in CONNECTION_TYPE_KEYS}
+        best = max(CONNECTION_TYPE_KEYS, key=lambda t: (counts[t], -CONNECTION_TYPE_KEYS.index(t)))
+        objs.append(UserConnectionRollup(
+            user_id=user_id,
+            pair_count=int(entry["pair_count"]),
+            dominant_type=best if counts[best] > 0 else None,
+            **{_count_field(t): counts[t] for t in CONNECTION_TYPE_KEYS},
+            **{_sum_field(t): entry[_sum_field(t)] for t in CONNECTION_TYPE_KEYS},
+        ))
+    with transaction.atomic():
+        UserConnectionRollup.objects.all().delete()
+        UserConnectionRollup.objects.bulk_create(objs, batch_size=1000)
+    return len(objs)
@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple, Optional, Tuple
+import threading
+import time
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+from ..models import SessionMapping
+
+
+class SessionRecord(NamedTuple):
+    custom_session_id: str
+    session_key: str
+    user_email: str
+    expire_date: datetime
+
+
+# Small per-process cache: custom_session_id -> (record, monotonic deadline)
+_cache: "OrderedDict[str, Tuple[SessionRecord, float]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_ttl() -> float:
+    return float(getattr(settings, "SESSION_LOOKUP_CACHE_TTL", 60))
+
+
+def _cache_size() -> int:
+    return int(getattr(settings, "SESSION_LOOKUP_CACHE_SIZE", 1024))
+
+
+def _cache_put(record: SessionRecord) -> None:
+    ttl = _cache_ttl()
+    if ttl <= 0:
+        return
+    with _cache_lock:
+        _cache[record.custom_session_id] = (record, time.monotonic() + ttl)
+        _cache.move_to_end(record.custom_session_id)
+        while len(_cache) > _cache_size():
+            _cache.popitem(last=False)
+
+
+def _cache_get(custom_session_id: str) -> Optional[SessionRecord]:
+    with _cache_lock:
+        entry = _cache.get(custom_session_id)
+        if entry is None:
+            return None
+        record, deadline = entry
+        if deadline <= time.monotonic() or record.expire_date <= timezone.now():
+            del _cache[custom_session_id]
+            return None
+        return record
+
+
+def invalidate_session(custom_session_id: Optional[str] = None, session_key: Optional[str] = None) -> None:
+    """Drop cached entries by custom id and/or Django session key."""
+    with _cache_lock:
+        if custom_session_id is not None:
+            _cache.pop(custom_session_id, None)
+        if session_key is not None:
+            stale = [k for k, (r, _) in _cache.items() if r.session_key == session_key]
+            for k in stale:
+                del _cache[k]
+
+
+def register_session(custom_session_id: str, session_key: str, user_email: str, expire_date: datetime) -> SessionRecord:
+    """Write the custom id -> session mapping (called by /set_email/)."""
+    SessionMapping.objects.update_or_create(
+        custom_session_id=custom_session_id,
+        defaults={"session_id": session_key, "user_email": user_email},
+    )
+    record = SessionRecord(custom_session_id, session_key, user_email, expire_date)
+    _cache_put(record)
+    return record
+
+
+def lookup_session(custom_session_id: str) -> Optional[SessionRecord]:
+    """Resolve a custom session id to its live session via the indexed mapping.
+
+    Returns None when the id is unknown or the underlying session has expired.
+    """
+    if not custom_session_id:
+        return None
+    record = _cache_get(custom_session_id)
+    if record is not None:
+        return record
+
+    row = SessionMapping.objects.filter(
+        custom_session_id=custom_session_id,
+        session__expire_date__gt=timezone.now(),
+    ).values("session_id", "user_email", "session__expire_date").first()
+    if not row:
+        return None
+    record = SessionRecord(custom_session_id, row["session_id"], row["user_email"], row["session__expire_date"])
+    _cache_put(record)
+    return record
+
+
+def get_session_by_custom_id(custom_session_id: str):
+    """Return (Session, decoded_data) for a custom session id, or (None, None).
+
+    Only the single matching session row is loaded and decoded.
+    """
+    record = lookup_session(custom_session_id)
+    if record is None:
+        return None, None
+    session = Session.objects.filter(session_key=record.session_key, expire_date__gt=timezone.now()).first()
+    if session is None:
+        invalidate_session(custom_session_id)
+        return None, None
+    return session, session.get_decoded()
+
+
+def _on_session_deleted(sender, instance, **kwargs):
+    # clearsessions / logout remove the row; the mapping cascades, drop the cache entry too
+    invalidate_session(session_key=instance.session_key)
@@ -0,0 +1,237 @@
+"""In-memory nearest-neighbour index over ConversationSummary feature vectors.
+
+The index is loaded on first use and refreshed incrementally from ``updated_at``
+(at most every SIMILARITY_INDEX_REFRESH_SECONDS). Deleted summaries are only
+dropped by the periodic full reload (SIMILARITY_INDEX_RELOAD_SECONDS).
+Each worker process holds its own copy: about 60 bytes of arrays per pair plus
+its pair_key.
+"""
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Sequence
+import logging
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from ..constants import CONNECTION_TYPE_KEYS, FEATURE_KEYS
+from ..models import ConversationSummary
+
+METRICS = ("cosine", "l2")
+
+# Rows committed late with an older updated_at (clock skew between workers,
+# long transactions) are still picked up by re-reading this much history
+_REFRESH_OVERLAP = timedelta(seconds=30)
+_LOAD_CHUNK = 10000
+_TYPE_CODES = {name: code for code, name in enumerate(CONNECTION_TYPE_KEYS)}
+
+log = logging.getLogger("api")
+
+
+class FeatureIndex:
+    """Feature matrix plus per-row pair_key, connection type and confidence.
+
+    Vectors are stored column-major (one contiguous array per feature), which
+    makes the per-query dot products several times faster than row-major.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._loaded = False
+        self._size = 0
+        self._keys: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._vectors = np.empty((len(FEATURE_KEYS), 0), dtype=np.float32)
+        self._unit = np.empty_like(self._vectors)
+        self._sq_norms = np.empty(0, dtype=np.float32)
+        self._types = np.empty(0, dtype=np.int8)
+        self._confidence = np.empty(0, dtype=np.float32)
+        self._watermark = None
+        self._refreshed_at = 0.0
+        self._reloaded_at = 0.0
+
+    def __len__(self) -> int:
+        return self._size
+
+    # -- loading -----------------------------------------------------------
+
+    def _reserve(self, needed: int) -> None:
+        capacity = self._vectors.shape[-1]
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+
+        def grow(arr: np.ndarray) -> np.ndarray:
+            out = np.zeros(arr.shape[:-1] + (capacity,), dtype=arr.dtype)
+            out[..., : self._size] = arr[..., : self._size]
+            return out
+
+        self._vectors = grow(self._vectors)
+        self._unit = grow(self._unit)
+        self._sq_norms = grow(self._sq_norms)
+        self._types = grow(self._types)
+        self._confidence = grow(self._confidence)
+
+    def _apply(self, rows: Sequence[tuple]) -> None:
+        """Upsert ``(pair_key, updated_at, type, confidence, *features)`` rows."""
+        if not rows:
+            return
+        rows_idx = np.empty(len(rows), dtype=np.int64)
+        for i, row in enumerate(rows):
+            pos = self._positions.get(row[0])
+            if pos is None:
+                pos = self._size
+                self._reserve(pos + 1)
+                self._positions[row[0]] = pos
+                self._keys.append(row[0])
+                self._size += 1
+            rows_idx[i] = pos
+            if self._watermark is None or row[1] > self._watermark:
+                self._watermark = row[1]
+
+        vectors = np.array([row[4:] for row in rows], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1)
+        self._vectors[:, rows_idx] = vectors.T
+        self._sq_norms[rows_idx] = norms ** 2
+        # All-zero vectors get a zero unit vector (cosine similarity 0 to everything)
+        self._unit[:, rows_idx] = (vectors / np.where(norms > 0, norms, 1.0)[:, None]).T
+        self._types[rows_idx] = [_TYPE_CODES.get(row[2], -1) for row in rows]
+        self._confidence[rows_idx] = [row[3] for row in rows]
+
+    def _load(self, since=None) -> int:
+        qs = ConversationSummary.objects.all()
+        if since is not None:
+            qs = qs.filter(updated_at__gte=since - _REFRESH_OVERLAP)
+        qs = qs.values_list("pair_key", "updated_at", "connection_type", "confidence", *FEATURE_KEYS)
+        loaded = 0
+        batch = []
+        for row in qs.iterator(chunk_size=_LOAD_CHUNK):
+            batch.append(row)
+            if len(batch) >= _LOAD_CHUNK:
+                self._apply(batch)
+                loaded += len(batch)
+                batch = []
+        self._apply(batch)
+        return loaded + len(batch)
+
+    def reload(self) -> None:
+        """Rebuild from scratch (drops summaries deleted since the last reload).
+
+        The new arrays are built outside the query lock and swapped in, so
+        queries keep using the old copy while a large reload runs.
+        """
+        started = time.perf_counter()
+        fresh = FeatureIndex()
+        fresh._load()
+        with self._lock:
+            self._size, self._keys, self._positions = fresh._size, fresh._keys, fresh._positions
+            self._vectors, self._unit, self._sq_norms = fresh._vectors, fresh._unit, fresh._sq_norms
+            self._types, self._confidence, self._watermark = fresh._types, fresh._confidence, fresh._watermark
+            self._loaded = True
+            self._refreshed_at = self._reloaded_at = time.monotonic()
+        log.info("similarity-index reload rows=%s ms=%.1f", fresh._size, (time.perf_counter() - started) * 1000)
+
+    def _due(self, last: float, setting: str, default: float) -> bool:
+        every = float(getattr(settings, setting, default))
+        return every >= 0 and time.monotonic() - last >= every
+
+    def refresh(self, force: bool = False) -> None:
+        """Load lazily, then apply rows changed since the last refresh (throttled unless ``force``)."""
+        if not self._loaded or self._due(self._reloaded_at, "SIMILARITY_INDEX_RELOAD_SECONDS", 3600):
+            with self._reload_lock:
+                # Another thread may have reloaded while this one waited
+                if not self._loaded or self._due(self._reloaded_at, "SIMILARITY_INDEX_RELOAD_SECONDS", 3600):
+                    self.reload()
+                    return
+        if not force and not self._due(self._refreshed_at, "SIMILARITY_INDEX_REFRESH_SECONDS", 5):
+            return
+        with self._lock:
+            if not force and not self._due(self._refreshed_at, "SIMILARITY_INDEX_REFRESH_SECONDS", 5):
+                return
+            self._load(since=self._watermark)
+            self._refreshed_at = time.monotonic()
+
+    # -- queries -----------------------------------------------------------
+
+    def vector_for(self, pair_key: str) -> Optional[np.ndarray]:
+        self.refresh()
+        with self._lock:
+            pos = self._positions.get(pair_key)
+            return None if pos is None else self._vectors[:, pos].copy()
+
+    def query(self, vector: Iterable[float], k: int = 10, metric: str = "cosine",
+              connection_types: Optional[Iterable[str]] = None, exclude: Optional[str] = None) -> List[Dict]:
+        """Top ``k`` pairs closest to ``vector``: [{pair_key, connection_type, confidence, score}].
+
+        ``score`` is the cosine similarity (higher is closer) or the L2 distance (lower is closer).
+        """
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {METRICS}")
+        q = np.asarray(list(vector), dtype=np.float32)
+        if q.shape != (len(FEATURE_KEYS),):
+            raise ValueError(f"vector must have {len(FEATURE_KEYS)} components")
+        if not np.isfinite(q).all():
+            raise ValueError("vector components must be finite")
+        self.refresh()
+
+        with self._lock:
+            n = self._size
+            keys = self._keys
+            if metric == "cosine":
+                norm = float(np.linalg.norm(q))
+                order = -((q / norm if norm > 0 else q) @ self._unit[:, :n])
+            else:
+                # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2, without materialising x - q
+                order = self._sq_norms[:n] - 2.0 * (q @ self._vectors[:, :n]) + float(q @ q)
+
+            # Filtered-out rows sort last instead of being gathered into a copy
+            if connection_types:
+                types = self._types[:n]
+                keep = np.zeros(n, dtype=bool)
+                for code in {_TYPE_CODES[t] for t in connection_types if t in _TYPE_CODES}:
+                    keep |= types == code
+                order[~keep] = np.inf
+            if exclude is not None and exclude in self._positions:
+                order[self._positions[exclude]] = np.inf
+
+            k = min(max(k, 0), n)
+            if k == 0:
+                return []
+            rows = np.argpartition(order, k - 1)[:k]
+            rows = rows[np.argsort(order[rows], kind="stable")]
+            rows = rows[np.isfinite(order[rows])]
+            types = self._types[rows]
+            confidence = self._confidence[rows]
+            picked = order[rows]
+        scores = -picked if metric == "cosine" else np.sqrt(np.maximum(picked, 0.0))
+
+        return [
+            {
+                "pair_key": keys[pos],
+                "connection_type": CONNECTION_TYPE_KEYS[code] if code >= 0 else None,
+                "confidence": round(float(conf), 4),
+                "score": round(float(score), 6),
+            }
+            for pos, code, conf, score in zip(rows.tolist(), types.tolist(), confidence.tolist(), scores.tolist())
+        ]
+
+
+_index = FeatureIndex()
+
+
+def get_index() -> FeatureIndex:
+    return _index
+
+
+def similar_pairs(pair_key: Optional[str] = None, vector: Optional[Iterable[float]] = None, k: int = 10,
+                  metric: str = "cosine", connection_types: Optional[Iterable[str]] = None) -> Optional[List[Dict]]:
+    """Nearest pairs to an indexed ``pair_key`` (excluding itself) or to a raw ``vector``.
+
+    Returns None when ``pair_key`` is not indexed.
+    """
+    index = get_index()
+    if pair_key is not None:
+        vector = index.vector_for(pair_key)
+        if vector is None:
+            return None
+    return index.query(vector, k=k, metric=metric, connection_types=connection_types, exclude=pair_key)
@@ -0,0 +1,110 @@
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Callable, Dict, TypeVar
+import logging
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from ..models import PairLock
+
+T = TypeVar("T")
+
+_log = logging.getLogger("api")
+
+
+def _wait_seconds() -> float:
+    return float(getattr(settings, "PAIR_LOCK_WAIT_SECONDS", 30))
+
+
+def _lease_seconds() -> float:
+    return float(getattr(settings, "PAIR_LOCK_LEASE_SECONDS", 120))
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# key -> computation currently running in this process
+_flights: Dict[str, _Flight] = {}
+_flights_lock = threading.Lock()
+
+
+def _try_acquire(key: str, owner: str) -> bool:
+    now = timezone.now()
+    # Take over a lease left behind by a crashed or stuck worker
+    PairLock.objects.filter(pair_key=key, expires_at__lte=now).delete()
+    try:
+        with transaction.atomic():
+            PairLock.objects.create(pair_key=key, owner=owner, expires_at=now + timedelta(seconds=_lease_seconds()))
+        return True
+    except IntegrityError:
+        return False
+
+
+@contextmanager
+def pair_lock(key: str, wait: float = None):
+    """Hold the cross-process lock row for ``key``.
+
+    Yields True when the lock was acquired and False when it was still held by
+    another worker after ``wait`` seconds; callers then proceed unlocked.
+    """
+    wait = _wait_seconds() if wait is None else wait
+    owner = uuid.uuid4().hex
+    deadline = time.monotonic() + wait
+    delay = 0.05
+    acquired = _try_acquire(key, owner)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+        delay = min(delay * 2, 0.25)
+        acquired = _try_acquire(key, owner)
+    if not acquired:
+        _log.warning("single-flight lock wait timed out key=%s after %.1fs; proceeding", key, wait)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            PairLock.objects.filter(pair_key=key, owner=owner).delete()
+
+
+def single_flight(key: str, fn: Callable[[], T], wait: float = None) -> T:
+    """Run ``fn`` once per ``key`` across concurrent callers.
+
+    Within a process, duplicates block on the running call and share its result
+    (or exception). Across processes the leader holds a PairLock row, so ``fn``
+    must re-check persisted state: a caller that waited on another process's
+    lock runs ``fn`` after that process has written its result. A caller that
+    waits longer than ``wait`` seconds stops waiting and runs ``fn`` itself.
+    """
+    wait = _wait_seconds() if wait is None else wait
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight()
+            _flights[key] = flight
+
+    if not leader:
+        if flight.done.wait(wait):
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        _log.warning("single-flight wait timed out key=%s after %.1fs; computing", key, wait)
+        return fn()
+
+    try:
+        with pair_lock(key, wait):
+            flight.result = fn()
+        return flight.result
+    except BaseException as exc:
+        flight.error = exc
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.done.set()
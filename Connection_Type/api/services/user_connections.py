@@ -0,0 +1,94 @@
+"""Keyset-paginated listing of a user's ConversationSummary rows, newest first.
+
+A user can be either side of a pair, so each page runs one query per side
+(served by the (user_x_id, -last_message_at, -id) indexes) and merges them.
+The cursor is the (last_message_at, id) of the last row returned; no OFFSET.
+"""
+import base64
+import binascii
+import heapq
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.db.models import Q
+from ..models import ConversationSummary
+
+_FIELDS = (
+    "id",
+    "pair_key",
+    "user_a_id",
+    "user_b_id",
+    "connection_type",
+    "confidence",
+    "message_count",
+    "last_message_at",
+    "provisional",
+)
+
+Cursor = Tuple[datetime, int]
+
+
+def encode_cursor(last_message_at: datetime, pk: int) -> str:
+    raw = f"{last_message_at.isoformat()}|{pk}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Inverse of encode_cursor; raises ValueError for anything it did not produce."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        stamp, _, pk = raw.rpartition("|")
+        last_message_at = datetime.fromisoformat(stamp)
+        if last_message_at.tzinfo is None:
+            # encode_cursor always writes an offset; a naive stamp was edited by hand
+            raise ValueError(stamp)
+        return last_message_at, int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor.")
+
+
+def _side_page(side: str, user_id: int, limit: int, after: Optional[Cursor],
+               connection_types: Optional[Iterable[str]], min_confidence: Optional[float]) -> List[Dict]:
+    qs = ConversationSummary.objects.filter(**{side: user_id})
+    if side == "user_b_id":
+        # A pair with oneself is already returned by the user_a side
+        qs = qs.exclude(user_a_id=user_id)
+    if after is not None:
+        last_message_at, pk = after
+        qs = qs.filter(Q(last_message_at__lt=last_message_at) | Q(last_message_at=last_message_at, id__lt=pk))
+    if connection_types:
+        qs = qs.filter(connection_type__in=list(connection_types))
+    if min_confidence is not None:
+        qs = qs.filter(confidence__gte=min_confidence)
+    return list(qs.order_by("-last_message_at", "-id").values(*_FIELDS)[:limit])
+
+
+def list_user_connections(user_id: int, limit: int = 50, cursor: Optional[str] = None,
+                          connection_types: Optional[Iterable[str]] = None,
+                          min_confidence: Optional[float] = None) -> Tuple[List[Dict], Optional[str]]:
+    """One page of the user's pairs and the cursor for the next page (None on the last page)."""
+    after = decode_cursor(cursor) if cursor else None
+    # One extra row per side tells whether another page exists
+    sides = [
+        _side_page(side, user_id, limit + 1, after, connection_types, min_confidence)
+        for side in ("user_a_id", "user_b_id")
+    ]
+    merged = list(heapq.merge(*sides, key=lambda r: (r["last_message_at"], r["id"]), reverse=True))
+    page = merged[:limit]
+    next_cursor = None
+    if len(merged) > limit and page:
+        last = page[-1]
+        next_cursor = encode_cursor(last["last_message_at"], last["id"])
+
+    results = [
+        {
+            "pair_key": r["pair_key"],
+            "partner_id": r["user_b_id"] if r["user_a_id"] == user_id else r["user_a_id"],
+            "connection_type": r["connection_type"],
+            "confidence": r["confidence"],
+            "message_count": r["message_count"],
+            "last_message_at": r["last_message_at"],
+            "provisional": r["provisional"],
+        }
+        for r in page
+    ]
+    return results, next_cursor
@@ -0,0 +1,779 @@
+import base64
+from datetime import timedelta
+from io import StringIO
+import threading
+import time
+from unittest import mock
+import numpy as np
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+from benchmarks.query_budgets import DEFAULT_CONTEXT, QUERY_BUDGETS, run_scenarios
+from benchmarks.stub_llm import stub_llm
+from benchmarks.suite import BenchContext, isolated_database
+from benchmarks.synthetic import SyntheticGenerator
+from llm_service import resilience
+from .constants import CONNECTION_TYPE_KEYS, FEATURE_KEYS
+from .feature_extraction import extract_feature_counts, extract_features, features_from_counts, merge_feature_counts
+from .logic import connection_type_scores_batch, connection_type_scores_raw
+from .models import ConversationMessage, ConversationSummary, PairLock, PostsComment, UserConnectionRollup
+from .serializers import SimilarPairsQuerySerializer
+from .services import inference, metrics, single_flight
+from .services.inference import infer_pair_connection
+from .services.sessions import invalidate_session, register_session
+from .services.user_connections import encode_cursor
+from .views import AnalyzePairFromDB, AnalyzePairsBatch, UserConnectionRollupView, UserConnections
+
+
+def _scalar(rows):
+    scores, labels = [], []
+    for row in rows:
+        by_type = connection_type_scores_raw(dict(zip(FEATURE_KEYS, row)))
+        scores.append([by_type[k] for k in CONNECTION_TYPE_KEYS])
+        labels.append(max(by_type, key=by_type.get))
+    return np.array(scores), labels
+
+
+class ConnectionTypeScoresBatchTests(TestCase):
+    """connection_type_scores_batch must match connection_type_scores_raw exactly."""
+
+    def assertMatchesScalar(self, rows):
+        rows = [list(map(float, row)) for row in rows]
+        expected_scores, expected_labels = _scalar(rows)
+        scores, labels = connection_type_scores_batch(np.array(rows))
+        np.testing.assert_array_equal(scores, expected_scores)
+        self.assertEqual(labels, expected_labels)
+        # The list-of-dicts input path gives the same answer
+        dict_scores, dict_labels = connection_type_scores_batch([dict(zip(FEATURE_KEYS, r)) for r in rows])
+        np.testing.assert_array_equal(dict_scores, expected_scores)
+        self.assertEqual(dict_labels, expected_labels)
+
+    def test_random_rows(self):
+        rng = np.random.default_rng(20240601)
+        self.assertMatchesScalar(rng.random((5000, len(FEATURE_KEYS))).tolist())
+
+    def test_rows_on_rule_thresholds(self):
+        # Values sitting exactly on (and just around) every comparison in the scoring rules
+        edges = [0.0, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 1.0]
+        edges += [e + d for e in edges for d in (-1e-9, 1e-9) if 0.0 <= e + d <= 1.0]
+        rng = np.random.default_rng(7)
+        self.assertMatchesScalar(rng.choice(edges, size=(5000, len(FEATURE_KEYS))).tolist())
+
+    def test_boundary_rows(self):
+        n = len(FEATURE_KEYS)
+        rows = [
+            [0.0] * n,
+            [1.0] * n,
+            [0.5] * n,
+            # out-of-range inputs are clamped to [0, 1] by both versions
+            [-1.0] * n,
+            [2.0] * n,
+        ]
+        rows += [[1.0 if i == j else 0.0 for i in range(n)] for j in range(n)]
+        self.assertMatchesScalar(rows)
+
+    def test_ties_pick_the_first_type(self):
+        # All-zero features clamp several types to the same score; both pick the earliest key
+        scores, labels = connection_type_scores_batch(np.zeros((1, len(FEATURE_KEYS))))
+        by_type = connection_type_scores_raw({})
+        self.assertEqual(labels, [max(by_type, key=by_type.get)])
+        top = scores[0].max()
+        self.assertEqual(labels[0], CONNECTION_TYPE_KEYS[int(np.flatnonzero(scores[0] == top)[0])])
+
+    def test_empty_input(self):
+        scores, labels = connection_type_scores_batch([])
+        self.assertEqual(scores.shape, (0, len(CONNECTION_TYPE_KEYS)))
+        self.assertEqual(labels, [])
+
+
+class UnmanagedTablesMixin:
+    """Create the unmanaged message and post tables for a TestCase class.
+
+    They are created before TestCase opens its class-wide atomic block, since
+    SQLite cannot alter the schema inside one; each test's rows roll back.
+    """
+
+    unmanaged = (ConversationMessage, PostsComment)
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            for model in cls.unmanaged:
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in cls.unmanaged:
+                editor.delete_model(model)
+
+
+def _add_conversation(user_a, user_b, length, seed=1, start=None):
+    """Insert a synthetic conversation between two users and return its rows."""
+    start = start or timezone.now() - timedelta(days=10)
+    rows = SyntheticGenerator(seed=seed).conversation(user_a, user_b, length, start)
+    ConversationMessage.objects.bulk_create(ConversationMessage(**r) for r in rows)
+    return rows
+
+
+_NEUTRAL = [
+    "We walked along the river and talked about the weather for a while.",
+    "The train was late again so I read a book on the platform.",
+    "Did you see the game on Sunday? The second half was slow.",
+]
+
+# Each conversation is its signal messages followed by _NEUTRAL * 8
+_GOLDEN_CORPUS = {
+    "romantic": [
+        "I miss you, darling! Our sunset dinner was so romantic.",
+        "i miss you too babe xoxo, can't wait for our anniversary getaway",
+        "Lovely memories, you make me smile and laugh.",
+    ],
+    "spiritual": [
+        "We will pray for you at church tonight, God bless.",
+        "Thank you, my faith keeps me grateful. Meditation helps my soul.",
+        "Blessed to have you; the divine is kind.",
+    ],
+    "professional": [
+        "Dear Mr Smith, please find the status report attached.",
+        "Kindly schedule the project meeting before the deadline. Regards",
+        "The KPI workstream sync is on the todo list; best, Sam",
+    ],
+    "intense": [
+        "This is AMAZING!!! I love it",
+        "That was TERRIBLE, an awful disaster, I hate it!",
+        "URGENT: the critical fix isn't done, I'm furious!",
+    ],
+    # Non-ASCII letters, digits and underscores inside words, phrases across whitespace
+    "edge": [
+        "café love2 hello_world don't ÉTÉ",
+        "lovelovelove o'clock 'quoted' WONT",
+        "",
+        "!!!",
+        "I  MISS\nYOU, miss yourself",
+    ],
+}
+
+# Output of the original per-lexicon tokenizer implementation on _GOLDEN_CORPUS
+_GOLDEN_FEATURES = {
+    "romantic": {"emotional_warmth": 0.0, "romantic_language": 1.0, "spiritual_reference": 0.0,
+                 "task_focus": 0.0, "formality": 0.0, "emotional_intensity": 0.037},
+    "spiritual": {"emotional_warmth": 0.1875, "romantic_language": 0.0, "spiritual_reference": 0.6923,
+                  "task_focus": 0.0, "formality": 0.0, "emotional_intensity": 0.0},
+    "professional": {"emotional_warmth": 0.0, "romantic_language": 0.0, "spiritual_reference": 0.0,
+                     "task_focus": 1.0, "formality": 0.5455, "emotional_intensity": 0.0185},
+    "intense": {"emotional_warmth": 0.0, "romantic_language": 0.0769, "spiritual_reference": 0.0,
+                "task_focus": 0.0, "formality": 0.0, "emotional_intensity": 0.5741},
+    "edge": {"emotional_warmth": 0.0, "romantic_language": 0.25, "spiritual_reference": 0.0,
+             "task_focus": 0.0, "formality": 0.0, "emotional_intensity": 0.1897},
+    "mixed": {"emotional_warmth": 0.1429, "romantic_language": 1.0, "spiritual_reference": 0.5294,
+              "task_focus": 1.0, "formality": 0.41, "emotional_intensity": 0.5488},
+}
+
+
+class ExtractFeaturesGoldenTests(TestCase):
+    """extract_features keeps returning the original implementation's values."""
+
+    def test_golden_corpus(self):
+        for name, texts in _GOLDEN_CORPUS.items():
+            with self.subTest(name):
+                messages = [{"sender": "User 1", "text": t} for t in texts + _NEUTRAL * 8]
+                self.assertEqual(extract_features(messages), _GOLDEN_FEATURES[name])
+
+    def test_mixed_conversation(self):
+        messages = [{"sender": "User 1", "text": t} for texts in _GOLDEN_CORPUS.values() for t in texts]
+        messages += [{"sender": "User 2", "text": t} for t in _NEUTRAL * 8]
+        self.assertEqual(extract_features(messages), _GOLDEN_FEATURES["mixed"])
+
+
+def _register_session(test, sid, email="someone@example.com"):
+    """Register ``sid`` as a /set_email/ session for the duration of ``test``."""
+    store = SessionStore()
+    store["user_email"] = email
+    store.create()
+    register_session(sid, store.session_key, email, store.get_expiry_date())
+    test.addCleanup(invalidate_session, sid)
+    return sid
+
+
+class QueryBudgetTests(TransactionTestCase):
+    """Every endpoint in benchmarks.query_budgets stays within its query budget."""
+
+    # The message and post tables are unmanaged, so the test database lacks them.
+    # TransactionTestCase because SQLite cannot alter the schema inside the atomic block TestCase uses.
+    unmanaged = (ConversationMessage, PostsComment)
+
+    def setUp(self):
+        with connection.schema_editor() as editor:
+            for model in self.unmanaged:
+                editor.create_model(model)
+
+    def tearDown(self):
+        with connection.schema_editor() as editor:
+            for model in self.unmanaged:
+                editor.delete_model(model)
+
+    def test_endpoints_within_budget(self):
+        with stub_llm() as llm:
+            report = run_scenarios(BenchContext(**DEFAULT_CONTEXT), llm)
+        self.assertEqual(set(report), set(QUERY_BUDGETS))
+        for name, entry in report.items():
+            with self.subTest(name, queries=entry["queries"], budget=entry["budget"]):
+                self.assertTrue(entry["ok"], entry["error"])
+
+
+class HasSessionIdTests(TestCase):
+    """Views behind HasSessionId need a session_id bound to an email, from the query string or the body."""
+
+    def setUp(self):
+        self.sid = _register_session(self, "someone@example.com_test")
+        self.factory = APIRequestFactory()
+
+    def get_rollup(self, query=""):
+        return UserConnectionRollupView.as_view()(self.factory.get(f"/users/1/connection-rollup/{query}"), user_id=1)
+
+    def test_missing_session_id(self):
+        response = self.get_rollup()
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(str(response.data["detail"]), "session_id is required. Call /set_email/ first to obtain it.")
+
+    def test_unknown_session_id(self):
+        response = self.get_rollup("?session_id=nobody_1234")
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(str(response.data["detail"]), "Invalid session_id. Set email via /set_email/ first.")
+
+    def test_valid_session_id_in_query(self):
+        self.assertEqual(self.get_rollup(f"?session_id={self.sid}").status_code, 200)
+
+    def test_session_id_read_from_body_on_post(self):
+        view = AnalyzePairsBatch.as_view()
+        denied = view(self.factory.post("/analyze-pairs/?session_id=" + self.sid, {"pairs": []}, format="json"))
+        self.assertEqual(denied.status_code, 403)
+        allowed = view(self.factory.post("/analyze-pairs/", {"session_id": self.sid, "pairs": []}, format="json"))
+        self.assertNotEqual(allowed.status_code, 403)
+
+
+class SimilarPairsQuerySerializerTests(TestCase):
+    def test_rejects_non_finite_vector_components(self):
+        for bad in ("nan", "inf", "-inf", "NaN", "Infinity"):
+            vector = ",".join(["0.5"] * (len(FEATURE_KEYS) - 1) + [bad])
+            with self.subTest(bad):
+                s = SimilarPairsQuerySerializer(data={"session_id": "x", "vector": vector})
+                self.assertFalse(s.is_valid())
+                self.assertIn("vector", s.errors)
+
+    def test_accepts_finite_vector(self):
+        s = SimilarPairsQuerySerializer(data={"session_id": "x", "vector": ",".join(["0.5"] * len(FEATURE_KEYS))})
+        self.assertTrue(s.is_valid(), s.errors)
+        self.assertEqual(s.validated_data["vector"], [0.5] * len(FEATURE_KEYS))
+
+
+class BackfillTests(UnmanagedTablesMixin, TestCase):
+    def test_truncated_pair_is_recomputed_on_request(self):
+        _add_conversation(1, 2, 30)
+        call_command("backfill_conversation_summaries", "--limit-messages-per-pair", "5", stdout=StringIO())
+        backfilled = ConversationSummary.objects.get(pair_key="1-2")
+        self.assertEqual(backfilled.message_count, 5)
+
+        with stub_llm():
+            result = infer_pair_connection(1, 2)
+            recomputed = ConversationSummary.objects.values().get(pair_key="1-2")
+            ConversationSummary.objects.all().delete()
+            expected = infer_pair_connection(1, 2)
+            full = ConversationSummary.objects.values().get(pair_key="1-2")
+
+        self.assertEqual(result["message_count"], 30)
+        self.assertEqual(result["distribution"], expected["distribution"])
+        self.assertEqual(result["highest_connection_type"], expected["highest_connection_type"])
+        for field in ("message_count", "last_message_at", "feature_counts", "connection_type", "confidence", *FEATURE_KEYS):
+            self.assertEqual(recomputed[field], full[field], field)
+
+    def test_rerun_skips_pairs_already_scored(self):
+        _add_conversation(1, 2, 30)
+        _add_conversation(3, 4, 3, seed=2)
+        args = ("backfill_conversation_summaries", "--limit-messages-per-pair", "5")
+        call_command(*args, stdout=StringIO())
+        # A full recompute stores the real count; the backfill must not overwrite it
+        with stub_llm():
+            infer_pair_connection(1, 2)
+        before = dict(ConversationSummary.objects.values_list("pair_key", "updated_at"))
+        call_command(*args, stdout=StringIO())
+        self.assertEqual(dict(ConversationSummary.objects.values_list("pair_key", "updated_at")), before)
+
+
+class IncrementalMergeTests(UnmanagedTablesMixin, TestCase):
+    """Merging counts for new messages gives what a full recompute over the whole conversation gives."""
+
+    def setUp(self):
+        # Heuristic features only, so stored features come from the counts alone
+        patcher = mock.patch.object(inference, "LLM_AVAILABLE", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def full_row(self, pair_key):
+        ConversationSummary.objects.filter(pair_key=pair_key).delete()
+        user_a, user_b = map(int, pair_key.split("-"))
+        infer_pair_connection(user_a, user_b)
+        return ConversationSummary.objects.values().get(pair_key=pair_key)
+
+    def assertRowsMatch(self, row, expected):
+        for field in ("message_count", "last_message_at", "feature_counts", "connection_type", "confidence", *FEATURE_KEYS):
+            self.assertEqual(row[field], expected[field], field)
+
+    def test_merge_helpers_match_full_counts(self):
+        rows = _add_conversation(1, 2, 40)
+        for k in (1, 7, 20, 39):
+            with self.subTest(split=k):
+                head, tail = rows[:k], rows[k:]
+                cached = {
+                    "feature_counts": extract_feature_counts(inference._format_messages(head)),
+                    "last_message_at": head[-1]["sent_at"],
+                    "message_count": k,
+                }
+                since = inference._merge_since(cached)
+                self.assertEqual(since, head[-1]["sent_at"])
+                delta = inference._fetch_pair_messages(1, 2, since=since)
+                self.assertEqual(len(delta), len(tail))
+                counts = inference._incremental_counts(cached, delta, len(rows))
+                full = extract_feature_counts(inference._format_messages(rows))
+                self.assertEqual(counts, full)
+                self.assertEqual(
+                    merge_feature_counts(cached["feature_counts"], extract_feature_counts(inference._format_messages(tail))),
+                    full,
+                )
+                features = features_from_counts(counts)
+                self.assertEqual(features, features_from_counts(full))
+                scores = connection_type_scores_raw(features)
+                expected = connection_type_scores_raw(features_from_counts(full))
+                self.assertEqual(max(scores, key=scores.get), max(expected, key=expected.get))
+
+    def test_null_counts_fall_back_to_full_recompute(self):
+        rows = _add_conversation(1, 2, 12)
+        cached = {"feature_counts": None, "last_message_at": rows[-1]["sent_at"], "message_count": 12}
+        self.assertIsNone(inference._merge_since(cached))
+        self.assertIsNone(inference._incremental_counts(cached, rows[:1], 13))
+        all_rows = inference._fetch_pair_messages(1, 2)
+        counts, _, count, _ = inference._stale_pair_inputs(cached, None, all_rows, 12, rows[-1]["sent_at"])
+        self.assertEqual(count, 12)
+        self.assertEqual(counts, extract_feature_counts(inference._format_messages(rows)))
+
+    def test_incremental_requests_match_full_recompute(self):
+        rows = _add_conversation(1, 2, 15)
+        infer_pair_connection(1, 2)
+        for seed in (2, 3, 4):
+            rows = _add_conversation(1, 2, 6, seed=seed, start=rows[-1]["sent_at"])
+            infer_pair_connection(1, 2)
+            merged = ConversationSummary.objects.values().get(pair_key="1-2")
+            self.assertRowsMatch(merged, self.full_row("1-2"))
+
+    def test_request_after_null_counts_matches_full_recompute(self):
+        rows = _add_conversation(1, 2, 15)
+        infer_pair_connection(1, 2)
+        ConversationSummary.objects.filter(pair_key="1-2").update(feature_counts=None)
+        _add_conversation(1, 2, 5, seed=9, start=rows[-1]["sent_at"])
+        result = infer_pair_connection(1, 2)
+        self.assertEqual(result["message_count"], 20)
+        merged = ConversationSummary.objects.values().get(pair_key="1-2")
+        self.assertRowsMatch(merged, self.full_row("1-2"))
+
+
+class PersistSummariesTests(UnmanagedTablesMixin, TestCase):
+    def test_racing_first_writes_count_the_pair_once(self):
+        rows = _add_conversation(1, 2, 10)
+        counts = extract_feature_counts(inference._format_messages(rows))
+        # Two requests that both found no summary, persisted one after the other
+        with mock.patch.object(inference, "LLM_AVAILABLE", False):
+            _, first = inference._score_pair(1, 2, counts, None, 10, rows[-1]["sent_at"])
+            _, second = inference._score_pair(1, 2, counts, None, 10, rows[-1]["sent_at"])
+        inference._persist_summaries([first])
+        inference._persist_summaries([second])
+
+        self.assertEqual(ConversationSummary.objects.count(), 1)
+        self.assertFalse(ConversationSummary.objects.filter(connection_type="").exists())
+        for user_id in (1, 2):
+            self.assertEqual(UserConnectionRollup.objects.get(user_id=user_id).pair_count, 1)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.breaker = resilience.CircuitBreaker(failure_threshold=3, reset_after=0.05)
+
+    def trip(self):
+        for _ in range(3):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record_failure()
+
+    def test_opens_after_consecutive_failures(self):
+        for _ in range(2):
+            self.breaker.record_failure()
+        # A success resets the streak
+        self.breaker.record_success()
+        for _ in range(2):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, resilience.CircuitBreaker.CLOSED)
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, resilience.CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_half_open_allows_one_probe(self):
+        self.trip()
+        time.sleep(0.06)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, resilience.CircuitBreaker.HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+        # A probe that never reached the LLM is handed back
+        self.breaker.release()
+        self.assertTrue(self.breaker.allow())
+
+    def test_successful_probe_closes(self):
+        self.trip()
+        time.sleep(0.06)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, resilience.CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_probe_reopens(self):
+        self.trip()
+        time.sleep(0.06)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, resilience.CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+
+
+class CallWithBudgetTests(SimpleTestCase):
+    def setUp(self):
+        self.breaker = resilience.CircuitBreaker(failure_threshold=2, reset_after=60)
+        patcher = mock.patch.object(resilience, "breaker", self.breaker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def counters_after(self, before):
+        after = resilience.snapshot()
+        return {name: after[name] - before[name] for name in before if name != "llm_breaker_state"}
+
+    def test_answer_within_budget(self):
+        self.assertEqual(resilience.call_with_budget(lambda: "ok", timeout=1), "ok")
+        self.assertEqual(self.breaker.state, resilience.CircuitBreaker.CLOSED)
+
+    def test_deadline_falls_back_and_keeps_late_answer(self):
+        release = threading.Event()
+        late = []
+        delivered = threading.Event()
+
+        def slow():
+            release.wait(5)
+            return "late answer"
+
+        def on_late(text):
+            late.append(text)
+            delivered.set()
+
+        before = resilience.snapshot()
+        started = time.monotonic()
+        with mock.patch.object(resilience, "KEEP_LATE_RESULTS", True):
+            self.assertIsNone(resilience.call_with_budget(slow, on_late=on_late, timeout=0.05))
+            self.assertLess(time.monotonic() - started, 1)
+            release.set()
+            self.assertTrue(delivered.wait(5))
+        self.assertEqual(late, ["late answer"])
+        counts = self.counters_after(before)
+        self.assertEqual(counts["llm_budget_misses"], 1)
+        self.assertEqual(counts["llm_late_results"], 1)
+
+    def test_failures_open_the_breaker_then_short_circuit(self):
+        calls = []
+
+        def failing():
+            calls.append(1)
+            raise RuntimeError("provider down")
+
+        before = resilience.snapshot()
+        for _ in range(2):
+            self.assertIsNone(resilience.call_with_budget(failing, timeout=1, attempts=1))
+        self.assertEqual(self.breaker.state, resilience.CircuitBreaker.OPEN)
+        self.assertIsNone(resilience.call_with_budget(failing, timeout=1))
+        self.assertEqual(len(calls), 2)
+        counts = self.counters_after(before)
+        self.assertEqual(counts["llm_failures"], 2)
+        self.assertEqual(counts["llm_short_circuits"], 1)
+        self.assertEqual(counts["llm_breaker_opened"], 1)
+
+    def test_metrics_document_every_counter(self):
+        lines = metrics.render().splitlines()
+        for name in resilience.snapshot():
+            if name == "llm_breaker_state":
+                continue
+            metric = f"connection_{name}_total"
+            with self.subTest(metric):
+                self.assertTrue(any(line.startswith(f"# HELP {metric} ") for line in lines))
+                self.assertIn(f"# TYPE {metric} counter", lines)
+
+
+class SingleFlightTests(TransactionTestCase):
+    """Concurrent callers for one key share a single run (threads need their own committed PairLock rows)."""
+
+    callers = 8
+
+    def race(self, work):
+        """Call single_flight("1-2", work) from ``callers`` threads at once; returns (results, errors)."""
+        entered = threading.Semaphore(0)
+        results, errors = [], []
+
+        def leader_work():
+            # Let every caller reach single_flight before the leader finishes
+            for _ in range(self.callers):
+                entered.acquire()
+            time.sleep(0.1)
+            return work()
+
+        def caller():
+            try:
+                entered.release()
+                results.append(single_flight.single_flight("1-2", leader_work, wait=10))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=caller) for _ in range(self.callers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(20)
+        self.assertFalse(any(t.is_alive() for t in threads))
+        return results, errors
+
+    def assertReleased(self):
+        self.assertEqual(single_flight._flights, {})
+        self.assertFalse(PairLock.objects.exists())
+
+    def test_work_runs_once_and_result_is_shared(self):
+        runs = []
+
+        def work():
+            runs.append(1)
+            return object()
+
+        results, errors = self.race(work)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(len(results), self.callers)
+        self.assertTrue(all(r is results[0] for r in results))
+        self.assertReleased()
+        # The next call after the flight landed runs the work again
+        single_flight.single_flight("1-2", work)
+        self.assertEqual(len(runs), 2)
+
+    def test_exception_reaches_every_caller(self):
+        runs = []
+
+        def work():
+            runs.append(1)
+            raise ValueError("boom")
+
+        results, errors = self.race(work)
+        self.assertEqual(results, [])
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(len(errors), self.callers)
+        self.assertTrue(all(e is errors[0] and isinstance(e, ValueError) for e in errors))
+        self.assertReleased()
+
+
+class UserConnectionsPaginationTests(TestCase):
+    """Keyset pages of /users/<id>/connections/ (user 5 sits on both sides of its pairs)."""
+
+    def setUp(self):
+        self.sid = _register_session(self, "someone@example.com_pages")
+        self.factory = APIRequestFactory()
+        self.base = timezone.now().replace(microsecond=0) - timedelta(days=1)
+        # Partners 1-4 put user 5 on the b side; several rows share a timestamp
+        for partner, minutes in ((1, 0), (2, 10), (3, 10), (4, 20), (6, 10), (7, 10), (8, 30), (9, 0), (10, 20), (11, 40), (12, 10)):
+            self.add_pair(partner, self.base + timedelta(minutes=minutes))
+
+    def add_pair(self, partner, last_message_at):
+        user_a, user_b = min(5, partner), max(5, partner)
+        return ConversationSummary.objects.create(
+            pair_key=f"{user_a}-{user_b}", user_a_id=user_a, user_b_id=user_b, last_message_at=last_message_at,
+            message_count=3, connection_type="Social", confidence=50.0,
+        )
+
+    def get_page(self, limit, cursor=None):
+        query = f"?session_id={self.sid}&limit={limit}" + (f"&cursor={cursor}" if cursor else "")
+        return UserConnections.as_view()(self.factory.get(f"/users/5/connections/{query}"), user_id=5)
+
+    def walk(self, limit):
+        keys, cursor = [], None
+        while True:
+            response = self.get_page(limit, cursor)
+            self.assertEqual(response.status_code, 200)
+            keys.extend(r["pair_key"] for r in response.data["results"])
+            cursor = response.data["next_cursor"]
+            if cursor is None:
+                return keys
+
+    def expected(self):
+        return list(
+            ConversationSummary.objects.filter(Q(user_a_id=5) | Q(user_b_id=5))
+            .order_by("-last_message_at", "-id").values_list("pair_key", flat=True)
+        )
+
+    def test_pages_cover_every_pair_once_in_order(self):
+        for limit in (1, 2, 3, 4, 11, 50):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.walk(limit), self.expected())
+
+    def test_ties_on_last_message_at_break_on_id(self):
+        tied = [k for k in self.expected() if ConversationSummary.objects.get(pair_key=k).last_message_at == self.base + timedelta(minutes=10)]
+        self.assertEqual(len(tied), 5)
+        # Page boundaries inside the tied run neither skip nor repeat rows
+        self.assertEqual(self.walk(2), self.expected())
+
+    def test_cursor_is_stable_when_rows_are_added(self):
+        first = self.get_page(4)
+        second = self.get_page(4, first.data["next_cursor"])
+        # A newer conversation and one tied with the cursor row but with a higher id
+        self.add_pair(13, self.base + timedelta(hours=2))
+        self.add_pair(14, first.data["results"][-1]["last_message_at"])
+        again = self.get_page(4, first.data["next_cursor"])
+        self.assertEqual(again.data["results"], second.data["results"])
+        self.assertEqual(again.data["next_cursor"], second.data["next_cursor"])
+
+    def test_bad_cursor_is_rejected(self):
+        for cursor in (
+            "not a cursor!",
+            "aGVsbG8",  # "hello"
+            # Truncated: the stamp loses its offset and the id
+            encode_cursor(self.base, 3)[:-12],
+            # Well-formed base64 around a tampered payload
+            base64.urlsafe_b64encode(f"{self.base.isoformat()}|three".encode()).decode(),
+            base64.urlsafe_b64encode(f"{self.base.replace(tzinfo=None).isoformat()}|3".encode()).decode(),
+            base64.urlsafe_b64encode(b"\xff\xfe|3").decode(),
+        ):
+            with self.subTest(cursor=cursor):
+                response = self.get_page(3, cursor)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("cursor", response.data)
+
+
+class RollupRebuildTests(UnmanagedTablesMixin, TestCase):
+    """Incrementally maintained rollups equal what rebuild_user_rollups computes from scratch."""
+
+    def setUp(self):
+        patcher = mock.patch.object(inference, "LLM_AVAILABLE", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pairs = [(1, 2), (1, 3), (2, 3), (3, 4), (4, 5), (1, 5), (6, 6)]
+        self.last = {}
+        for seed, pair in enumerate(self.pairs):
+            self.last[pair] = _add_conversation(*pair, 8, seed=seed)[-1]["sent_at"]
+
+    def snapshot(self):
+        # A user whose pairs are all gone keeps a zero row; the rebuild drops it
+        return {
+            row.pop("user_id"): {k: round(v, 6) if isinstance(v, float) else v for k, v in row.items()}
+            for row in UserConnectionRollup.objects.filter(pair_count__gt=0).values().order_by("user_id")
+            if row.pop("id") and row.pop("updated_at")
+        }
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        call_command("rebuild_user_rollups", stdout=StringIO())
+        self.assertEqual(incremental, self.snapshot())
+        self.assertTrue(incremental)
+
+    def test_inserts_label_changes_and_deletes(self):
+        inference.infer_pair_connections(self.pairs[:4])
+        for pair in self.pairs[4:]:
+            infer_pair_connection(*pair)
+        self.assertMatchesRebuild()
+
+        # New messages rescore pairs through both paths; some labels change
+        for seed, pair in enumerate(self.pairs):
+            self.last[pair] = _add_conversation(*pair, 12, seed=100 + seed, start=self.last[pair])[-1]["sent_at"]
+        inference.infer_pair_connections(self.pairs[:3])
+        for pair in self.pairs[3:]:
+            infer_pair_connection(*pair)
+        self.assertMatchesRebuild()
+
+        # LLM refinement changes type and confidence in place
+        with stub_llm(), mock.patch.object(inference, "LLM_AVAILABLE", True):
+            for pair in self.pairs[4:]:
+                self.assertTrue(inference.refine_pair_with_llm(*pair))
+        self.assertMatchesRebuild()
+
+        ConversationSummary.objects.get(pair_key="1-2").delete()
+        ConversationSummary.objects.filter(pair_key__in=["4-5", "6-6"]).delete()
+        self.assertMatchesRebuild()
+        ConversationSummary.objects.all().delete()
+        self.assertEqual(self.snapshot(), {})
+
+
+class AnalyzePairETagTests(UnmanagedTablesMixin, TestCase):
+    """Conditional GETs of /analyze-pair/."""
+
+    def setUp(self):
+        self.sid = _register_session(self, "someone@example.com_etag")
+        self.factory = APIRequestFactory()
+        # Seed 1 gives a low-margin conversation, so PAIR_LLM_ASYNC makes it provisional
+        self.rows = _add_conversation(1, 2, 10, seed=1)
+
+    def get(self, etag=None):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        request = self.factory.get(f"/analyze-pair/?session_id={self.sid}&user_a_id=2&user_b_id=1", **headers)
+        return AnalyzePairFromDB.as_view()(request).render()
+
+    def test_current_etag_is_not_modified(self):
+        with mock.patch.object(inference, "LLM_AVAILABLE", False):
+            first = self.get()
+            self.assertEqual(first.status_code, 200)
+            etag = first["ETag"]
+            for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+                with self.subTest(header=header):
+                    response = self.get(header)
+                    self.assertEqual(response.status_code, 304)
+                    self.assertEqual(response.content, b"")
+                    self.assertEqual(response["ETag"], etag)
+            self.assertEqual(self.get('"other"').status_code, 200)
+
+    def test_new_message_changes_the_etag(self):
+        with mock.patch.object(inference, "LLM_AVAILABLE", False):
+            etag = self.get()["ETag"]
+            _add_conversation(1, 2, 1, seed=5, start=self.rows[-1]["sent_at"])
+            response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["message_count"], 11)
+        self.assertEqual(self.get(response["ETag"]).status_code, 304)
+
+    @override_settings(PAIR_LLM_ASYNC=True)
+    def test_refinement_changes_the_etag(self):
+        with stub_llm():
+            provisional = self.get()
+            self.assertTrue(provisional.data["provisional"])
+            self.assertEqual(self.get(provisional["ETag"]).status_code, 304)
+            self.assertTrue(inference.refine_pair_with_llm(1, 2))
+            refined = self.get(provisional["ETag"])
+        self.assertEqual(refined.status_code, 200)
+        self.assertFalse(refined.data["provisional"])
+        self.assertNotEqual(refined["ETag"], provisional["ETag"])
+
+
+class IsolatedDatabaseTests(SimpleTestCase):
+    def test_refuses_other_backends(self):
+        with mock.patch.object(connection, "vendor", "postgresql"), \
+                mock.patch.object(connection.creation, "create_test_db") as create_test_db:
+            with self.assertRaisesMessage(ValueError, "configured backend is postgresql"):
+                with isolated_database():
+                    pass
+            with self.assertRaises(CommandError):
+                call_command("check_query_budgets", stdout=StringIO())
+        create_test_db.assert_not_called()
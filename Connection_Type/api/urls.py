@@ -1,10 +1,25 @@
 from django.urls import path
-from .views import AnalyzePairFromDB, AnalyzeProfile
+from .views import AnalyzePairFromDB, AnalyzePairsBatch, AnalyzeProfile, MetricsView, SimilarPairs, UserConnectionRollupView, UserConnections
 
 urlpatterns = [
     # Existing pair analysis by user ids (DB-driven)
     path("analyze-pair/", AnalyzePairFromDB.as_view(), name="analyze-pair-from-db"),
 
+    # Batch pair analysis (POST): many pairs in one request
+    path("analyze-pairs/", AnalyzePairsBatch.as_view(), name="analyze-pairs-batch"),
+
     # New: profile-driven analysis (POST)
     path("profile/analyze/", AnalyzeProfile.as_view(), name="profile-analyze"),
+
+    # Nearest pairs by feature vector (in-memory index over ConversationSummary)
+    path("similar-pairs/", SimilarPairs.as_view(), name="similar-pairs"),
+
+    # A user's pairs, newest first (cursor pagination)
+    path("users/<int:user_id>/connections/", UserConnections.as_view(), name="user-connections"),
+
+    # Per-user connection-type mix (maintained rollup row)
+    path("users/<int:user_id>/connection-rollup/", UserConnectionRollupView.as_view(), name="user-connection-rollup"),
+
+    # Prometheus scrape endpoint (per worker process)
+    path("metrics/", MetricsView.as_view(), name="metrics"),
 ]
@@ -1,15 +1,26 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import ConnectionDistributionSerializer, ProfileInputSerializer
-from .services.inference import infer_pair_connection
+from .permissions import HasSessionId
+from .serializers import (
+    ConnectionDistributionSerializer, PairBatchInputSerializer, ProfileInputSerializer, SimilarPairsQuerySerializer,
+    UserConnectionsQuerySerializer,
+)
+from .services.inference import current_pair_etag, infer_pair_connection, infer_pair_connections
+from .services import metrics
+from .services.rollups import get_rollup
+from .services.similarity import similar_pairs
+from .services.user_connections import list_user_connections
 from .models import PostsComment
 from .constants import CONNECTION_TYPE_KEYS
 from .feature_extraction import extract_features as extract_features_heuristic
 from .logic import connection_type_scores_raw
+from django.conf import settings
+from django.http import HttpResponse
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.http import parse_etags
 from datetime import timedelta
-from django.contrib.sessions.models import Session
 
 try:
     from llm_service.llm import extract_features as extract_features_llm
@@ -19,25 +30,9 @@ except Exception:
     LLM_AVAILABLE = False
 
 class AnalyzePairFromDB(APIView):
+    permission_classes = [HasSessionId]
+
     def get(self, request):
-        # Require a valid session_id param (cookie sessions are not sufficient)
-        sid = request.query_params.get("session_id")
-        if not sid:
-            return Response({
-                "detail": "session_id is required. Call /set_email/ first to obtain it."
-            }, status=status.HTTP_403_FORBIDDEN)
-        # Validate session_id maps to a stored session with email
-        sessions = Session.objects.all()
-        valid = False
-        for s in sessions:
-            data = s.get_decoded()
-            if data.get("custom_session_id") == sid and data.get("user_email"):
-                valid = True
-                break
-        if not valid:
-            return Response({
-                "detail": "Invalid session_id. Set email via /set_email/ first."
-            }, status=status.HTTP_403_FORBIDDEN)
         try:
             a = int(request.query_params.get("user_a_id"))
             b = int(request.query_params.get("user_b_id"))
@@ -45,10 +40,45 @@ class AnalyzePairFromDB(APIView):
             return Response({
                 "detail": "Provide integer query params user_a_id and user_b_id"
             }, status=status.HTTP_400_BAD_REQUEST)
-        result = infer_pair_connection(a, b)
+        # Conditional GET: answer from the freshness probe alone when the client's copy is current
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match:
+            etag = current_pair_etag(a, b)
+            if etag and _etag_matches(if_none_match, etag):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+                response["ETag"] = etag
+                response["Cache-Control"] = "private, no-cache"
+                return response
+        with metrics.stage("analyze_pair", "total"):
+            result = infer_pair_connection(a, b)
         out = ConnectionDistributionSerializer(data=result)
         out.is_valid(raise_exception=True)
-        return Response(out.validated_data, status=status.HTTP_200_OK)
+        response = Response(out.validated_data, status=status.HTTP_200_OK)
+        response["ETag"] = result["etag"]
+        # Clients may keep the body but must revalidate before reusing it
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match uses weak comparison, so W/"x" matches "x"."""
+    if header.strip() == "*":
+        return True
+    tags = parse_etags(header)
+    return etag in tags or etag in (t[2:] for t in tags if t.startswith("W/"))
+
+
+class AnalyzePairsBatch(APIView):
+    """POST endpoint: connection types for many pairs at once, keyed by pair_key."""
+    permission_classes = [HasSessionId]
+
+    def post(self, request):
+        s = PairBatchInputSerializer(data=request.data)
+        s.is_valid(raise_exception=True)
+        pairs = [(p["user_a_id"], p["user_b_id"]) for p in s.validated_data["pairs"]]
+
+        results = infer_pair_connections(pairs)
+        return Response({"results": results}, status=status.HTTP_200_OK)
 
 
 def _build_profile_text(data: dict) -> str:
@@ -82,11 +112,9 @@ def _run_profile_analysis(messages: list) -> dict:
     features = None
     if LLM_AVAILABLE:
         try:
-            # Add a cache-busting timestamp to fight potential upstream caching
-            import time
-            cache_bust_text = f"\n\n[debug_timestamp: {time.time()}]"
-            busted_messages = messages + [{"sender": "system", "text": cache_bust_text}]
-            features = extract_features_llm(busted_messages)
+            # Identical profile inputs are deduplicated by the LLM feature cache
+            with metrics.stage("analyze_profile", "llm"):
+                features = extract_features_llm(messages)
         except Exception:
             features = None
 
@@ -96,45 +124,78 @@ def _run_profile_analysis(messages: list) -> dict:
         return all(float(d.get(k, 0.0)) == 0.0 for k in keys)
 
     if features is None or _is_all_zeros(features):
-        # FALLBACK LOGIC: Run heuristics on profile and posts separately and merge with 70% profile weight.
-        profile_msg_list = [m for m in messages if m["sender"] == "UserProfile"]
-        posts_msgs_list = [m for m in messages if m["sender"] != "UserProfile"]
+        if LLM_AVAILABLE:
+            metrics.FALLBACKS.inc(pipeline="analyze_profile", reason="llm_unusable")
+        metrics.STRATEGY.inc(pipeline="analyze_profile", strategy="heuristic")
+        with metrics.stage("analyze_profile", "heuristic"):
+            # FALLBACK LOGIC: Run heuristics on profile and posts separately and merge with 70% profile weight.
+            profile_msg_list = [m for m in messages if m["sender"] == "UserProfile"]
+            posts_msgs_list = [m for m in messages if m["sender"] != "UserProfile"]
+
+            # Get features for each part, or empty dict if no messages
+            features_profile = extract_features_heuristic(profile_msg_list) if profile_msg_list else {}
+            features_posts = extract_features_heuristic(posts_msgs_list) if posts_msgs_list else {}
+
+            # Merge using weighted average: 50% profile, 50% posts
+            all_keys = set(features_profile.keys()) | set(features_posts.keys())
+            features = {
+                k: (features_profile.get(k, 0.0) * 0.5 + features_posts.get(k, 0.0) * 0.5)
+                for k in all_keys
+            }
+    else:
+        metrics.STRATEGY.inc(pipeline="analyze_profile", strategy="llm")
 
-        # Get features for each part, or empty dict if no messages
-        features_profile = extract_features_heuristic(profile_msg_list) if profile_msg_list else {}
-        features_posts = extract_features_heuristic(posts_msgs_list) if posts_msgs_list else {}
+    return features
 
-        # Merge using weighted average: 50% profile, 50% posts
-        all_keys = set(features_profile.keys()) | set(features_posts.keys())
-        features = {
-            k: (features_profile.get(k, 0.0) * 0.5 + features_posts.get(k, 0.0) * 0.5)
-            for k in all_keys
-        }
 
-    return features
+class SimilarPairs(APIView):
+    """GET endpoint: pairs whose feature vectors are closest to a pair's or to a raw vector."""
+    permission_classes = [HasSessionId]
+
+    def get(self, request):
+        s = SimilarPairsQuerySerializer(data=request.query_params)
+        s.is_valid(raise_exception=True)
+        data = s.validated_data
+
+        with metrics.stage("similar_pairs", "query"):
+            results = similar_pairs(
+                pair_key=data.get("pair_key"), vector=data.get("vector"), k=data["k"],
+                metric=data["metric"], connection_types=data.get("connection_type"),
+            )
+        if results is None:
+            return Response({"detail": "Unknown pair_key."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"metric": data["metric"], "results": results}, status=status.HTTP_200_OK)
+
+
+class UserConnectionRollupView(APIView):
+    """GET endpoint: a user's connection-type mix across all partners (one row read)."""
+    permission_classes = [HasSessionId]
+
+    def get(self, request, user_id):
+        return Response(get_rollup(user_id), status=status.HTTP_200_OK)
+
+
+class UserConnections(APIView):
+    """GET endpoint: a user's pairs, most recent conversation first, keyset-paginated."""
+    permission_classes = [HasSessionId]
+
+    def get(self, request, user_id):
+        s = UserConnectionsQuerySerializer(data=request.query_params)
+        s.is_valid(raise_exception=True)
+        data = s.validated_data
+
+        results, next_cursor = list_user_connections(
+            user_id, limit=data["limit"], cursor=data.get("cursor"),
+            connection_types=data.get("connection_type"), min_confidence=data.get("min_confidence"),
+        )
+        return Response({"results": results, "next_cursor": next_cursor}, status=status.HTTP_200_OK)
 
 
 class AnalyzeProfile(APIView):
     """POST endpoint: takes profile inputs, merges posts_comments, returns AI-based per-type percentages."""
+    permission_classes = [HasSessionId]
+
     def post(self, request):
-        # Require a valid session_id in body (cookie sessions are not sufficient)
-        sid = request.data.get("session_id")
-        if not sid:
-            return Response({
-                "detail": "session_id is required. Call /set_email/ first to obtain it."
-            }, status=status.HTTP_403_FORBIDDEN)
-        # Validate session_id maps to a stored session with email
-        sessions = Session.objects.all()
-        valid = False
-        for s in sessions:
-            data = s.get_decoded()
-            if data.get("custom_session_id") == sid and data.get("user_email"):
-                valid = True
-                break
-        if not valid:
-            return Response({
-                "detail": "Invalid session_id. Set email via /set_email/ first."
-            }, status=status.HTTP_403_FORBIDDEN)
         # Validate profile inputs
         s = ProfileInputSerializer(data=request.data)
         s.is_valid(raise_exception=True)
@@ -152,7 +213,8 @@ class AnalyzeProfile(APIView):
         query = PostsComment.objects.filter(created_at__gte=cutoff).order_by("-created_at")
         if limit:
             query = query[:limit]
-        rows = list(query.values("post", "comment"))
+        with metrics.stage("analyze_profile", "posts_fetch"):
+            rows = list(query.values("post", "comment"))
         for r in rows:
             if r.get("post"):
                 messages.append({"sender": "UserPost", "text": r["post"]})
@@ -161,13 +223,30 @@ class AnalyzeProfile(APIView):
 
         # Run the full AI analysis
         features = _run_profile_analysis(messages)
-        scores = connection_type_scores_raw(features)
-        distribution = _percentages(scores)
-        highest = max(scores, key=scores.get) if scores else "N/A"
+        with metrics.stage("analyze_profile", "score"):
+            scores = connection_type_scores_raw(features)
+            distribution = _percentages(scores)
+            highest = max(scores, key=scores.get) if scores else "N/A"
 
         return Response({
             "highest_connection_type": highest,
             "distribution": distribution,
             "source": "profile+posts_comments",
             "count_messages": len(messages),
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+        }, status=status.HTTP_200_OK)
+
+
+class MetricsView(APIView):
+    """GET endpoint: this worker's metrics in the Prometheus text format.
+
+    Scrapers must send ``Authorization: Bearer <METRICS_TOKEN>``; with no token
+    configured the endpoint is disabled.
+    """
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        token = getattr(settings, "METRICS_TOKEN", "")
+        if not token or not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return HttpResponse("Forbidden\n", status=403, content_type="text/plain")
+        return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
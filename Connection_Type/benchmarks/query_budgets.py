@@ -0,0 +1,168 @@
+"""Query budgets for the main endpoints, checked against the synthetic dataset.
+
+Budgets are flat: the batch endpoint reads and writes all pairs with a constant
+number of queries, so an N+1 regression fails ``manage.py check_query_budgets``
+and ``api.tests.QueryBudgetTests``. The only per-pair work allowed is around an
+LLM call (feature-cache lookup and store), ``LLM_CALL_QUERIES`` for each call
+the scenario actually makes. Budgets are calibrated on ``DEFAULT_CONTEXT``;
+batches touching more than 100 users add a few chunked statements.
+"""
+import logging
+from typing import Callable, Dict, List, Tuple
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from rest_framework.test import APIRequestFactory
+from api.query_budget import QueryBudgetExceeded, assert_max_queries
+from api.services.sessions import invalidate_session
+from .stub_llm import StubChain, stub_llm
+from .suite import BenchContext, _reset_pair_state, isolated_database
+
+# Cache lookup, then BEGIN / upsert / COMMIT for the store
+LLM_CALL_QUERIES = 4
+
+# scenario -> queries, besides LLM_CALL_QUERIES per LLM call
+QUERY_BUDGETS: Dict[str, int] = {
+    # session, summary, probe, fetch, single-flight lease and the summary/rollup/job writes
+    "analyze_pair_cold": 24,
+    "analyze_pair_warm": 4,
+    "analyze_pair_not_modified": 4,
+    # one read, probe and fetch for all pairs, one upsert and rollup pass (two UPDATEs per 100 users)
+    "analyze_pairs_batch_cold": 14,
+    "analyze_pairs_batch_warm": 4,
+    "analyze_profile": 3,
+    "chat": 8,
+}
+
+# Dataset used by the command's defaults and by the test
+DEFAULT_CONTEXT = {
+    "seed": 1234,
+    "pairs": 25,
+    "users": 25,
+    "messages": 20,
+    "posts": 50,
+    "sessions": 1,
+    "mix": None,
+    "llm_latency": 0.0,
+    "repeat": 1,
+}
+
+_factory = APIRequestFactory()
+
+
+def _call(view, request) -> None:
+    response = view(request)
+    if response.status_code >= 400:
+        raise RuntimeError(f"{request.method} {request.path} returned {response.status_code}: {getattr(response, 'data', '')}")
+    return response
+
+
+def _pair_url(ctx: BenchContext, pair: Tuple[int, int]) -> str:
+    return f"/analyze-pair/?user_a_id={pair[0]}&user_b_id={pair[1]}&session_id={ctx.session_ids[0]}"
+
+
+def _scenarios(ctx: BenchContext) -> List[Tuple[str, Callable[[], None], Callable[[], None]]]:
+    """(name, untimed setup, measured call) per scenario."""
+    from api.views import AnalyzePairFromDB, AnalyzePairsBatch, AnalyzeProfile
+    from chatbot import views as chat_views
+
+    pair_view = AnalyzePairFromDB.as_view()
+    batch_view = AnalyzePairsBatch.as_view()
+    profile_view = AnalyzeProfile.as_view()
+    chat_view = chat_views.ChatView.as_view()
+    sid = ctx.session_ids[0]
+    pair = ctx.pairs[0]
+    batch = {"session_id": sid, "pairs": [{"user_a_id": a, "user_b_id": b} for a, b in ctx.pairs]}
+    state = {}
+
+    def cold():
+        _reset_pair_state()
+        invalidate_session(sid)
+
+    def warm():
+        _call(pair_view, _factory.get(_pair_url(ctx, pair)))
+        invalidate_session(sid)
+
+    def not_modified_setup():
+        state["etag"] = _call(pair_view, _factory.get(_pair_url(ctx, pair)))["ETag"]
+        invalidate_session(sid)
+
+    def not_modified():
+        response = pair_view(_factory.get(_pair_url(ctx, pair), HTTP_IF_NONE_MATCH=state["etag"]))
+        if response.status_code != 304:
+            raise RuntimeError(f"expected 304, got {response.status_code}")
+
+    def batch_warm():
+        _call(batch_view, _factory.post("/analyze-pairs/", batch, format="json"))
+        invalidate_session(sid)
+
+    def chat_setup():
+        invalidate_session(sid)
+        # Stand-in for Gemini so the check runs offline
+        chat_views._chat_chain = chat_views.CHAT_PROMPT | FakeListChatModel(responses=["Thank you for sharing."])
+
+    return [
+        ("analyze_pair_cold", cold, lambda: _call(pair_view, _factory.get(_pair_url(ctx, pair)))),
+        ("analyze_pair_warm", warm, lambda: _call(pair_view, _factory.get(_pair_url(ctx, pair)))),
+        ("analyze_pair_not_modified", not_modified_setup, not_modified),
+        ("analyze_pairs_batch_cold", cold,
+         lambda: _call(batch_view, _factory.post("/analyze-pairs/", batch, format="json"))),
+        ("analyze_pairs_batch_warm", batch_warm,
+         lambda: _call(batch_view, _factory.post("/analyze-pairs/", batch, format="json"))),
+        ("analyze_profile", lambda: invalidate_session(sid),
+         lambda: _call(profile_view, _factory.post("/profile/analyze/", {"session_id": sid, "about_me": ctx.gen.sentence()}, format="json"))),
+        ("chat", chat_setup,
+         lambda: _call(chat_view, _factory.post("/chat/", {"session_id": sid, "message": ctx.gen.sentence()}, format="json"))),
+    ]
+
+
+def run_scenarios(ctx: BenchContext, llm: StubChain, budgets: Dict[str, int] = None) -> Dict[str, Dict]:
+    """Run every scenario once in the current database with ``llm`` stubbed in.
+
+    Returns name -> {queries, llm_calls, budget, ok, error}.
+    """
+    from chatbot import views as chat_views
+    from llm_service import cache as feature_cache
+
+    budgets = budgets or QUERY_BUDGETS
+    report: Dict[str, Dict] = {}
+    saved_chain = chat_views._chat_chain
+    # Culling runs on a random fraction of cache writes; keep the counts reproducible
+    saved_cull = feature_cache.DB_CULL_PROBABILITY
+    feature_cache.DB_CULL_PROBABILITY = 0.0
+    api_log = logging.getLogger("api")
+    level = api_log.level
+    api_log.setLevel(logging.WARNING)
+    try:
+        for name, setup, call in _scenarios(ctx):
+            setup()
+            calls_before = llm.calls
+
+            def limit(base=budgets.get(name)):
+                if base is None:
+                    return 10 ** 9
+                return base + LLM_CALL_QUERIES * (llm.calls - calls_before)
+
+            entry = {"ok": True, "error": ""}
+            try:
+                with assert_max_queries(limit, label=name) as captured:
+                    call()
+            except QueryBudgetExceeded as exc:
+                entry.update(ok=False, error=str(exc))
+            entry.update(
+                queries=len(captured),
+                llm_calls=llm.calls - calls_before,
+                budget=limit() if name in budgets else None,
+            )
+            report[name] = entry
+    finally:
+        chat_views._chat_chain = saved_chain
+        feature_cache.DB_CULL_PROBABILITY = saved_cull
+        api_log.setLevel(level)
+    return report
+
+
+def check_query_budgets(ctx_kwargs: Dict = None, budgets: Dict[str, int] = None) -> Dict[str, Dict]:
+    """Build the dataset in an isolated database and run every scenario (see run_scenarios)."""
+    ctx_kwargs = ctx_kwargs or DEFAULT_CONTEXT
+    with isolated_database(), stub_llm(ctx_kwargs.get("llm_latency", 0.0)) as llm:
+        ctx = BenchContext(**ctx_kwargs)
+        return run_scenarios(ctx, llm, budgets)
@@ -0,0 +1,46 @@
+"""Offline stand-in for the Gemini chain used by ``llm_service.llm``."""
+import hashlib
+import json
+import time
+from contextlib import contextmanager
+from api.constants import FEATURE_KEYS
+
+
+class _Response:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class StubChain:
+    """Sleeps ``latency`` seconds, then answers with features derived from the input hash."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def invoke(self, inputs: dict) -> _Response:
+        self.calls += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+        digest = hashlib.sha256(str(inputs.get("conversation", "")).encode("utf-8")).digest()
+        features = {key: round(digest[i] / 255.0, 3) for i, key in enumerate(FEATURE_KEYS)}
+        return _Response(json.dumps(features))
+
+
+@contextmanager
+def stub_llm(latency: float = 0.0):
+    """Route ``llm_service.llm.extract_features`` to a StubChain for the duration of the block.
+
+    Yields the stub so callers can read its call count.
+    """
+    from llm_service import llm as llm_module
+
+    stub = StubChain(latency)
+    saved = (llm_module.llm, llm_module._chain)
+    # Any non-None model marks the LLM as configured; calls go through _chain
+    llm_module.llm = llm_module.llm or object()
+    llm_module._chain = stub
+    try:
+        yield stub
+    finally:
+        llm_module.llm, llm_module._chain = saved
@@ -0,0 +1,307 @@
+"""Benchmark cases for the analysis pipeline, run against a throwaway SQLite database."""
+import io
+import logging
+import platform
+import statistics
+import subprocess
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import django
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from api.models import (
+    BackfillCheckpoint, ConversationMessage, ConversationSummary, LLMFeatureCache, PostsComment, UserConnectionRollup,
+)
+from .stub_llm import stub_llm
+from .synthetic import SyntheticGenerator, parse_mix
+
+
+@contextmanager
+def isolated_database():
+    """Create a fresh in-memory SQLite test database, including the unmanaged tables.
+
+    Raises ValueError for any other backend: the run would create, fill and
+    drop a test database on whatever server DATABASE_URL points at.
+    """
+    if connection.vendor != "sqlite":
+        raise ValueError(
+            f"Benchmarks run on a throwaway SQLite database; the configured backend is {connection.vendor}. "
+            "Unset DATABASE_URL to run them."
+        )
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        with connection.schema_editor() as editor:
+            editor.create_model(ConversationMessage)
+            editor.create_model(PostsComment)
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def measure(fn: Callable[[], object], repeat: int, ops: int = 1, warmup: int = 1,
+            setup: Optional[Callable[[], object]] = None) -> Dict:
+    """Time ``fn`` ``repeat`` times (``setup`` runs untimed before each call).
+
+    ``ops`` is the number of logical operations per call, used for ops_per_sec.
+    Queries are counted on one extra, untimed call.
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    samples = []
+    for _ in range(max(1, repeat)):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    if setup:
+        setup()
+    with CaptureQueriesContext(connection) as queries:
+        fn()
+
+    samples.sort()
+    median = statistics.median(samples)
+    p95 = samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))]
+    return {
+        "repeat": len(samples),
+        "ops": ops,
+        "min_ms": round(samples[0] * 1000, 3),
+        "median_ms": round(median * 1000, 3),
+        "p95_ms": round(p95 * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "ops_per_sec": round(ops / median, 2) if median > 0 else None,
+        "queries": len(queries),
+    }
+
+
+class BenchContext:
+    """Synthetic dataset shared by all cases, loaded once per run."""
+
+    def __init__(self, seed: int, pairs: int, users: int, messages: int, posts: int,
+                 sessions: int, mix: Optional[str], llm_latency: float, repeat: int):
+        self.params = {
+            "seed": seed, "pairs": pairs, "users": users, "messages_per_pair": messages,
+            "posts": posts, "sessions": sessions, "mix": mix or "", "llm_latency_ms": llm_latency * 1000,
+            "repeat": repeat,
+        }
+        self.repeat = repeat
+        self.llm_latency = llm_latency
+        self.gen = SyntheticGenerator(seed=seed, mix=parse_mix(mix))
+        start = timezone.now() - timedelta(days=30)
+
+        self.pairs = self.gen.pairs(pairs, users)
+        self.conversations: List[List[Dict]] = []
+        rows = []
+        for user_a, user_b in self.pairs:
+            conversation = self.gen.conversation(user_a, user_b, messages, start)
+            self.conversations.append(
+                [{"sender": f"User {r['sender_id']}", "text": r["message"]} for r in conversation]
+            )
+            rows.extend(ConversationMessage(**r) for r in conversation)
+        ConversationMessage.objects.bulk_create(rows, batch_size=2000)
+        PostsComment.objects.bulk_create(
+            [PostsComment(**p) for p in self.gen.posts(posts, timezone.now() - timedelta(days=60))], batch_size=2000
+        )
+
+        from api.services.sessions import register_session
+        self.session_ids = []
+        for email in self.gen.emails(sessions):
+            store = SessionStore()
+            store["user_email"] = email
+            store.create()
+            custom_id = f"{email}_bench"
+            register_session(custom_id, store.session_key, email, store.get_expiry_date())
+            self.session_ids.append(custom_id)
+
+
+def _reset_pair_state():
+    from llm_service import cache as feature_cache
+    ConversationSummary.objects.all().delete()
+    UserConnectionRollup.objects.all().delete()
+    LLMFeatureCache.objects.all().delete()
+    feature_cache.clear_local()
+
+
+def bench_extract_features(ctx: BenchContext) -> Dict:
+    from api.feature_extraction import extract_features
+    convs = ctx.conversations
+    return measure(lambda: [extract_features(c) for c in convs], ctx.repeat, ops=len(convs))
+
+
+def bench_scores_raw(ctx: BenchContext) -> Dict:
+    from api.feature_extraction import extract_features
+    from api.logic import connection_type_scores_raw
+    features = [extract_features(c) for c in ctx.conversations]
+    return measure(lambda: [connection_type_scores_raw(f) for f in features], ctx.repeat, ops=len(features))
+
+
+def bench_scores_batch(ctx: BenchContext) -> Dict:
+    from api.feature_extraction import extract_features
+    from api.logic import connection_type_scores_batch
+    features = [extract_features(c) for c in ctx.conversations]
+    return measure(lambda: connection_type_scores_batch(features), ctx.repeat, ops=len(features))
+
+
+def bench_infer_pair_cold(ctx: BenchContext) -> Dict:
+    from api.services.inference import infer_pair_connection
+    with stub_llm(ctx.llm_latency) as stub:
+        stats = measure(
+            lambda: [infer_pair_connection(a, b) for a, b in ctx.pairs],
+            ctx.repeat, ops=len(ctx.pairs), setup=_reset_pair_state,
+        )
+    stats["llm_calls"] = stub.calls
+    return stats
+
+
+def bench_infer_pair_warm(ctx: BenchContext) -> Dict:
+    from api.services.inference import infer_pair_connection
+    with stub_llm(ctx.llm_latency):
+        _reset_pair_state()
+        for a, b in ctx.pairs:
+            infer_pair_connection(a, b)
+        return measure(lambda: [infer_pair_connection(a, b) for a, b in ctx.pairs], ctx.repeat, ops=len(ctx.pairs))
+
+
+def bench_infer_pairs_batch_cold(ctx: BenchContext) -> Dict:
+    from api.services.inference import infer_pair_connections
+    pairs = ctx.pairs[:200]
+    with stub_llm(ctx.llm_latency):
+        return measure(lambda: infer_pair_connections(pairs), ctx.repeat, ops=len(pairs), setup=_reset_pair_state)
+
+
+def bench_similar_pairs(ctx: BenchContext) -> Dict:
+    from api.services.inference import infer_pair_connections
+    from api.services.similarity import get_index, similar_pairs
+    with stub_llm(ctx.llm_latency):
+        _reset_pair_state()
+        infer_pair_connections(ctx.pairs[:200])
+    get_index().reload()
+    keys = [f"{a}-{b}" for a, b in ctx.pairs[:200]]
+    return measure(lambda: [similar_pairs(pair_key=k, k=10) for k in keys], ctx.repeat, ops=len(keys))
+
+
+def bench_session_lookup_cold(ctx: BenchContext) -> Dict:
+    from api.services.sessions import invalidate_session, lookup_session
+    ids = ctx.session_ids
+
+    def clear():
+        for sid in ids:
+            invalidate_session(sid)
+
+    return measure(lambda: [lookup_session(sid) for sid in ids], ctx.repeat, ops=len(ids), setup=clear)
+
+
+def bench_session_lookup_warm(ctx: BenchContext) -> Dict:
+    from api.services.sessions import lookup_session
+    ids = ctx.session_ids
+    return measure(lambda: [lookup_session(sid) for sid in ids], ctx.repeat, ops=len(ids))
+
+
+def bench_profile_analysis(ctx: BenchContext) -> Dict:
+    from rest_framework.test import APIRequestFactory
+    from api.views import AnalyzeProfile
+    view = AnalyzeProfile.as_view()
+    factory = APIRequestFactory()
+    body = {
+        "session_id": ctx.session_ids[0],
+        "about_me": ctx.gen.sentence(),
+        "interests": ctx.gen.sentence(),
+        "looking_for": ctx.gen.sentence(),
+    }
+
+    def run():
+        response = view(factory.post("/profile/analyze/", body, format="json"))
+        if response.status_code != 200:
+            raise RuntimeError(f"profile analysis returned {response.status_code}: {response.data}")
+
+    with stub_llm(ctx.llm_latency):
+        return measure(run, ctx.repeat, setup=_reset_pair_state)
+
+
+def bench_backfill(ctx: BenchContext) -> Dict:
+    def setup():
+        ConversationSummary.objects.all().delete()
+        UserConnectionRollup.objects.all().delete()
+        BackfillCheckpoint.objects.all().delete()
+
+    def run():
+        call_command("backfill_conversation_summaries", "--stream", "--force", stdout=io.StringIO())
+
+    return measure(run, ctx.repeat, ops=len(ctx.pairs), setup=setup, warmup=0)
+
+
+BENCHMARKS: Dict[str, Callable[[BenchContext], Dict]] = {
+    "extract_features": bench_extract_features,
+    "connection_type_scores_raw": bench_scores_raw,
+    "connection_type_scores_batch": bench_scores_batch,
+    "infer_pair_connection_cold": bench_infer_pair_cold,
+    "infer_pair_connection_warm": bench_infer_pair_warm,
+    "infer_pair_connections_batch_cold": bench_infer_pairs_batch_cold,
+    "similar_pairs": bench_similar_pairs,
+    "session_lookup_cold": bench_session_lookup_cold,
+    "session_lookup_warm": bench_session_lookup_warm,
+    "profile_analysis": bench_profile_analysis,
+    "backfill_command": bench_backfill,
+}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=Path(__file__).resolve().parent,
+            capture_output=True, text=True, timeout=5,
+        )
+    except Exception:
+        return None
+    return out.stdout.strip() or None
+
+
+def run_suite(ctx_kwargs: Dict, only: Optional[List[str]] = None, log: Callable[[str], None] = lambda _: None) -> Dict:
+    """Build the dataset in an isolated database and run the selected cases.
+
+    Returns a JSON-serializable report: run metadata plus per-case timings.
+    """
+    names = only or list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks {unknown}; available: {list(BENCHMARKS)}")
+
+    results = {}
+    # Per-request INFO lines would dominate the timings of the fast paths
+    api_log = logging.getLogger("api")
+    level = api_log.level
+    api_log.setLevel(logging.WARNING)
+    try:
+        with isolated_database():
+            started = time.perf_counter()
+            ctx = BenchContext(**ctx_kwargs)
+            setup_seconds = time.perf_counter() - started
+            for name in names:
+                log(f"running {name}")
+                results[name] = BENCHMARKS[name](ctx)
+    finally:
+        api_log.setLevel(level)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "platform": platform.platform(),
+            "dataset_setup_s": round(setup_seconds, 3),
+            "params": ctx.params,
+        },
+        "results": results,
+    }
@@ -0,0 +1,115 @@
+"""Seeded synthetic data for benchmarks: conversations, posts/comments and session emails.
+
+Vocabulary is drawn from the lexicons in ``api.feature_extraction`` so the mix
+controls which heuristics fire (and how often the LLM gate is reached).
+"""
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+from api.feature_extraction import LEXICONS
+
+NEUTRAL_WORDS = (
+    "the", "a", "and", "to", "of", "in", "it", "is", "was", "that", "for", "on",
+    "with", "you", "we", "they", "this", "today", "later", "yesterday", "maybe",
+    "just", "really", "going", "think", "know", "time", "day", "week", "weather",
+    "coffee", "food", "music", "movie", "book", "train", "city", "home", "around",
+)
+CONTRACTIONS = ("it's", "don't", "can't", "i'm", "you're", "we'll", "that's")
+
+# Relative weight per vocabulary bucket; keys are lexicon names plus "neutral"
+DEFAULT_MIX: Dict[str, float] = {
+    "warmth": 1.0,
+    "romantic": 1.0,
+    "spiritual": 1.0,
+    "task": 1.0,
+    "formality": 1.0,
+    "intensity": 1.0,
+    "neutral": 8.0,
+}
+
+
+def parse_mix(spec: Optional[str]) -> Dict[str, float]:
+    """Parse "romantic=3,task=1" into a mix; unspecified buckets keep their defaults."""
+    mix = dict(DEFAULT_MIX)
+    if not spec:
+        return mix
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in mix:
+            raise ValueError(f"Unknown vocabulary bucket {name!r}; expected one of {sorted(mix)}")
+        mix[name] = float(weight)
+    return mix
+
+
+class SyntheticGenerator:
+    """Deterministic text/row generator; the same seed and parameters give the same data."""
+
+    def __init__(self, seed: int = 0, mix: Optional[Dict[str, float]] = None,
+                 min_words: int = 4, max_words: int = 18,
+                 exclaim_rate: float = 0.1, caps_rate: float = 0.03, contraction_rate: float = 0.05):
+        self.rng = random.Random(seed)
+        mix = mix or DEFAULT_MIX
+        # Sorted so set iteration order never leaks into the output
+        self.vocab: Dict[str, Tuple[str, ...]] = {name: tuple(sorted(words)) for name, words in LEXICONS}
+        self.vocab["neutral"] = NEUTRAL_WORDS
+        self.buckets = [name for name in sorted(mix) if mix[name] > 0 and name in self.vocab]
+        if not self.buckets:
+            raise ValueError("Vocabulary mix has no positive weights")
+        self.weights = [mix[name] for name in self.buckets]
+        self.min_words = min_words
+        self.max_words = max(min_words, max_words)
+        self.exclaim_rate = exclaim_rate
+        self.caps_rate = caps_rate
+        self.contraction_rate = contraction_rate
+
+    def word(self) -> str:
+        rng = self.rng
+        if rng.random() < self.contraction_rate:
+            return rng.choice(CONTRACTIONS)
+        bucket = rng.choices(self.buckets, weights=self.weights)[0]
+        word = rng.choice(self.vocab[bucket])
+        if rng.random() < self.caps_rate:
+            word = word.upper()
+        return word
+
+    def sentence(self) -> str:
+        n = self.rng.randint(self.min_words, self.max_words)
+        text = " ".join(self.word() for _ in range(n))
+        text = text[:1].upper() + text[1:]
+        return text + ("!" if self.rng.random() < self.exclaim_rate else ".")
+
+    def conversation(self, user_a: int, user_b: int, length: int, start: datetime) -> List[Dict]:
+        """``length`` ConversationMessage-shaped rows alternating mostly between two users."""
+        rows = []
+        at = start
+        sender, receiver = user_a, user_b
+        for _ in range(length):
+            if self.rng.random() < 0.7:
+                sender, receiver = receiver, sender
+            at += timedelta(seconds=self.rng.randint(5, 3600))
+            rows.append({"sender_id": sender, "receiver_id": receiver, "message": self.sentence(), "sent_at": at})
+        return rows
+
+    def pairs(self, count: int, users: int) -> List[Tuple[int, int]]:
+        """``count`` distinct canonical (user_a, user_b) pairs among user ids 1..users."""
+        users = max(users, 2)
+        max_pairs = users * (users - 1) // 2
+        if count > max_pairs:
+            raise ValueError(f"{count} pairs requested but only {max_pairs} exist among {users} users")
+        seen = set()
+        while len(seen) < count:
+            a, b = self.rng.sample(range(1, users + 1), 2)
+            seen.add((min(a, b), max(a, b)))
+        return sorted(seen)
+
+    def posts(self, count: int, start: datetime) -> Iterator[Dict]:
+        """PostsComment-shaped rows (post text, comment text, created_at)."""
+        at = start
+        for _ in range(count):
+            at += timedelta(minutes=self.rng.randint(1, 600))
+            post = " ".join(self.sentence() for _ in range(self.rng.randint(1, 3)))
+            yield {"post": post, "comment": self.sentence(), "created_at": at}
+
+    def emails(self, count: int) -> List[str]:
+        return [f"bench{i}.{self.rng.randrange(16 ** 6):06x}@example.com" for i in range(count)]
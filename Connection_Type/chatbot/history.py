@@ -0,0 +1,114 @@
+from typing import List, Sequence, Tuple
+from django.conf import settings
+from django.db import transaction
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from .models import ChatMessage, ChatSummary
+
+
+def _window() -> int:
+    return int(getattr(settings, "CHAT_HISTORY_WINDOW", 100))
+
+
+def token_budget() -> int:
+    return int(getattr(settings, "CHAT_HISTORY_TOKEN_BUDGET", 3000))
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token plus per-message overhead)."""
+    return len(text or "") // 4 + 4
+
+
+def split_window(rows: Sequence[Tuple[int, str, str]], budget: int) -> int:
+    """Index of the first row (oldest first) of the newest suffix that fits in ``budget``.
+
+    The suffix always starts on a human message so no turn is sent half-cut.
+    """
+    used = 0
+    start = len(rows)
+    for i in range(len(rows) - 1, -1, -1):
+        used += estimate_tokens(rows[i][2])
+        if used > budget:
+            break
+        start = i
+    while start < len(rows) and rows[start][1] != ChatMessage.ROLE_HUMAN:
+        start += 1
+    return start
+
+
+def _to_message(role: str, content: str) -> BaseMessage:
+    return HumanMessage(content=content) if role == ChatMessage.ROLE_HUMAN else AIMessage(content=content)
+
+
+def load_recent(session_id: str, limit: int = None) -> List[BaseMessage]:
+    """Most recent ``limit`` messages for a session, oldest first (one indexed range scan)."""
+    limit = _window() if limit is None else limit
+    rows = list(
+        ChatMessage.objects.filter(session_id=session_id)
+        .order_by("-id")
+        .values_list("role", "content")[:limit]
+    )
+    return [_to_message(role, content) for role, content in reversed(rows)]
+
+
+def load_context(session_id: str) -> List[BaseMessage]:
+    """History to send with a turn: the rolling summary plus the recent turns within budget.
+
+    When stored turns no longer fit, a compaction that folds the oldest of them
+    into the summary is scheduled in the background; this request just sends
+    the turns that fit.
+    """
+    state = ChatSummary.objects.filter(session_id=session_id).values("summary", "covered_through_id").first()
+    summary = state["summary"] if state else ""
+    covered = state["covered_through_id"] if state else 0
+
+    window = _window()
+    rows = list(
+        ChatMessage.objects.filter(session_id=session_id, id__gt=covered)
+        .order_by("-id")
+        .values_list("id", "role", "content")[:window + 1]
+    )
+    rows.reverse()
+    overflow = len(rows) > window
+    if overflow:
+        rows = rows[1:]
+    budget = max(0, token_budget() - (estimate_tokens(summary) if summary else 0))
+    start = split_window(rows, budget)
+    if overflow or start > 0:
+        from .summary import schedule_compaction
+        schedule_compaction(session_id)
+
+    history: List[BaseMessage] = []
+    if summary:
+        history.append(SystemMessage(content=f"Summary of the earlier conversation with this user:\n{summary}"))
+    history.extend(_to_message(role, content) for _, role, content in rows[start:])
+    return history
+
+
+def append_turn(session_id: str, user_message: str, ai_message: str) -> None:
+    """Insert just the two new rows for a completed turn."""
+    ChatMessage.objects.bulk_create([
+        ChatMessage(session_id=session_id, role=ChatMessage.ROLE_HUMAN, content=user_message),
+        ChatMessage(session_id=session_id, role=ChatMessage.ROLE_AI, content=ai_message),
+    ])
+
+
+def import_legacy(session_id: str, session_obj, session_data: dict) -> bool:
+    """Move a pre-table ``chat_history_<id>`` session blob into ChatMessage rows once.
+
+    Returns True when anything was imported.
+    """
+    key = f"chat_history_{session_id}"
+    items = session_data.get(key)
+    if not items:
+        return False
+    rows = [
+        ChatMessage(session_id=session_id, role=item["type"], content=item["content"])
+        for item in items
+        if item.get("type") in (ChatMessage.ROLE_HUMAN, ChatMessage.ROLE_AI)
+    ]
+    with transaction.atomic():
+        ChatMessage.objects.bulk_create(rows)
+        session_data.pop(key, None)
+        session_obj.session_data = type(session_obj).objects.encode(session_data)
+        session_obj.save(update_fields=["session_data"])
+    return bool(rows)
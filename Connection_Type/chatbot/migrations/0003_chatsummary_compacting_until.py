@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0002_chatsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsummary',
+            name='compacting_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import models
+
+
+class ChatMessage(models.Model):
+    """One chat turn half (user or assistant), appended per message."""
+    ROLE_HUMAN = "human"
+    ROLE_AI = "ai"
+    ROLES = (
+        (ROLE_HUMAN, "Human"),
+        (ROLE_AI, "AI"),
+    )
+
+    # custom session id handed out by /set_email/
+    session_id = models.CharField(max_length=255)
+    role = models.CharField(max_length=10, choices=ROLES)
+    content = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["session_id", "id"]),
+        ]
+
+    def __str__(self):
+        return f"{self.session_id} [{self.role}] {self.content[:40]}"
+
+
+class ChatSummary(models.Model):
+    """Rolling summary of the turns that no longer fit in a session's prompt window."""
+    session_id = models.CharField(max_length=255, unique=True)
+    summary = models.TextField(blank=True, default="")
+    # id of the last ChatMessage folded into ``summary``; later rows are sent verbatim
+    covered_through_id = models.BigIntegerField(default=0)
+    # set while a worker compacts this session so other processes skip it
+    compacting_until = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.session_id} summary through #{self.covered_through_id}"
@@ -0,0 +1,24 @@
+import json
+from rest_framework.renderers import BaseRenderer
+
+
+def sse_event(data: dict, event: str = None) -> str:
+    """One server-sent event carrying ``data`` as JSON."""
+    payload = f"data: {json.dumps(data)}\n\n"
+    return f"event: {event}\n{payload}" if event else payload
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Accepts ``Accept: text/event-stream`` during content negotiation.
+
+    Streamed replies bypass rendering; this only renders the error responses
+    raised before the stream starts, as a single ``error`` event.
+    """
+    media_type = "text/event-stream"
+    format = "event-stream"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return sse_event(data, event="error").encode(self.charset)
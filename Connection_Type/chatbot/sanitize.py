@@ -0,0 +1,61 @@
+import re
+
+# Markup characters plus common emoji/symbol ranges, compiled once per process
+_STRIP_PATTERN = re.compile(
+    "["
+    "*`•"  # asterisks, backticks, bullets
+    u"\U0001F600-\U0001F64F"  # emoticons
+    u"\U0001F300-\U0001F5FF"  # symbols & pictographs
+    u"\U0001F680-\U0001F6FF"  # transport & map symbols
+    u"\U0001F700-\U0001F77F"  # alchemical symbols
+    u"\U0001F780-\U0001F7FF"  # geometric shapes extended
+    u"\U0001F800-\U0001F8FF"  # supplemental arrows-c
+    u"\U0001F900-\U0001F9FF"  # supplemental symbols and pictographs
+    u"\U0001FA00-\U0001FA6F"  # chess symbols
+    u"\U0001FA70-\U0001FAFF"  # symbols & pictographs extended-a
+    u"\U00002700-\U000027BF"  # dingbats
+    u"\U00002600-\U000026FF"  # misc symbols
+    u"\U00002B00-\U00002BFF"  # arrows & misc
+    u"\U0000FE00-\U0000FE0F"  # variation selectors
+    u"\U000024C2-\U0001F251"  # enclosed characters
+    "]",
+    flags=re.UNICODE,
+)
+_WHITESPACE = re.compile(r"\s+")
+_RUNS = re.compile(r"\s+|\S+")
+
+
+def sanitize_response(text: str) -> str:
+    """Remove asterisks, backticks, bullets, emojis/symbols; collapse whitespace."""
+    if not isinstance(text, str):
+        return text
+    text = _STRIP_PATTERN.sub("", text)
+    # Collapse whitespace to single spaces
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class ResponseSanitizer:
+    """Incremental ``sanitize_response`` for streamed chunks.
+
+    Whitespace is held back until the next visible character arrives, so runs
+    split across chunk boundaries still collapse to one space and trailing
+    whitespace is never emitted. Concatenating every ``feed`` result equals
+    ``sanitize_response`` of the whole text.
+    """
+
+    def __init__(self):
+        self._started = False
+        self._pending_space = False
+
+    def feed(self, chunk: str) -> str:
+        out = []
+        for run in _RUNS.findall(_STRIP_PATTERN.sub("", chunk or "")):
+            if run.isspace():
+                self._pending_space = self._started
+                continue
+            if self._pending_space:
+                out.append(" ")
+                self._pending_space = False
+            out.append(run)
+            self._started = True
+        return "".join(out)
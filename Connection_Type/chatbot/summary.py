@@ -0,0 +1,220 @@
+"""Rolling-summary compaction for chat history, run off the request path."""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+from langchain_core.prompts import ChatPromptTemplate
+from llm_service.clients import get_chat_model
+from .history import _window, estimate_tokens, split_window, token_budget
+from .models import ChatMessage, ChatSummary
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    (
+        "system",
+        (
+            "You maintain a running summary of a conversation between a user and Anchor AI, "
+            "a connection-building companion. Merge the new turns into the existing summary. "
+            "Keep the user's goals, relationships, names, preferences, boundaries and any advice "
+            "or next steps already agreed. Drop small talk. Write plain text, at most 200 words."
+        ),
+    ),
+    ("human", "Existing summary:\n{summary}\n\nNew turns:\n{transcript}\n\nUpdated summary:"),
+])
+
+_log = logging.getLogger("chatbot")
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-summary")
+_pending = set()
+_pending_lock = threading.Lock()
+_summary_chain = None
+_summary_chain_lock = threading.Lock()
+
+
+def get_summary_chain():
+    global _summary_chain
+    if _summary_chain is None:
+        with _summary_chain_lock:
+            if _summary_chain is None:
+                llm = get_chat_model("gemini-2.5-flash", settings.GEMINI_API_KEY, 0.2)
+                _summary_chain = SUMMARY_PROMPT | llm
+    return _summary_chain
+
+
+def schedule_compaction(session_id: str) -> bool:
+    """Queue a background compaction unless one is already queued for this session.
+
+    This only deduplicates within the process; ``compact`` claims the session in
+    the database so workers in other processes do not compact it at the same time.
+    """
+    with _pending_lock:
+        if session_id in _pending:
+            return False
+        _pending.add(session_id)
+    try:
+        _executor.submit(_run, session_id)
+    except RuntimeError:
+        # Interpreter shutting down; the next turn will schedule it again
+        with _pending_lock:
+            _pending.discard(session_id)
+        return False
+    return True
+
+
+def _run(session_id: str) -> None:
+    try:
+        compact(session_id)
+    except Exception:
+        _log.exception("chat summary compaction failed session_id=%s", session_id)
+    finally:
+        with _pending_lock:
+            _pending.discard(session_id)
+        close_old_connections()
+
+
+def _transcript(rows) -> str:
+    return "\n".join(
+        f"{'User' if role == ChatMessage.ROLE_HUMAN else 'Assistant'}: {content}" for _, role, content in rows
+    )
+
+
+def _batch_size() -> int:
+    # At least one full turn (human + ai) per read
+    return max(2, int(getattr(settings, "CHAT_COMPACTION_BATCH", 200)))
+
+
+def _turns(rows):
+    """Group rows into turns: a human message plus the replies that follow it."""
+    turn = []
+    for row in rows:
+        if turn and row[1] == ChatMessage.ROLE_HUMAN:
+            yield turn
+            turn = []
+        turn.append(row)
+    if turn:
+        yield turn
+
+
+def _chunks(rows, budget: int):
+    """Split rows into consecutive runs of whole turns of at most ``budget`` estimated tokens.
+
+    A single turn over the budget becomes a chunk of its own.
+    """
+    chunk, used = [], 0
+    for turn in _turns(rows):
+        cost = sum(estimate_tokens(row[2]) for row in turn)
+        if chunk and used + cost > budget:
+            yield chunk
+            chunk, used = [], 0
+        chunk.extend(turn)
+        used += cost
+    if chunk:
+        yield chunk
+
+
+def _compaction_end(session_id: str, covered: int, budget: int):
+    """Id of the oldest message to keep unsummarized, or None when nothing needs compacting.
+
+    Reads at most one history window of the newest messages.
+    """
+    recent = list(
+        ChatMessage.objects.filter(session_id=session_id, id__gt=covered)
+        .order_by("-id")
+        .values_list("id", "role", "content")[:_window()]
+    )
+    if not recent:
+        return None
+    recent.reverse()
+    start = split_window(recent, budget // 2)
+    if start == 0 and len(recent) < _window():
+        return None
+    return recent[start][0] if start < len(recent) else recent[-1][0] + 1
+
+
+def _lease_seconds() -> int:
+    return int(getattr(settings, "CHAT_COMPACTION_LEASE_SECONDS", 300))
+
+
+def _claim(session_id: str):
+    """Take the session's compaction lease and return its expiry, or None while another worker holds it."""
+    now = timezone.now()
+    until = now + timedelta(seconds=_lease_seconds())
+    ChatSummary.objects.bulk_create([ChatSummary(session_id=session_id)], ignore_conflicts=True)
+    claimed = (
+        ChatSummary.objects.filter(session_id=session_id)
+        .filter(Q(compacting_until__isnull=True) | Q(compacting_until__lte=now))
+        .update(compacting_until=until)
+    )
+    return until if claimed else None
+
+
+def _release(session_id: str, until) -> None:
+    # Leaves a lease another worker took over after ours expired alone
+    ChatSummary.objects.filter(session_id=session_id, compacting_until=until).update(compacting_until=None)
+
+
+def compact(session_id: str) -> bool:
+    """Fold unsummarized turns older than half the budget into the session's summary.
+
+    Leaving half the budget free means the next several turns fit without
+    another compaction. Old turns are read CHAT_COMPACTION_BATCH messages at a
+    time along the (session_id, id) index. Returns True when the summary advanced.
+
+    One worker at a time compacts a session: it holds a lease on the ChatSummary
+    row, and each step only advances the summary from the coverage it started
+    with, so a worker whose lease ran out cannot overwrite a newer summary.
+    """
+    budget = token_budget()
+    state = ChatSummary.objects.filter(session_id=session_id).values("covered_through_id").first()
+    if _compaction_end(session_id, state["covered_through_id"] if state else 0, budget) is None:
+        return False
+    until = _claim(session_id)
+    if until is None:
+        return False
+    try:
+        return _compact_claimed(session_id, budget)
+    finally:
+        _release(session_id, until)
+
+
+def _compact_claimed(session_id: str, budget: int) -> bool:
+    # Re-read under the lease: another worker may have finished just before the claim
+    state = ChatSummary.objects.values("summary", "covered_through_id").get(session_id=session_id)
+    summary = state["summary"]
+    covered = state["covered_through_id"]
+
+    end = _compaction_end(session_id, covered, budget)
+    if end is None:
+        return False
+
+    chain = None
+    batch_size = _batch_size()
+    while True:
+        rows = list(
+            ChatMessage.objects.filter(session_id=session_id, id__gt=covered, id__lt=end)
+            .order_by("session_id", "id")
+            .values_list("id", "role", "content")[:batch_size]
+        )
+        if len(rows) == batch_size:
+            # The last turn may continue in the next read; leave it for then
+            last_start = max(
+                (i for i, row in enumerate(rows) if row[1] == ChatMessage.ROLE_HUMAN), default=0
+            )
+            rows = rows[:last_start] or rows
+        if not rows:
+            break
+        chain = chain or get_summary_chain()
+        # Each LLM call sees at most one budget's worth of turns
+        for chunk in _chunks(rows, max(1, budget)):
+            response = chain.invoke({"summary": summary or "(none yet)", "transcript": _transcript(chunk)})
+            summary = response.content.strip() if isinstance(response.content, str) else str(response.content)
+            advanced = ChatSummary.objects.filter(session_id=session_id, covered_through_id=covered).update(
+                summary=summary, covered_through_id=chunk[-1][0], updated_at=timezone.now()
+            )
+            if not advanced:
+                _log.warning("chat summary moved on under compaction session_id=%s; stopping", session_id)
+                return covered != state["covered_through_id"]
+            covered = chunk[-1][0]
+    return chain is not None
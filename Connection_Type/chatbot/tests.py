@@ -0,0 +1,338 @@
+import asyncio
+import json
+import random
+from datetime import timedelta
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage
+from api.services.sessions import invalidate_session, register_session
+from chatbot import summary as chat_summary
+from chatbot.history import append_turn, estimate_tokens, load_context
+from chatbot.models import ChatMessage, ChatSummary
+from chatbot.sanitize import ResponseSanitizer, sanitize_response
+
+
+def _feed_all(chunks):
+    sanitizer = ResponseSanitizer()
+    return "".join(sanitizer.feed(chunk) for chunk in chunks)
+
+
+def _split(text, cuts):
+    cuts = sorted(set(cuts))
+    return [text[i:j] for i, j in zip([0, *cuts], [*cuts, len(text)])]
+
+
+class ResponseSanitizerTests(TestCase):
+    """Concatenated ``feed`` output equals ``sanitize_response`` wherever the chunks are cut."""
+
+    texts = [
+        "Hello there",
+        "  **Bold** and `code`   here  ",
+        "• First point\n• Second point\n\n",
+        "Take a breath \U0001F600 and   reflect ✨ on it.\t\n",
+        "*`•*",
+        "   ",
+        "",
+        "a\n\n\n*\n\nb",
+        "ends with emoji \U0001F680",
+        "word* *word `` word",
+    ]
+
+    def assertChunksMatch(self, text, chunks):
+        with self.subTest(text=text, chunks=chunks):
+            self.assertEqual(_feed_all(chunks), sanitize_response(text))
+
+    def test_single_chunk(self):
+        for text in self.texts:
+            self.assertChunksMatch(text, [text])
+
+    def test_one_character_chunks(self):
+        for text in self.texts:
+            self.assertChunksMatch(text, list(text))
+
+    def test_every_two_way_split(self):
+        for text in self.texts:
+            for cut in range(len(text) + 1):
+                self.assertChunksMatch(text, [text[:cut], text[cut:]])
+
+    def test_random_splits(self):
+        rng = random.Random(11)
+        for text in self.texts:
+            for _ in range(50):
+                cuts = [rng.randint(0, len(text)) for _ in range(rng.randint(1, 6))]
+                self.assertChunksMatch(text, _split(text, cuts))
+
+    def test_empty_and_none_chunks(self):
+        self.assertEqual(_feed_all(["", None, "  hi", "", " there ", None]), "hi there")
+
+
+class _FakeChain:
+    """Chat chain stand-in that replies with fixed chunks.
+
+    ``progress`` is called before each chunk and its results are kept in ``seen``.
+    """
+
+    def __init__(self, parts, progress=lambda: None):
+        self.parts = parts
+        self.progress = progress
+        self.seen = []
+
+    def stream(self, inputs):
+        for part in self.parts:
+            self.seen.append(self.progress())
+            yield AIMessageChunk(content=part)
+
+    async def astream(self, inputs):
+        for part in self.parts:
+            await asyncio.sleep(0)
+            self.seen.append(self.progress())
+            yield AIMessageChunk(content=part)
+
+
+class ChatStreamViewTests(TestCase):
+    parts = ["Hello ", "**there**, ", "take a ", "breath.  "]
+
+    def setUp(self):
+        store = SessionStore()
+        store["user_email"] = "someone@example.com"
+        store.create()
+        self.sid = "someone@example.com_stream"
+        register_session(self.sid, store.session_key, "someone@example.com", store.get_expiry_date())
+        self.addCleanup(invalidate_session, self.sid)
+        self.sent = []
+        # Body chunks the server had sent when the chain produced each part
+        self.chain = _FakeChain(self.parts, lambda: len([m for m in self.sent if m.get("body")]))
+        patcher = mock.patch("chatbot.views.get_chat_chain", return_value=self.chain)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def body(self, message="Hi"):
+        return json.dumps({"message": message, "session_id": self.sid}).encode()
+
+    def asgi_post(self, path, body, accept):
+        """Run one request through Django's ASGI handler; the messages it sends land in ``self.sent``."""
+        # The test client does the same: closing connections would end the test transaction
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "headers": [
+                (b"host", b"testserver"),
+                (b"content-type", b"application/json"),
+                (b"accept", accept.encode()),
+                (b"content-length", str(len(body)).encode()),
+            ],
+            "server": ("testserver", 80),
+            "client": ("127.0.0.1", 12345),
+        }
+        incoming = [{"type": "http.request", "body": body, "more_body": False}]
+
+        async def receive():
+            if incoming:
+                return incoming.pop()
+            # No disconnect: wait until the handler stops listening
+            await asyncio.Event().wait()
+
+        async def send(message):
+            self.sent.append(message)
+
+        async_to_sync(ASGIHandler())(scope, receive, send)
+
+    def test_streams_chunks_under_asgi(self):
+        self.asgi_post("/chat/stream/", self.body(), "text/event-stream")
+        self.assertEqual(self.sent[0]["type"], "http.response.start")
+        self.assertEqual(self.sent[0]["status"], 200)
+        chunks = [m["body"] for m in self.sent if m["type"] == "http.response.body" and m.get("body")]
+        self.assertGreater(len(chunks), 1)
+        # Tokens went out while the model was still generating, not after it finished
+        self.assertEqual(self.chain.seen, [0, 1, 2, 3])
+        events = b"".join(chunks).decode()
+        self.assertIn('data: {"token": "Hello"}', events)
+        self.assertIn('event: done\ndata: {"response": "Hello there, take a breath."}', events)
+        self.assertEqual(
+            list(ChatMessage.objects.filter(session_id=self.sid).values_list("content", flat=True)),
+            ["Hi", "".join(self.parts)],
+        )
+
+    def test_event_stream_accept_header(self):
+        response = self.client.post(
+            "/chat/stream/", self.body(), content_type="application/json", HTTP_ACCEPT="text/event-stream"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = b"".join(response.streaming_content).decode()
+        self.assertTrue(events.endswith('event: done\ndata: {"response": "Hello there, take a breath."}\n\n'))
+
+    def test_errors_before_streaming_are_an_error_event(self):
+        response = self.client.post(
+            "/chat/stream/", json.dumps({"message": "Hi", "session_id": "nobody_1"}),
+            content_type="application/json", HTTP_ACCEPT="text/event-stream",
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertTrue(response.content.decode().startswith("event: error\ndata: "))
+
+
+def _add_turns(session_id, count, start=0):
+    # 40-character messages: 14 estimated tokens each, 28 per turn
+    for i in range(start, start + count):
+        append_turn(session_id, f"user message number {i:04d}".ljust(40, "."), f"assistant reply number {i:04d}".ljust(40, "."))
+
+
+class _FakeSummaryChain:
+    """Summary chain stand-in numbering its summaries; ``on_invoke`` runs before each answer."""
+
+    def __init__(self, on_invoke=lambda inputs: None):
+        self.inputs = []
+        self.on_invoke = on_invoke
+
+    def invoke(self, inputs):
+        self.inputs.append(inputs)
+        self.on_invoke(inputs)
+        return AIMessage(content=f"summary {len(self.inputs)}")
+
+
+@override_settings(CHAT_HISTORY_TOKEN_BUDGET=100, CHAT_HISTORY_WINDOW=100)
+class ChatHistoryTests(TestCase):
+    sid = "someone@example.com_history"
+
+    def setUp(self):
+        self.chain = _FakeSummaryChain()
+        for target, value in (("get_summary_chain", lambda: self.chain), ("schedule_compaction", mock.Mock())):
+            patcher = mock.patch.object(chat_summary, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def stored(self):
+        return list(ChatMessage.objects.filter(session_id=self.sid).order_by("id").values_list("id", "role", "content"))
+
+    def test_history_is_append_only(self):
+        _add_turns(self.sid, 3)
+        before = self.stored()
+        _add_turns(self.sid, 2, start=3)
+        chat_summary.compact(self.sid)
+        after = self.stored()
+        self.assertEqual(after[:len(before)], before)
+        self.assertEqual(len(after), 10)
+        self.assertEqual([role for _, role, _ in after], [ChatMessage.ROLE_HUMAN, ChatMessage.ROLE_AI] * 5)
+        self.assertTrue(all(a[0] < b[0] for a, b in zip(after, after[1:])))
+
+    def test_context_fits_the_token_budget(self):
+        _add_turns(self.sid, 10)
+        history = load_context(self.sid)
+        self.assertLessEqual(sum(estimate_tokens(m.content) for m in history), 100)
+        self.assertIsInstance(history[0], HumanMessage)
+        # The newest turns, in order
+        self.assertEqual([m.content for m in history], [c for _, _, c in self.stored()[-len(history):]])
+        self.assertEqual(len(history), 6)
+        chat_summary.schedule_compaction.assert_called_once_with(self.sid)
+
+    def test_context_leads_with_the_summary(self):
+        _add_turns(self.sid, 10)
+        chat_summary.compact(self.sid)
+        history = load_context(self.sid)
+        self.assertIsInstance(history[0], SystemMessage)
+        self.assertIn(ChatSummary.objects.get(session_id=self.sid).summary, history[0].content)
+        self.assertLessEqual(sum(estimate_tokens(m.content) for m in history), 100)
+        covered = ChatSummary.objects.get(session_id=self.sid).covered_through_id
+        self.assertEqual([m.content for m in history[1:]], [c for i, _, c in self.stored() if i > covered])
+
+    def test_compact_chunks_whole_turns(self):
+        for batch in (2, 3, 7, 200):
+            with self.subTest(batch=batch), override_settings(CHAT_COMPACTION_BATCH=batch):
+                ChatMessage.objects.all().delete()
+                ChatSummary.objects.all().delete()
+                self.chain.inputs.clear()
+                _add_turns(self.sid, 10)
+                self.assertTrue(chat_summary.compact(self.sid))
+                transcripts = [inputs["transcript"].splitlines() for inputs in self.chain.inputs]
+                for lines in transcripts:
+                    self.assertEqual(len(lines) % 2, 0)
+                    self.assertTrue(all(line.startswith("User: ") for line in lines[::2]))
+                    self.assertTrue(all(line.startswith("Assistant: ") for line in lines[1::2]))
+                    self.assertLessEqual(sum(estimate_tokens(line.split(": ", 1)[1]) for line in lines), 100)
+                # Every turn but the newest, each summarized once and in order
+                summarized = [line.split(": ", 1)[1] for lines in transcripts for line in lines]
+                self.assertEqual(summarized, [c for _, _, c in self.stored()[:-2]])
+                state = ChatSummary.objects.get(session_id=self.sid)
+                self.assertEqual(state.covered_through_id, self.stored()[-3][0])
+                self.assertIsNone(state.compacting_until)
+
+    def test_summary_rolls_forward(self):
+        _add_turns(self.sid, 10)
+        chat_summary.compact(self.sid)
+        first = ChatSummary.objects.get(session_id=self.sid)
+        calls = len(self.chain.inputs)
+        # Nothing new to fold in
+        self.assertFalse(chat_summary.compact(self.sid))
+        self.assertEqual(len(self.chain.inputs), calls)
+
+        _add_turns(self.sid, 6, start=10)
+        self.assertTrue(chat_summary.compact(self.sid))
+        second = ChatSummary.objects.get(session_id=self.sid)
+        self.assertGreater(second.covered_through_id, first.covered_through_id)
+        # The next step builds on the stored summary and only sees newer turns
+        self.assertEqual(self.chain.inputs[calls]["summary"], first.summary)
+        self.assertIn("user message number 0009", self.chain.inputs[calls]["transcript"])
+        self.assertEqual(second.summary, f"summary {len(self.chain.inputs)}")
+
+
+@override_settings(CHAT_HISTORY_TOKEN_BUDGET=100, CHAT_HISTORY_WINDOW=100)
+class CompactionSchedulingTests(TestCase):
+    sid = "someone@example.com_compaction"
+
+    def setUp(self):
+        self.chain = _FakeSummaryChain()
+        patcher = mock.patch.object(chat_summary, "get_summary_chain", lambda: self.chain)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        _add_turns(self.sid, 10)
+
+    def test_duplicate_schedules_queue_once(self):
+        executor = mock.Mock()
+        with mock.patch.object(chat_summary, "_executor", executor):
+            self.assertTrue(chat_summary.schedule_compaction(self.sid))
+            self.assertFalse(chat_summary.schedule_compaction(self.sid))
+            self.assertEqual(executor.submit.call_count, 1)
+            # Once the queued run finishes the session can be scheduled again
+            run, session_id = executor.submit.call_args.args
+            run(session_id)
+            self.assertTrue(chat_summary.schedule_compaction(self.sid))
+        chat_summary._pending.discard(self.sid)
+        self.assertEqual(len(self.chain.inputs), 3)
+
+    def test_session_claimed_by_another_worker_is_skipped(self):
+        ChatSummary.objects.create(session_id=self.sid, compacting_until=timezone.now() + timedelta(minutes=5))
+        self.assertFalse(chat_summary.compact(self.sid))
+        self.assertEqual(self.chain.inputs, [])
+        self.assertEqual(ChatSummary.objects.get(session_id=self.sid).covered_through_id, 0)
+
+    def test_expired_claim_is_taken_over(self):
+        ChatSummary.objects.create(session_id=self.sid, compacting_until=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(chat_summary.compact(self.sid))
+        self.assertIsNone(ChatSummary.objects.get(session_id=self.sid).compacting_until)
+
+    def test_stops_when_another_worker_advanced_the_summary(self):
+        def other_worker(inputs):
+            # A worker whose claim outlived ours writes while this one waits on the LLM
+            ChatSummary.objects.filter(session_id=self.sid).update(summary="theirs", covered_through_id=10**9)
+
+        self.chain.on_invoke = other_worker
+        self.assertFalse(chat_summary.compact(self.sid))
+        self.assertEqual(len(self.chain.inputs), 1)
+        state = ChatSummary.objects.get(session_id=self.sid)
+        self.assertEqual((state.summary, state.covered_through_id), ("theirs", 10**9))
@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import ChatView, EmailView
+from .views import ChatStreamView, ChatView, EmailView
 
 urlpatterns = [
     path('chat/', ChatView.as_view(), name='chat'),
+    path('chat/stream/', ChatStreamView.as_view(), name='chat-stream'),
     path('set_email/', EmailView.as_view(), name='set_email'),
 ]
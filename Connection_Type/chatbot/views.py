@@ -2,16 +2,77 @@ from rest_framework import status
 from rest_framework.generics import CreateAPIView
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError, NotFound
+from rest_framework.settings import api_settings
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_community.chat_message_histories import ChatMessageHistory
-from langchain_core.messages import AIMessage, HumanMessage
 from .serializers import ChatRequestSerializer, ChatResponseSerializer, EmailSerializer
+from .history import append_turn, import_legacy, load_context
+from .renderers import EventStreamRenderer, sse_event
+from .sanitize import ResponseSanitizer, sanitize_response
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.contrib.sessions.models import Session
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from api.services import metrics
+from api.services.sessions import get_session_by_custom_id, lookup_session, register_session
+from llm_service.clients import get_chat_model
+import logging
+import threading
+import time
 import uuid
-import re
+
+# System prompt for the connection-building companion (built once per process)
+CHAT_PROMPT = ChatPromptTemplate.from_messages([
+    (
+        "system",
+        (
+            "You are Anchor AI, a focused companion for an intelligent connection-building platform. "
+            "Your role is to support intentional, healthy relationships, meaningful conversations, "
+            "community engagement, professional networking, and personal growth within this platform.\n\n"
+
+            "WHAT YOU HELP WITH:\n"
+            "- Clarifying values, goals, boundaries, and communication styles\n"
+            "- Guiding focused connection sessions and relationship check-ins\n"
+            "- Encouraging respectful community interaction\n"
+            "- Supporting career-related conversations and collaboration\n"
+            "- Promoting reflective or spiritual habits in an inclusive way\n\n"
+
+            "HOW YOU RESPOND:\n"
+            "- Be warm, calm, and respectful\n"
+            "- Use clear, structured, and actionable guidance\n"
+            "- Avoid judgment and avoid abstract advice\n"
+            "- Output must be plain text sentences with no markdown, no asterisks (*), no emojis, and no decorative symbols.\n\n"
+
+            "STRICT SCOPE RULE (MANDATORY):\n"
+            "- You are NOT a general-purpose assistant\n"
+            "- Do NOT provide external information, factual knowledge, news, definitions, "
+            "technical explanations, or unrelated advice\n\n"
+
+            "IF A REQUEST IS OUT OF SCOPE:\n"
+            "Respond ONLY with this message:\n"
+            "\"I am Anchor AI, a focused companion for an intelligent connection-building platform. I am here specifically to support connection-building, relationships, and personal or "
+            "professional growth within this platform. I am unable to help with that topic, but I can "
+            "support you with reflection, communication, or next steps within a connection if you’d like.\""
+        ),
+    ),
+    MessagesPlaceholder(variable_name="history"),
+    ("human", "{input}"),
+])
+
+_chat_chain = None
+_chat_chain_lock = threading.Lock()
+
+
+def get_chat_chain():
+    """Prompt | LLM chain shared by every request in this worker."""
+    global _chat_chain
+    if _chat_chain is None:
+        with _chat_chain_lock:
+            if _chat_chain is None:
+                # Set up LLM for connection-building (pooled client shared with llm_service.llm)
+                llm = get_chat_model("gemini-2.5-flash", settings.GEMINI_API_KEY, 0.7)
+                _chat_chain = CHAT_PROMPT | llm
+    return _chat_chain
+
 
 class EmailView(CreateAPIView):
     serializer_class = EmailSerializer
@@ -31,6 +92,9 @@ class EmailView(CreateAPIView):
         # Store email and our custom session ID
         request.session['user_email'] = email
         request.session['custom_session_id'] = session_id
+
+        # Index custom session ID -> session so lookups never scan the sessions table
+        register_session(session_id, request.session.session_key, email, request.session.get_expiry_date())
         
         return Response({
             "message": f"Email set successfully: {email}. You can now use the chatbot.",
@@ -39,17 +103,14 @@ class EmailView(CreateAPIView):
 
 class ChatView(CreateAPIView):
     serializer_class = ChatRequestSerializer
+    pipeline = "chat"
 
     def get_session_by_custom_id(self, session_id):
         """Find session by our custom session ID"""
-        sessions = Session.objects.all()
-        for session in sessions:
-            session_data = session.get_decoded()
-            if session_data.get('custom_session_id') == session_id:
-                return session, session_data
-        return None, None
+        return get_session_by_custom_id(session_id)
 
-    def create(self, request, *args, **kwargs):
+    def load_chat(self, request):
+        """Validate the request and load (user_message, session_id, budgeted history messages)."""
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
@@ -60,129 +121,146 @@ class ChatView(CreateAPIView):
             raise ValidationError("Session ID is required")
         
         # Find session by custom session ID
-        session_obj, session_data = self.get_session_by_custom_id(session_id)
+        record = lookup_session(session_id)
         
-        if not session_obj or not session_data:
+        if record is None:
             raise NotFound("Invalid session ID. Please set your email first via /set_email/")
         
-        if 'user_email' not in session_data:
+        if not record.user_email:
             raise NotFound("Invalid session. Please set your email first via /set_email/")
         
-        # Chat processing logic
-        chat_history_key = f'chat_history_{session_id}'
-        chat_history = ChatMessageHistory()
-        
-        # Load history
-        history_data = session_data.get(chat_history_key, [])
-        for item in history_data:
-            if item['type'] == 'human':
-                chat_history.add_user_message(item['content'])
-            elif item['type'] == 'ai':
-                chat_history.add_ai_message(item['content'])
-        
-        # Set up LLM for connection-building
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            google_api_key=settings.GEMINI_API_KEY,
-            temperature=0.7,
-        )
-        
-        # Update prompt to instruct the AI to act as a connection-building companion
-        prompt = ChatPromptTemplate.from_messages([
-    (
-        "system",
-        (
-            "You are Anchor AI, a focused companion for an intelligent connection-building platform. "
-            "Your role is to support intentional, healthy relationships, meaningful conversations, "
-            "community engagement, professional networking, and personal growth within this platform.\n\n"
+        # Rolling summary plus the most recent turns that fit the token budget
+        with metrics.stage(self.pipeline, "load_history"):
+            history = load_context(session_id)
+            if not history:
+                # Sessions from before the chat table still carry their history in the session blob
+                session_obj, session_data = self.get_session_by_custom_id(session_id)
+                if session_obj and import_legacy(session_id, session_obj, session_data):
+                    history = load_context(session_id)
 
-            "WHAT YOU HELP WITH:\n"
-            "- Clarifying values, goals, boundaries, and communication styles\n"
-            "- Guiding focused connection sessions and relationship check-ins\n"
-            "- Encouraging respectful community interaction\n"
-            "- Supporting career-related conversations and collaboration\n"
-            "- Promoting reflective or spiritual habits in an inclusive way\n\n"
+        return user_message, session_id, history
 
-            "HOW YOU RESPOND:\n"
-            "- Be warm, calm, and respectful\n"
-            "- Use clear, structured, and actionable guidance\n"
-            "- Avoid judgment and avoid abstract advice\n"
-            "- Output must be plain text sentences with no markdown, no asterisks (*), no emojis, and no decorative symbols.\n\n"
+    def build_chain(self):
+        return get_chat_chain()
 
-            "STRICT SCOPE RULE (MANDATORY):\n"
-            "- You are NOT a general-purpose assistant\n"
-            "- Do NOT provide external information, factual knowledge, news, definitions, "
-            "technical explanations, or unrelated advice\n\n"
-
-            "IF A REQUEST IS OUT OF SCOPE:\n"
-            "Respond ONLY with this message:\n"
-            "\"I am Anchor AI, a focused companion for an intelligent connection-building platform. I am here specifically to support connection-building, relationships, and personal or "
-            "professional growth within this platform. I am unable to help with that topic, but I can "
-            "support you with reflection, communication, or next steps within a connection if you’d like.\""
-        ),
-    ),
-    MessagesPlaceholder(variable_name="history"),
-    ("human", "{input}"),
-])
-        
-        chain = prompt | llm
+    def create(self, request, *args, **kwargs):
+        user_message, session_id, history = self.load_chat(request)
         
-        runnable_with_history = RunnableWithMessageHistory(
-            chain,
-            lambda session_id: chat_history,
-            input_messages_key="input",
-            history_messages_key="history",
-        )
+        chain = self.build_chain()
         
-        config = {"configurable": {"session_id": session_id}}
-        response = runnable_with_history.invoke({"input": user_message}, config=config)
+        with metrics.stage(self.pipeline, "llm"):
+            response = chain.invoke({"input": user_message, "history": history})
         ai_response = response.content
 
+        # Append just this turn to the chat table
+        with metrics.stage(self.pipeline, "persist"):
+            append_turn(session_id, user_message, ai_response)
+
         # Sanitize response: remove asterisks, backticks, bullets, emojis/symbols; collapse whitespace
-        def _sanitize_response(text: str) -> str:
-            if not isinstance(text, str):
-                return text
-            # Remove specific markup characters
-            text = text.replace("*", "").replace("`", "").replace("•", "")
-            # Remove common emoji/symbol ranges
-            emoji_pattern = re.compile(
-                "[" 
-                u"\U0001F600-\U0001F64F"  # emoticons
-                u"\U0001F300-\U0001F5FF"  # symbols & pictographs
-                u"\U0001F680-\U0001F6FF"  # transport & map symbols
-                u"\U0001F700-\U0001F77F"  # alchemical symbols
-                u"\U0001F780-\U0001F7FF"  # geometric shapes extended
-                u"\U0001F800-\U0001F8FF"  # supplemental arrows-c
-                u"\U0001F900-\U0001F9FF"  # supplemental symbols and pictographs
-                u"\U0001FA00-\U0001FA6F"  # chess symbols
-                u"\U0001FA70-\U0001FAFF"  # symbols & pictographs extended-a
-                u"\U00002700-\U000027BF"  # dingbats
-                u"\U00002600-\U000026FF"  # misc symbols
-                u"\U00002B00-\U00002BFF"  # arrows & misc
-                u"\U0000FE00-\U0000FE0F"  # variation selectors
-                u"\U000024C2-\U0001F251"  # enclosed characters
-                "]",
-                flags=re.UNICODE,
-            )
-            text = emoji_pattern.sub("", text)
-            # Collapse whitespace to single spaces
-            text = re.sub(r"\s+", " ", text).strip()
-            return text
-
-        ai_response = _sanitize_response(ai_response)
-        
-        # Save updated history
-        history_data = []
-        for msg in chat_history.messages:
-            if isinstance(msg, HumanMessage):
-                history_data.append({'type': 'human', 'content': msg.content})
-            elif isinstance(msg, AIMessage):
-                history_data.append({'type': 'ai', 'content': msg.content})
-        
-        # Update session
-        session_data[chat_history_key] = history_data
-        session_obj.session_data = Session.objects.encode(session_data)
-        session_obj.save()
+        with metrics.stage(self.pipeline, "sanitize"):
+            ai_response = sanitize_response(ai_response)
         
         response_serializer = ChatResponseSerializer({'response': ai_response})
         return Response(response_serializer.data, status=status.HTTP_200_OK)
+
+
+def _chunk_text(chunk) -> str:
+    content = getattr(chunk, "content", "")
+    if isinstance(content, str):
+        return content
+    # Some providers stream content blocks instead of plain strings
+    return "".join(
+        part if isinstance(part, str) else part.get("text", "")
+        for part in content or []
+        if isinstance(part, (str, dict))
+    )
+
+
+class _ChatStream:
+    """Server-sent events for one streamed chat reply.
+
+    ``events`` iterates the chain synchronously for WSGI; ``aevents`` uses the
+    chain's ``astream`` so ASGI servers flush each chunk instead of buffering
+    a sync iterator until it is exhausted.
+    """
+
+    def __init__(self, pipeline, chain, session_id, user_message, history):
+        self.pipeline = pipeline
+        self.chain = chain
+        self.session_id = session_id
+        self.user_message = user_message
+        self.history = history
+        self.sanitizer = ResponseSanitizer()
+        self.raw_parts = []
+        self.clean_parts = []
+        self.started = None
+
+    def _inputs(self):
+        self.started = time.perf_counter()
+        return {"input": self.user_message, "history": self.history}
+
+    def _token(self, chunk):
+        """The event for one model chunk, or None when nothing visible is left after sanitizing."""
+        if not self.raw_parts:
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - self.started, pipeline=self.pipeline, stage="llm_first_token")
+        text = _chunk_text(chunk)
+        self.raw_parts.append(text)
+        clean = self.sanitizer.feed(text)
+        if not clean:
+            return None
+        self.clean_parts.append(clean)
+        return sse_event({"token": clean})
+
+    def _failed(self):
+        logging.getLogger("chatbot").exception("chat stream failed session_id=%s", self.session_id)
+        return sse_event({"detail": "The assistant is unavailable right now. Please try again."}, event="error")
+
+    def _finish(self):
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - self.started, pipeline=self.pipeline, stage="llm")
+        with metrics.stage(self.pipeline, "persist"):
+            append_turn(self.session_id, self.user_message, "".join(self.raw_parts))
+        return sse_event({"response": "".join(self.clean_parts)}, event="done")
+
+    def events(self):
+        try:
+            for chunk in self.chain.stream(self._inputs()):
+                event = self._token(chunk)
+                if event:
+                    yield event
+        except Exception:
+            yield self._failed()
+            return
+        yield self._finish()
+
+    async def aevents(self):
+        try:
+            async for chunk in self.chain.astream(self._inputs()):
+                event = self._token(chunk)
+                if event:
+                    yield event
+        except Exception:
+            yield self._failed()
+            return
+        yield await sync_to_async(self._finish)()
+
+
+class ChatStreamView(ChatView):
+    """Same as ChatView but streams the reply as server-sent events.
+
+    Each sanitized chunk is sent as ``data: {"token": ...}``; a final
+    ``event: done`` carries the full response. History is saved once the
+    stream completes.
+    """
+    pipeline = "chat_stream"
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer]
+
+    def create(self, request, *args, **kwargs):
+        user_message, session_id, history = self.load_chat(request)
+        stream = _ChatStream(self.pipeline, self.build_chain(), session_id, user_message, history)
+        # An async iterator under ASGI; Django would buffer a sync one there
+        events = stream.aevents() if isinstance(request._request, ASGIRequest) else stream.events()
+
+        response = StreamingHttpResponse(events, content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
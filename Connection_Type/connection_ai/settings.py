@@ -31,6 +31,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    # No-op unless QUERY_PROFILE_ENABLED
+    "api.middleware.QueryProfileMiddleware",
+    # No-op unless PROFILE_SAMPLE_RATE or PROFILE_HEADER_TOKEN is set
+    "api.middleware.RequestProfileMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -104,6 +108,50 @@ REST_FRAMEWORK = {
 # Used by chatbot ChatView for Gemini
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 
+# Per-request DB profiling (api.middleware.QueryProfileMiddleware): requests above either
+# threshold are logged with their slowest statements and get X-DB-* response headers
+QUERY_PROFILE_ENABLED = os.getenv("QUERY_PROFILE_ENABLED", "False").lower() in ("1", "true", "yes")
+QUERY_PROFILE_MAX_QUERIES = int(os.getenv("QUERY_PROFILE_MAX_QUERIES", "50"))
+QUERY_PROFILE_MAX_DB_MS = float(os.getenv("QUERY_PROFILE_MAX_DB_MS", "500"))
+QUERY_PROFILE_TOP_N = int(os.getenv("QUERY_PROFILE_TOP_N", "3"))
+
+# cProfile capture (api.middleware.RequestProfileMiddleware): a random fraction of requests
+# and/or requests sending "X-Profile: <PROFILE_HEADER_TOKEN>"; the newest PROFILE_KEEP dumps
+# are kept in PROFILE_DIR and read with `manage.py request_profiles`
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_HEADER_TOKEN = os.getenv("PROFILE_HEADER_TOKEN", "")
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", str(BASE_DIR / "profiles")))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+
+# Bearer token required by /metrics/ (the endpoint answers 403 while this is empty)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# session_id -> session lookup cache (per process); entries also drop when the session expires
+SESSION_LOOKUP_CACHE_TTL = int(os.getenv("SESSION_LOOKUP_CACHE_TTL", "60"))
+SESSION_LOOKUP_CACHE_SIZE = int(os.getenv("SESSION_LOOKUP_CACHE_SIZE", "1024"))
+
+# Pair inference single-flight: how long duplicates wait for the running computation,
+# and the lease after which a lock left by a crashed worker is taken over
+PAIR_LOCK_WAIT_SECONDS = float(os.getenv("PAIR_LOCK_WAIT_SECONDS", "30"))
+PAIR_LOCK_LEASE_SECONDS = float(os.getenv("PAIR_LOCK_LEASE_SECONDS", "120"))
+# When true, low-margin pairs get the heuristic result at once (marked provisional) and the
+# LLM refinement runs in `manage.py process_llm_jobs` instead of inside the request
+PAIR_LLM_ASYNC = os.getenv("PAIR_LLM_ASYNC", "False").lower() in ("1", "true", "yes")
+
+# In-memory similarity index (api.services.similarity): incremental refresh throttle and full
+# reload interval (the reload also drops deleted summaries)
+SIMILARITY_INDEX_REFRESH_SECONDS = float(os.getenv("SIMILARITY_INDEX_REFRESH_SECONDS", "5"))
+SIMILARITY_INDEX_RELOAD_SECONDS = float(os.getenv("SIMILARITY_INDEX_RELOAD_SECONDS", "3600"))
+
+# Chatbot: number of most recent stored messages sent with each turn
+CHAT_HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "100"))
+# Approximate token budget for history per turn; older turns are folded into a rolling summary
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "3000"))
+# Most stored messages a background compaction reads per query
+CHAT_COMPACTION_BATCH = int(os.getenv("CHAT_COMPACTION_BATCH", "200"))
+# How long one worker's claim on a session's compaction lasts before another may take over
+CHAT_COMPACTION_LEASE_SECONDS = int(os.getenv("CHAT_COMPACTION_LEASE_SECONDS", "300"))
+
 # Logging: basic structured logs suitable for production
 LOGGING = {
     "version": 1,
@@ -0,0 +1,101 @@
+import hashlib
+import logging
+import os
+import random
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Optional
+
+# Two tiers: a bounded in-process LRU in front of a shared DB table with TTL.
+LRU_SIZE = int(os.getenv("LLM_CACHE_LRU_SIZE", "512"))
+TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+DB_MAX_ENTRIES = int(os.getenv("LLM_CACHE_DB_MAX_ENTRIES", "100000"))
+# Fraction of DB writes that also purge expired rows and trim to DB_MAX_ENTRIES
+DB_CULL_PROBABILITY = float(os.getenv("LLM_CACHE_DB_CULL_PROBABILITY", "0.01"))
+
+_lru: "OrderedDict[str, tuple]" = OrderedDict()
+_lock = threading.Lock()
+_log = logging.getLogger("api")
+
+
+def normalize_conversation(messages: list) -> str:
+    """Canonical text for hashing: one "sender: text" line per message, whitespace collapsed."""
+    return "\n".join(
+        f"{m.get('sender', '')}: {' '.join(str(m.get('text', '')).split())}" for m in messages
+    )
+
+
+def make_key(messages: list, model: str, prompt_version: str) -> str:
+    payload = "\x1f".join((model, prompt_version, normalize_conversation(messages)))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _now():
+    from django.utils import timezone
+    return timezone.now()
+
+
+def lookup(key: str) -> Optional[dict]:
+    """Return cached features for ``key`` (LRU first, then DB) or None."""
+    now = _now()
+    with _lock:
+        entry = _lru.get(key)
+        if entry is not None:
+            features, expires_at = entry
+            if expires_at > now:
+                _lru.move_to_end(key)
+                return dict(features)
+            del _lru[key]
+
+    try:
+        from api.models import LLMFeatureCache
+        row = LLMFeatureCache.objects.filter(key=key, expires_at__gt=now).values("features", "expires_at").first()
+    except Exception:
+        # DB tier is best-effort (no app registry, missing table, DB down)
+        _log.debug("llm-cache db read failed", exc_info=True)
+        return None
+    if not row:
+        return None
+    _remember(key, row["features"], row["expires_at"])
+    return dict(row["features"])
+
+
+def store(key: str, features: dict) -> None:
+    """Store features in both tiers; occasionally purge expired/oldest DB rows."""
+    expires_at = _now() + timedelta(seconds=TTL_SECONDS)
+    _remember(key, features, expires_at)
+    try:
+        from api.models import LLMFeatureCache
+        # One INSERT ... ON CONFLICT instead of update_or_create's read, savepoint and write
+        LLMFeatureCache.objects.bulk_create(
+            [LLMFeatureCache(key=key, features=features, expires_at=expires_at)],
+            update_conflicts=True, unique_fields=["key"], update_fields=["features", "expires_at"],
+        )
+        if random.random() < DB_CULL_PROBABILITY:
+            _cull(LLMFeatureCache)
+    except Exception:
+        _log.debug("llm-cache db write failed", exc_info=True)
+
+
+def clear_local() -> None:
+    with _lock:
+        _lru.clear()
+
+
+def _remember(key: str, features: dict, expires_at) -> None:
+    if LRU_SIZE <= 0:
+        return
+    with _lock:
+        _lru[key] = (dict(features), expires_at)
+        _lru.move_to_end(key)
+        while len(_lru) > LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+def _cull(model) -> None:
+    model.objects.filter(expires_at__lte=_now()).delete()
+    excess = model.objects.count() - DB_MAX_ENTRIES
+    if excess > 0:
+        oldest = model.objects.order_by("expires_at").values_list("pk", flat=True)[:excess]
+        model.objects.filter(pk__in=list(oldest)).delete()
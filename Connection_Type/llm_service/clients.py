@@ -0,0 +1,41 @@
+"""Process-wide Gemini chat models, each on one pooled, keep-alive HTTP client."""
+import os
+import threading
+from typing import Dict, Tuple
+import httpx
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+# Connection pool settings for each model's HTTP client
+HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+
+_lock = threading.Lock()
+_chat_models: Dict[Tuple[str, str, float], ChatGoogleGenerativeAI] = {}
+
+
+def _client_args() -> dict:
+    # Passed through HttpOptions.client_args to the SDK's httpx clients
+    return {
+        "limits": httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+    }
+
+
+def get_chat_model(model: str, api_key: str, temperature: float) -> ChatGoogleGenerativeAI:
+    """Cached ChatGoogleGenerativeAI per (model, key, temperature), reused for the life of the worker.
+
+    Raises the same errors as constructing ChatGoogleGenerativeAI (e.g. a missing key).
+    """
+    key = (model, api_key, temperature)
+    llm = _chat_models.get(key)
+    if llm is not None:
+        return llm
+    llm = ChatGoogleGenerativeAI(
+        model=model, google_api_key=api_key, temperature=temperature, client_args=_client_args(),
+    )
+    with _lock:
+        return _chat_models.setdefault(key, llm)
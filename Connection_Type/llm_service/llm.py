@@ -4,6 +4,9 @@ from typing import Optional
 from dotenv import load_dotenv
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
+from . import cache as feature_cache
+from . import resilience
+from .clients import get_chat_model
 
 load_dotenv()
 
@@ -11,11 +14,10 @@ _api_key = os.getenv("GEMINI_API_KEY")
 _model = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 llm: Optional[ChatGoogleGenerativeAI] = None
 if _api_key:
-    llm = ChatGoogleGenerativeAI(
-        model=_model,
-        google_api_key=_api_key,
-        temperature=0.0
-    )
+    llm = get_chat_model(_model, _api_key, 0.0)
+
+# Bump whenever PROMPT changes so cached features from the old prompt are not reused
+PROMPT_VERSION = "1"
 
 PROMPT = ChatPromptTemplate.from_messages([
     ("system", (
@@ -31,6 +33,10 @@ PROMPT = ChatPromptTemplate.from_messages([
     )),
 ])
 
+# Built once per process instead of on every call
+_chain = PROMPT | llm if llm is not None else None
+
+
 def extract_features(messages: list) -> dict:
     conversation_text = "\n".join(
         f"{m['sender']}: {m['text']}" for m in messages
@@ -40,25 +46,48 @@ def extract_features(messages: list) -> dict:
     if llm is None:
         return {}
 
-    chain = PROMPT | llm
-    # Basic retry with small attempt count to avoid transient failures
-    attempt = 0
-    response_text = None
-    while attempt < 2 and response_text is None:
-        try:
-            response = chain.invoke({"conversation": conversation_text})
-            response_text = response.content
-        except Exception:
-            attempt += 1
-            response_text = None
-            continue
-
-    # Parse STRICT JSON from the LLM safely
+    # Identical conversations (same model + prompt) are served from the feature cache
+    cache_key = feature_cache.make_key(messages, _model, PROMPT_VERSION)
+    cached = feature_cache.lookup(cache_key)
+    if cached is not None:
+        return cached
+
+    chain = _chain
+
+    def _invoke() -> str:
+        return chain.invoke({"conversation": conversation_text}).content
+
+    def _store_late(text: str) -> None:
+        # The call missed the budget and the caller used heuristics; cache its answer for the next request
+        data, cacheable = _parse(text)
+        if cacheable:
+            feature_cache.store(cache_key, _with_defaults(data))
+        from django.db import close_old_connections
+        close_old_connections()
+
+    # Deadline + circuit breaker; None means "use the heuristic path"
+    response_text = resilience.call_with_budget(_invoke, on_late=_store_late)
+    data, cacheable = _parse(response_text)
+    data = _with_defaults(data)
+
+    if cacheable:
+        feature_cache.store(cache_key, data)
+    return data
+
+
+def _parse(response_text) -> tuple:
+    """(features dict, cacheable) from STRICT JSON; failures give ({}, False)."""
     try:
         data = json.loads(response_text) if response_text else {}
     except json.JSONDecodeError:
         data = {}
+    # Only cache real answers; failures and malformed output should be retried next time
+    if not isinstance(data, dict):
+        return {}, False
+    return data, bool(data)
+
 
+def _with_defaults(data: dict) -> dict:
     # Ensure required keys exist with defaults
     required_keys = [
         "emotional_warmth",
@@ -70,5 +99,4 @@ def extract_features(messages: list) -> dict:
     ]
     for key in required_keys:
         data.setdefault(key, 0.0)
-
-    return data
\ No newline at end of file
+    return data
@@ -0,0 +1,175 @@
+"""Deadline, circuit breaker and counters for LLM calls made on the request path."""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Optional
+
+# Hard per-call budget (all attempts together) before callers fall back to heuristics
+TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "10"))
+# Successful calls slower than this still count against the breaker
+SLOW_CALL_SECONDS = float(os.getenv("LLM_SLOW_CALL_SECONDS", "5"))
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+# Calls allowed in flight at once (including late ones still finishing after a budget miss);
+# a call that finds every slot taken falls back at once and does not count against the breaker
+MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+# Heuristic hedging: the heuristic answer is never raced against the LLM in a second thread.
+# Pair inference computes it before deciding to call the LLM (the confidence gate needs it) and
+# profile analysis computes it in milliseconds once the call returns None, so a budget miss
+# already answers from heuristics without waiting. What remains configurable is the late call:
+# it keeps running and its answer is handed to ``on_late`` (the feature cache) for the next
+# request. LLM_HEDGE is still read as an alias for deployments that set it.
+KEEP_LATE_RESULTS = os.getenv("LLM_KEEP_LATE_RESULTS", os.getenv("LLM_HEDGE", "1")).lower() in ("1", "true", "yes")
+
+_log = logging.getLogger("api")
+
+_counters: Dict[str, int] = {
+    "llm_calls": 0,
+    "llm_failures": 0,
+    "llm_slow_calls": 0,
+    "llm_budget_misses": 0,
+    "llm_short_circuits": 0,
+    "llm_saturated": 0,
+    "llm_late_results": 0,
+    "llm_breaker_opened": 0,
+}
+_counters_lock = threading.Lock()
+
+
+def incr(name: str, value: int = 1) -> None:
+    with _counters_lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open (one probe) -> closed."""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_after: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_after = reset_after
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_after:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def release(self) -> None:
+        """Give back a half-open probe that never reached the LLM (no verdict either way)."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            if self.state != self.CLOSED:
+                _log.info("llm breaker closed")
+            self.state = self.CLOSED
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self._failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                _log.warning("llm breaker opened after %s consecutive failures", self._failures)
+                incr("llm_breaker_opened")
+
+
+breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET_SECONDS)
+
+_executor = ThreadPoolExecutor(max_workers=max(1, MAX_IN_FLIGHT), thread_name_prefix="llm")
+_slots = threading.BoundedSemaphore(max(1, MAX_IN_FLIGHT))
+
+
+def snapshot() -> Dict[str, object]:
+    """Current counters plus breaker state (for logs and the metrics endpoint)."""
+    with _counters_lock:
+        data: Dict[str, object] = dict(_counters)
+    data["llm_breaker_state"] = breaker.state
+    return data
+
+
+def call_with_budget(fn: Callable[[], str], on_late: Optional[Callable[[str], None]] = None,
+                     timeout: Optional[float] = None, attempts: int = 2) -> Optional[str]:
+    """Run ``fn`` (returns the response text) within a deadline shared by all attempts.
+
+    Returns None, and the caller keeps the heuristic result it already has, when
+    the breaker is open, every slot is taken, the budget runs out or every
+    attempt fails. Only LLM failures, budget misses and slow calls count against
+    the breaker; running out of local slots does not. After a budget miss the
+    call is not cancelled: with KEEP_LATE_RESULTS, ``on_late`` receives its
+    text when it finishes.
+    """
+    if not breaker.allow():
+        incr("llm_short_circuits")
+        return None
+
+    deadline = time.monotonic() + (TIMEOUT_SECONDS if timeout is None else timeout)
+    failed = False
+    for attempt in range(attempts):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if not _slots.acquire(blocking=False):
+            # Local overload says nothing about the LLM's health
+            incr("llm_saturated")
+            if failed:
+                break
+            breaker.release()
+            return None
+        incr("llm_calls")
+        started = time.monotonic()
+        future: Future = _executor.submit(fn)
+        future.add_done_callback(lambda _f: _slots.release())
+        try:
+            text = future.result(timeout=remaining)
+        except FutureTimeout:
+            incr("llm_budget_misses")
+            _log.warning("llm budget miss after %.2fs", time.monotonic() - started)
+            if KEEP_LATE_RESULTS and on_late is not None:
+                future.add_done_callback(lambda f: _deliver_late(f, on_late))
+            break
+        except Exception:
+            failed = True
+            incr("llm_failures")
+            # Short exponential backoff, never past the deadline
+            time.sleep(max(0.0, min(0.2 * (2 ** attempt), deadline - time.monotonic())))
+            continue
+        if time.monotonic() - started > SLOW_CALL_SECONDS:
+            incr("llm_slow_calls")
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return text
+
+    breaker.record_failure()
+    return None
+
+
+def _deliver_late(future: Future, on_late: Callable[[str], None]) -> None:
+    if future.cancelled() or future.exception() is not None:
+        return
+    incr("llm_late_results")
+    try:
+        on_late(future.result())
+    except Exception:
+        _log.debug("late llm result handler failed", exc_info=True)